@@ -0,0 +1,229 @@
+import argparse
+import json
+import logging as log
+import os
+import platform
+import random as rand
+import tempfile
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import combinations
+from time import perf_counter
+
+import numpy as np
+from gensim.models import KeyedVectors
+
+import metrics
+import word_models
+from field_operative import FieldOperative
+from legality import LegalityChecker
+from spymaster import SpyMaster
+
+"""
+Times the hint pipeline on a small synthetic word model, so it runs anywhere without the real models, e.g.
+    python benchmark.py --save              records benchmark-baseline.json
+    python benchmark.py --threshold 0.2     flags any stage whose median is more than 20% slower than the baseline
+ConceptNet is answered by a local stand in server, WordNet needs nltk's wordnet data (the stage is skipped without it)
+"""
+
+MODEL_NAME = "benchmark-synthetic"
+
+
+def synthetic_model(words_file="settings/game_words.txt", vocab_size=50000, vector_size=100, seed=0):
+    # random vectors over the game words plus made up filler words, game words get near neighbours among the filler
+    # so hints have something to find
+    rng = np.random.RandomState(seed)
+    game_words = [w.replace(" ", "_").strip() for w in open(words_file, "r").readlines() if w.strip() != ""]
+    syllables = ["ba", "ce", "di", "fo", "gu", "ha", "ke", "li", "mo", "nu", "pa", "re", "si", "to", "vu", "wa", "ze",
+                 "an", "er", "in", "on", "ul", "ly", "ter", "ing", "ous", "ment", "al", "ic", "ness"]
+    filler = set()
+    while len(filler) < vocab_size - len(game_words):
+        word = "".join(rng.choice(syllables, rng.randint(2, 5)))
+        if word not in game_words:
+            filler.add(word)
+    words = game_words + sorted(filler)
+
+    vectors = rng.standard_normal((len(words), vector_size)).astype(np.float32)
+    for i in range(len(game_words)):
+        neighbours = rng.randint(len(game_words), len(words), 20)
+        vectors[neighbours] = vectors[i] + 0.5 * vectors[neighbours]
+    word_model = KeyedVectors(vector_size)
+    word_model.add(words, vectors)
+    return word_model
+
+
+class _ConceptNetStandIn(BaseHTTPRequestHandler):
+    # answers /relatedness with a made up but stable score
+    def do_GET(self):
+        body = json.dumps({"value": (zlib.crc32(self.path.encode("utf-8")) % 1000) / 1000}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(stage, repeat, setup=None):
+    # seconds taken by each of repeat calls of stage(setup()), setup isn't timed
+    times = []
+    for i in range(repeat):
+        arg = setup(i) if setup is not None else None
+        start = perf_counter()
+        stage(arg)
+        times.append(perf_counter() - start)
+    return times
+
+
+def summary(times, **extra):
+    result = {"median": float(np.median(times)), "min": float(np.min(times)), "p90": float(np.percentile(times, 90)),
+              "runs": len(times)}
+    result.update(extra)
+    return result
+
+
+def write_settings(path, settings):
+    with open(path, "w") as sett_file:
+        for name, (kind, value) in settings.items():
+            sett_file.write("{0}:{1}:{2}\n".format(name, kind, value))
+
+
+def run_benchmarks(vocab_size=50000, vector_size=100, repeat=5, legal_words=2000, seed=0):
+    rand.seed(seed)
+    work_dir = tempfile.mkdtemp(prefix="benchmark-")
+    spymaster_settings = os.path.join(work_dir, "spymaster_setts.txt")
+    eval_settings = os.path.join(work_dir, "field_operative_setts.txt")
+    write_settings(spymaster_settings, {"max_top_hints": ("int", 5), "max_levels": ("int", 3),
+                                        "level_1_limit": ("int", 9), "level_2_limit": ("int", 36),
+                                        "level_3_limit": ("int", 84), "nn_backend": ("str", "exact"),
+                                        "model_name": ("str", MODEL_NAME), "vocab_limit": ("int", 0),
+                                        "legal_candidates_only": ("bool", "false")})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ConceptNetStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    write_settings(eval_settings, {"use_eval_cache": ("bool", "false"), "conceptnet_source": ("str", "api"),
+                                   "conceptnet_url": ("str", "http://127.0.0.1:{0}".format(server.server_port)),
+                                   "conceptnet_requests_per_hour": ("int", 0), "wordnet_source": ("str", "nltk")})
+
+    stages = dict()
+    metrics.reset()
+    start = perf_counter()
+    word_model = synthetic_model(vocab_size=vocab_size, vector_size=vector_size, seed=seed)
+    word_models.register_word_model(MODEL_NAME, word_model)
+    log.info("Built synthetic model of {0} words in {1:.1f}s".format(vocab_size, perf_counter() - start))
+
+    spymaster = dict()
+
+    def build_spymaster(_):
+        spymaster["sm"] = SpyMaster(settings_file=spymaster_settings)
+    stages["spymaster_init"] = summary(timed(build_spymaster, repeat))
+    sm = spymaster["sm"]
+
+    rng = rand.Random(seed)
+    board = rng.sample(sm.game_words, 25)
+    teams = {"ts": board[:9], "os": board[9:17], "bs": board[17:24], "ks": board[24:]}
+    sm.start_game(board)
+    sm.run_defined_round(**teams)  # warm up, also sets the spymaster's team words
+
+    for level in range(1, 4):
+        targets = list(combinations(sm.team_words["t"], level))
+        stages["get_hints_level_{0}".format(level)] = summary(
+            timed(lambda _: sm._SpyMaster__get_hints(targets), repeat), targets=len(targets))
+
+    # a fresh checker and unseen words each time, so nothing is answered from its caches
+    candidates = [word for word in word_model.index2word if word not in board]
+    rng.shuffle(candidates)
+
+    def fresh_words(i):
+        sm.legality = LegalityChecker(sm.legality.spacy_nlp, sm.legality.stemmer).load()
+        return candidates[i * legal_words:(i + 1) * legal_words]
+    times = timed(lambda words: sm._SpyMaster__check_legal(words), repeat, setup=fresh_words)
+    stages["check_legal"] = summary(times, words=legal_words, words_per_second=legal_words / float(np.median(times)))
+
+    stages["run_defined_round"] = summary(timed(lambda _: sm.run_defined_round(**teams), repeat))
+
+    operative = FieldOperative(settings_file=spymaster_settings, eval_settings_file=eval_settings)
+    hints = [word for word in sm.game_words if word not in board]
+    try:
+        stages["evaluate_hint"] = summary(timed(lambda hint: operative.evaluate_hint(hint, board), repeat,
+                                                setup=lambda i: hints[i]))
+    except LookupError as e:  # no wordnet data
+        log.warning("Skipping evaluate_hint: {0}".format(e))
+        stages["evaluate_hint"] = {"skipped": "no wordnet data"}
+    finally:
+        operative.close()
+
+    server.shutdown()
+    word_models.clear()
+    return {"meta": {"vocab_size": vocab_size, "vector_size": vector_size, "repeat": repeat, "seed": seed,
+                     "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+            "stages": stages,
+            "metrics": metrics.snapshot()}  # where the time inside each stage went
+
+
+def compare(results, baseline, threshold):
+    # stages whose median is more than threshold (a fraction) slower than the baseline's
+    regressions = []
+    print("{0:22}{1:>14}{2:>14}{3:>10}".format("Stage", "Median (ms)", "Baseline (ms)", "Change"))
+    for stage, result in results["stages"].items():
+        if "median" not in result:
+            print("{0:22}{1:>14}".format(stage, "skipped"))
+            continue
+        base = baseline["stages"].get(stage, {}).get("median", None) if baseline is not None else None
+        if base is None:
+            print("{0:22}{1:>14.2f}{2:>14}".format(stage, result["median"] * 1000, "-"))
+            continue
+        change = result["median"] / base - 1
+        flag = change > threshold
+        if flag:
+            regressions.append(stage)
+        print("{0:22}{1:>14.2f}{2:>14.2f}{3:>+9.0%}{4}".format(stage, result["median"] * 1000, base * 1000, change,
+                                                               "  REGRESSION" if flag else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hint pipeline on a synthetic word model")
+    parser.add_argument("--vocab", type=int, default=50000, help="words in the synthetic model")
+    parser.add_argument("--dim", type=int, default=100, help="vector size of the synthetic model")
+    parser.add_argument("--repeat", type=int, default=5, help="times each stage is run")
+    parser.add_argument("--legal-words", type=int, default=2000, help="hints legality checked per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default="benchmark-baseline.json", help="results to compare against")
+    parser.add_argument("--save", action="store_true", help="save these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction slower than the baseline a stage's median can be before it's flagged")
+    parser.add_argument("--out", default=None, help="also write these results here")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/benchmark-log.txt", level=log.INFO)
+
+    results = run_benchmarks(vocab_size=args.vocab, vector_size=args.dim, repeat=args.repeat,
+                             legal_words=args.legal_words, seed=args.seed)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as base_file:
+            baseline = json.load(base_file)
+        if baseline["meta"]["vocab_size"] != args.vocab or baseline["meta"]["vector_size"] != args.dim:
+            print("Baseline was run with a different model size, not comparing")
+            baseline = None
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.out is not None:
+        with open(args.out, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+    if args.save:
+        with open(args.baseline, "w") as base_file:
+            json.dump(results, base_file, indent=2)
+        print("Saved baseline to {0}".format(args.baseline))
+    if len(regressions):
+        print("Regressed: {0}".format(", ".join(regressions)))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
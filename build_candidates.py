@@ -0,0 +1,68 @@
+import argparse
+import logging as log
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import numpy as np
+from gensim.models import KeyedVectors
+
+import word_models
+from legality import LegalityChecker
+
+"""
+Works out which words of each word model could ever be given as a hint, e.g.
+    python build_candidates.py models/glove-wiki-100.bin models/word2vec-gnews-300.bin
+Words that fail the legality checks that don't depend on the board (dictionary and alphabetic checks) are never worth
+searching, the vocab indices of the rest are saved next to each model and the spymaster only searches those
+"""
+
+
+def build_candidates(model_file, out_dir=None, lang="en_US"):
+    model_name = os.path.splitext(os.path.basename(model_file))[0]
+    out_dir = out_dir if out_dir is not None else os.path.dirname(os.path.abspath(model_file))
+    candidates_path = os.path.join(out_dir, word_models.candidates_file(model_name))
+
+    log.info("Loading {0}".format(model_file))
+    word_model = KeyedVectors.load(model_file, mmap="r")  # only the vocab is needed
+
+    log.info("Checking {0} words of {1}".format(len(word_model.index2word), model_name))
+    start = perf_counter()
+    checker = LegalityChecker(None, None, lang=lang)
+    indices = np.array([index for index, word in enumerate(word_model.index2word)
+                        if len(word) > 0 and checker.board_independent_legal(word, remember=False)], dtype=np.int64)
+    check_time = perf_counter() - start
+
+    np.savez(candidates_path, indices=indices, vocab_hash=word_models.vocab_hash(word_model))
+    log.info("Saved {0} of {1} words as candidates to {2}".format(len(indices), len(word_model.index2word),
+                                                                  candidates_path))
+    return model_name, len(indices), len(word_model.index2word), check_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the legal hint candidates for the spymaster word models")
+    parser.add_argument("models", nargs="+", help="paths of saved KeyedVectors models")
+    parser.add_argument("--out-dir", default=None, help="where to write candidates, defaults to next to each model")
+    parser.add_argument("--lang", default="en_US", help="enchant dictionary hints must be in")
+    parser.add_argument("--workers", type=int, default=None, help="models checked at once, defaults to one per cpu")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(process)d : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/build-log.txt", level=log.INFO)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(build_candidates, model, args.out_dir, args.lang): model for model in args.models}
+        print("{0:25}{1:>12}{2:>12}{3:>10}{4:>12}".format("Model", "Candidates", "Vocab", "Kept", "Time (s)"))
+        for future in as_completed(futures):
+            try:
+                model_name, kept, total, check_time = future.result()
+            except Exception as e:
+                log.exception("Failed building candidates for {0}".format(futures[future]))
+                print("{0:25} failed: {1}".format(futures[future], e))
+                continue
+            print("{0:25}{1:>12}{2:>12}{3:>10.1%}{4:>12.1f}".format(model_name, kept, total, kept / total,
+                                                                    check_time))
+
+
+if __name__ == "__main__":
+    main()
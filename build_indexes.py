@@ -0,0 +1,108 @@
+import argparse
+import json
+import logging as log
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+from gensim.models import KeyedVectors
+
+import word_models
+from utils import load_settings
+
+"""
+Builds the annoy indexes used by the spymaster, one per word model, e.g.
+    python build_indexes.py models/glove-wiki-100.bin models/glove-wiki-300.bin --search-k -1
+Each index is written next to its model along with a .json metadata file that load_indexer checks against the model,
+the spymaster only opens the index with its own annoy_trees, which is what --trees defaults to
+"""
+
+
+def build_index(model_file, num_trees, search_k, words_file="settings/game_words.txt", out_dir=None, topn=50):
+    model_name = os.path.splitext(os.path.basename(model_file))[0]
+    out_dir = out_dir if out_dir is not None else os.path.dirname(os.path.abspath(model_file))
+    index_file = os.path.join(out_dir, word_models.indexer_file(model_name, num_trees))
+
+    log.info("Loading {0}".format(model_file))
+    word_model = KeyedVectors.load(model_file)
+    word_model.init_sims(replace=True)
+
+    log.info("Building {0} tree annoy index for {1}".format(num_trees, model_name))
+    start = perf_counter()
+    indexer = word_models.AnnoyIndexerSearchK(word_model, num_trees, search_k=search_k)
+    build_time = perf_counter() - start
+
+    log.info("Saving {0}".format(index_file))
+    indexer.save(index_file)
+    index_size = os.path.getsize(index_file) + os.path.getsize(index_file + ".d")
+
+    # recall of the index against a brute force search, for every game word the model knows
+    log.info("Measuring recall@{0} for {1}".format(topn, model_name))
+    game_words = [w.replace(" ", "_").strip() for w in open(words_file, "r").readlines()]
+    game_words = [w for w in game_words if w in word_model.vocab]
+    recalls = []
+    start = perf_counter()
+    for word in game_words:
+        exact = {w for w, score in word_model.most_similar(positive=[word], topn=topn)}
+        approx = [w for w, score in indexer.most_similar(word_model.vectors_norm[word_model.vocab[word].index],
+                                                         topn + 1) if w != word][:topn]
+        recalls.append(len(exact.intersection(approx)) / topn)
+    query_time = (perf_counter() - start) / max(len(game_words), 1)
+
+    meta = {"model_name": model_name,
+            "model_file": os.path.basename(model_file),
+            "vocab_size": len(word_model.index2word),
+            "vocab_hash": word_models.vocab_hash(word_model),
+            "vector_size": word_model.vector_size,
+            "num_trees": num_trees,
+            "search_k": search_k,
+            "build_seconds": build_time,
+            "index_bytes": index_size,
+            "recall_at": topn,
+            "recall": sum(recalls) / max(len(recalls), 1),
+            "recall_words": len(recalls),
+            "seconds_per_query_pair": query_time}
+    with open(index_file + ".json", "w") as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+    log.info("Done {0}: {1}".format(model_name, meta))
+    return meta
+
+
+def main():
+    settings = load_settings(sett_file="settings/spymaster_setts.txt", default_dict={"annoy_trees": 5})
+    parser = argparse.ArgumentParser(description="Build annoy indexes for the spymaster word models")
+    parser.add_argument("models", nargs="+", help="paths of saved KeyedVectors models")
+    parser.add_argument("--trees", type=int, default=settings["annoy_trees"],
+                        help="number of annoy trees (more is slower but better), defaults to the spymaster's "
+                             "annoy_trees")
+    parser.add_argument("--search-k", type=int, default=-1,
+                        help="nodes inspected per query, -1 uses annoy's default of trees * neighbours")
+    parser.add_argument("--words", default="settings/game_words.txt", help="words to measure recall on")
+    parser.add_argument("--out-dir", default=None, help="where to write indexes, defaults to next to each model")
+    parser.add_argument("--workers", type=int, default=None, help="models built at once, defaults to one per cpu")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(process)d : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/build-log.txt", level=log.INFO)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(build_index, model, args.trees, args.search_k, args.words, args.out_dir): model
+                   for model in args.models}
+        print("{0:25}{1:>8}{2:>10}{3:>12}{4:>14}{5:>12}".format("Model", "Trees", "Search k", "Build (s)",
+                                                                "Size (MB)", "Recall@50"))
+        for future in as_completed(futures):
+            try:
+                meta = future.result()
+            except Exception as e:
+                log.exception("Failed building index for {0}".format(futures[future]))
+                print("{0:25} failed: {1}".format(futures[future], e))
+                continue
+            print("{0:25}{1:>8}{2:>10}{3:>12.1f}{4:>14.1f}{5:>12.3f}".format(meta["model_name"], meta["num_trees"],
+                                                                             meta["search_k"], meta["build_seconds"],
+                                                                             meta["index_bytes"] / 2 ** 20,
+                                                                             meta["recall"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import logging as log
+import random as rand
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+from time import monotonic, sleep
+
+"""
+Client for the ConceptNet relatedness api, requests share one pooled session and are spread over a thread pool,
+a token bucket keeps them under the api's rate limit (3600 an hour with bursts of up to 120 a minute)
+base_url can point at any server answering /relatedness?node1=..&node2=.. with {"value": ..}, e.g. a local stand-in
+"""
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class TokenBucket:
+    # allows bursts of up to capacity calls, refilled at rate tokens per second
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = monotonic()
+        self.cond = Condition(Lock())
+
+    def take(self):
+        # blocks until a token is free
+        if self.rate <= 0:
+            return  # unlimited
+        with self.cond:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                self.cond.wait((1 - self.tokens) / self.rate)
+
+
+class ConceptNetClient:
+    def __init__(self, base_url="http://api.conceptnet.io", lang="en", requests_per_hour=3600, burst=120,
+                 workers=8, retries=4, backoff=1.0, timeout=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.lang = lang
+        self.retries = retries
+        self.backoff = backoff  # seconds before the first retry, doubled for each one after
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_hour / 3600, burst)
+
+        # requests is only imported once there's a client, it's slow to import and the numberbatch source never needs it
+        import requests as req
+        from requests.adapters import HTTPAdapter
+
+        # one connection per worker kept alive between requests, retries are done here so they respect the bucket
+        self.session = req.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="conceptnet")
+
+        # relatedness is symmetric so (a, b) and (b, a) share a request
+        self.lock = Lock()
+        self.futures = dict()  # in flight or done, keyed by sorted pair
+        self.requests = 0
+
+    @staticmethod
+    def __key(hint, target):
+        return (hint, target) if hint <= target else (target, hint)
+
+    def submit(self, hint: str, target: str):
+        # returns a future for the relatedness of the pair, identical pairs share one request
+        key = self.__key(hint, target)
+        with self.lock:
+            future = self.futures.get(key)
+            if future is None or (future.done() and future.exception() is not None):  # failed pairs can be retried
+                future = self.pool.submit(self.__fetch, *key)
+                self.futures[key] = future
+        return future
+
+    def relatedness(self, hint: str, target: str):
+        return self.submit(hint, target).result()
+
+    def relatedness_many(self, pairs):
+        # fetches all pairs concurrently, returns their scores in the same order
+        futures = [self.submit(hint, target) for hint, target in pairs]
+        return [future.result() for future in futures]
+
+    def prefetch(self, pairs):
+        # starts fetching pairs without waiting for them, later relatedness calls pick up the results
+        for hint, target in pairs:
+            self.submit(hint, target)
+
+    def clear(self):
+        with self.lock:
+            self.futures = {key: future for key, future in self.futures.items() if not future.done()}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.session.close()
+        log.info("Closed ConceptNet client after {0} requests".format(self.requests))
+
+    def __fetch(self, node1, node2):
+        import requests as req
+        params = {"node1": "/c/{0}/{1}".format(self.lang, node1), "node2": "/c/{0}/{1}".format(self.lang, node2)}
+        for attempt in range(self.retries + 1):
+            self.bucket.take()
+            with self.lock:
+                self.requests += 1
+            wait = self.backoff * 2 ** attempt * (1 + rand.random() / 2)  # jitter stops workers retrying in step
+            try:
+                response = self.session.get(self.base_url + "/relatedness", params=params, timeout=self.timeout)
+                if response.status_code == 429 or response.status_code >= 500:
+                    if response.headers.get("Retry-After", "").isdigit():
+                        wait = max(wait, int(response.headers["Retry-After"]))
+                    raise RateLimitError("ConceptNet returned {0}".format(response.status_code))
+                response.raise_for_status()
+                return response.json()["value"]
+            except (req.ConnectionError, req.Timeout, RateLimitError) as e:
+                if attempt == self.retries:
+                    raise
+                log.warning("ConceptNet request for {0}, {1} failed ({2}), retrying in {3:.1f}s".format(
+                    node1, node2, e, wait))
+                sleep(wait)
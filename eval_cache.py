@@ -0,0 +1,99 @@
+import logging as log
+import os
+import sqlite3
+from functools import wraps
+from threading import Lock
+
+import metrics
+
+
+class EvalCache:
+    # persistent cache of hint evaluation scores keyed by (method, hint, target), backed by sqlite
+    # once it holds more than max_entries the least recently used entries are evicted
+    def __init__(self, path="cache/eval-cache.sqlite", max_entries=1000000, commit_every=500):
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0  # writes since the last commit
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # readers in other processes aren't blocked by writes
+        self.conn.execute("CREATE TABLE IF NOT EXISTS scores (method TEXT, hint TEXT, target TEXT, score REAL, "
+                          "used INTEGER, PRIMARY KEY (method, hint, target))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS scores_used ON scores (used)")
+        self.conn.commit()
+        # a counter rather than a timestamp, so eviction order doesn't depend on clock resolution
+        self.clock = self.conn.execute("SELECT COALESCE(MAX(used), 0) FROM scores").fetchone()[0]
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        log.info("Opened evaluation cache {0} with {1} entries".format(path, self.entries))
+
+    def get(self, method, hint, target):
+        with self.lock:
+            row = self.conn.execute("SELECT score FROM scores WHERE method=? AND hint=? AND target=?",
+                                    (method, hint, target)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.count("eval_cache.miss")
+                return None
+            self.hits += 1
+            metrics.count("eval_cache.hit")
+            self.clock += 1
+            self.conn.execute("UPDATE scores SET used=? WHERE method=? AND hint=? AND target=?",
+                              (self.clock, method, hint, target))
+            self.__written()
+            return row[0]
+
+    def contains(self, method, hint, target):
+        # doesn't count as a use, for deciding what to fetch ahead of time
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM scores WHERE method=? AND hint=? AND target=?",
+                                     (method, hint, target)).fetchone() is not None
+
+    def put(self, method, hint, target, score):
+        with self.lock:
+            self.clock += 1
+            existed = self.conn.execute("SELECT 1 FROM scores WHERE method=? AND hint=? AND target=?",
+                                        (method, hint, target)).fetchone() is not None
+            self.conn.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)",
+                              (method, hint, target, score, self.clock))
+            if not existed:
+                self.entries += 1
+            if self.entries > self.max_entries:
+                # evict a little more than needed so this doesn't happen on every put
+                evict = self.entries - self.max_entries + max(self.max_entries // 100, 1)
+                self.conn.execute("DELETE FROM scores WHERE rowid IN "
+                                  "(SELECT rowid FROM scores ORDER BY used LIMIT ?)", (evict,))
+                self.entries = self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+            self.__written()
+
+    def wrap(self, method):
+        # cached version of an evaluation method taking (hint, target), keyed by the method's name
+        @wraps(method)
+        def cached(hint, target):
+            score = self.get(method.__name__, hint, target)
+            if score is None:
+                score = method(hint, target)
+                self.put(method.__name__, hint, target, score)
+            return score
+        return cached
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        log.info("Closed evaluation cache {0} ({1} hits, {2} misses)".format(self.path, self.hits, self.misses))
+
+    def __written(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
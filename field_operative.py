@@ -1,61 +1,102 @@
 import logging as log
+import random as rand
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
-from time import sleep
+from time import perf_counter_ns
 
-import requests as req
-from nltk.corpus import wordnet as wn
-from nltk.corpus.reader import WordNetError
+import numpy as np
 
+import log_setup
+import metrics
+import word_models
+from conceptnet_client import ConceptNetClient
+from eval_cache import EvalCache
+from numberbatch import NumberbatchRelatedness
+from round_records import RoundWriter, read_rounds, record_hints
 from utils import load_settings
+from wordnet_graph import WordNetGraph
+from wordnet_scores import WordNetScorer
 
 
 class FieldOperative:
-    def __init__(self):
+    def __init__(self, settings_file="settings/spymaster_setts.txt",
+                 eval_settings_file="settings/field_operative_setts.txt"):
         log.info("Operative initialising...")
         self.team_words = dict()
         self.board_words = list()
         self.hints = dict()
-        self.settings = load_settings(sett_file="settings/spymaster_setts.txt",
+        self.settings = load_settings(sett_file=settings_file,
                                       default_dict={"max_top_hints": 10,
                                                     "max_levels": 2})
-        self.evaluation_methods = [self.__concept_net_eval, self.__word_net_path_eval,
+        self.eval_settings = load_settings(sett_file=eval_settings_file,
+                                           default_dict={"use_eval_cache": True,
+                                                         "eval_cache_file": "cache/eval-cache.sqlite",
+                                                         "eval_cache_size": 1000000,
+                                                         "conceptnet_source": "api",
+                                                         "numberbatch_file": "",
+                                                         "conceptnet_url": "http://api.conceptnet.io",
+                                                         "conceptnet_requests_per_hour": 3600,
+                                                         "conceptnet_burst": 120,
+                                                         "conceptnet_workers": 8,
+                                                         "conceptnet_retries": 4,
+                                                         "wordnet_source": "nltk",
+                                                         "wordnet_graph_dir": "models/wordnet-graph",
+                                                         "eval_workers": 0})
+        # conceptnet relatedness either from the live api or worked out locally from the Numberbatch vectors behind it
+        if self.eval_settings["conceptnet_source"] == "numberbatch":
+            self.concept_net = NumberbatchRelatedness(model_file=self.eval_settings["numberbatch_file"] or None)
+            self.concept_net_method = self.__numberbatch_eval
+        else:
+            self.concept_net = ConceptNetClient(base_url=self.eval_settings["conceptnet_url"],
+                                                requests_per_hour=self.eval_settings["conceptnet_requests_per_hour"],
+                                                burst=self.eval_settings["conceptnet_burst"],
+                                                workers=self.eval_settings["conceptnet_workers"],
+                                                retries=self.eval_settings["conceptnet_retries"])
+            self.concept_net_method = self.__concept_net_eval
+        # the compiled graph (see wordnet_graph.py) scores a whole board at once without nltk's synset objects
+        if self.eval_settings["wordnet_source"] == "graph":
+            self.word_net = WordNetGraph(self.eval_settings["wordnet_graph_dir"])
+        else:
+            self.word_net = WordNetScorer()
+        self.evaluation_methods = [self.concept_net_method, self.__word_net_path_eval,
                                    self.__word_net_wup_eval, self.__word_net_lch_eval]
+
+        self.eval_pool = None  # wordnet workers for parallel evaluation, started when first needed
+
+        # scores for (method, hint, target) are kept between runs, the game word list is small so pairs repeat a lot
+        self.eval_cache = None
+        if self.eval_settings["use_eval_cache"]:
+            self.eval_cache = EvalCache(path=self.eval_settings["eval_cache_file"],
+                                        max_entries=self.eval_settings["eval_cache_size"])
+            self.evaluation_methods = [self.eval_cache.wrap(method) for method in self.evaluation_methods]
+        # timed outside the cache, so the timings are what evaluation actually costs with it
+        self.evaluation_methods = [metrics.timed("eval." + method.__name__.strip("_"))(method)
+                                   for method in self.evaluation_methods]
         log.info("Operative initialised!")
 
-    def load_results_from_file(self, infile):
-        log.info("Loading hints from {0}...".format(infile))
-        with open(infile, "r") as inf:
-            inf.readline()
-            for t_index in range(4):
-                line = inf.readline()
-                team = line.split(": ")[0]
-                words = line.split(": ")[1].strip().split(" - ")
-                self.team_words[team] = words
-                self.board_words = [x for x in chain.from_iterable(self.team_words.values())]
-            log.info("Loaded teams")
-            for team in sorted(self.team_words.keys()):
-                log.debug("{0}: {1}".format(team, " - ".join(self.team_words[team])))
-            inf.readline()
-            for l_index in range(self.settings["max_levels"]):
-                level = int(inf.readline().split(": ")[1])
-                inf.readline()
-                hints = []
-                for h in range(self.settings["max_top_hints"]):
-                    line = inf.readline()
-                    targets = line[:40].strip().split(",")
-                    hint = line[40:60].strip()
-                    score = float(line[60:].strip())
-                    hints.append((targets, (hint, score)))
-                self.hints[level] = hints
-            log.info("Loaded hints")
-            for level in sorted(self.hints.keys()):
-                log.debug("Level: {0}".format(str(level)))
-                log.debug("{0:40}{1:20}{2:20}".format("Target", "Hint", "Score"))
-                for hint in self.hints[level]:
-                    log.debug("{0:40}{1:20}{2:20}".format(",".join(hint[0]), hint[1][0], hint[1][1]))
+    def load_results_from_file(self, infile, round_index=0):
+        # loads one round of a spymaster's results file (see round_records)
+        log.info("Loading hints from %s...", infile)
+        for index, record in enumerate(read_rounds(infile)):
+            if index == round_index:
+                self.load_round(record)
+                return
+        raise ValueError("{0} has no round {1}".format(infile, round_index))
+
+    def load_round(self, record):
+        self.team_words = {team: list(words) for team, words in record["teams"].items()}
+        self.board_words = [x for x in chain.from_iterable(self.team_words.values())]
+        self.hints = record_hints(record)
+        # both are replaced, never changed, by the next round so they can be logged as they are
+        log.debug("Loaded round", extra={"data": {"teams": self.team_words, "hints": self.hints}})
 
     def evaluate_hints_to_file(self, out_file):
         log.info("Evaluating hints")
+        # with eval_workers every hint is scored up front in parallel, then written out in the same order as before
+        scores = None
+        if self.eval_settings["eval_workers"] > 0:
+            scores = self.__score_in_parallel([hint[1][0] for hints in self.hints.values() for hint in hints],
+                                              self.board_words)
         with open(out_file, "w") as outf:
             outf.write("Teams:\n")
             for team in sorted(self.team_words.keys()):
@@ -64,88 +105,211 @@ class FieldOperative:
             outf.write("Note: Due to WordNet's Structure, noun to verb comparison is impossible,\n" +
                        "you cannot compare apple to eat, only apple to orange or eat to devour etc\n")
             for level in self.hints.keys():
-                log.info("Level {0} hints".format(level))
+                log.info("Level %s hints", level)
                 outf.write("Level: {0}\n".format(level))
                 for num, hint in enumerate(self.hints[level]):
-                    log.info("Evaluating hint {0} of {1}: {2}".format(num + 1, len(self.hints[level]), hint[1][0]))
+                    log.info("Evaluating hint %d of %d: %s", num + 1, len(self.hints[level]), hint[1][0])
                     outf.write("Target: {0:30} Hint: {1:20} WM Score: {2:20f}\n".format(",".join(hint[0]),
                                                                                         hint[1][0], hint[1][1]))
-
-                    for method in self.evaluation_methods:
-                        log.info("Evaluating with method: {0}".format(method.__name__))
-                        scored_board_words = [[word, method(hint=hint[1][0], target=word)]
-                                              for word in self.board_words]
-                        sorted_board_words = sorted(scored_board_words,
-                                                    key=lambda x: x[1],
-                                                    reverse=True)
+                    for method_name, sorted_board_words in self.__rank_board(hint[1][0], scores):
                         score_str = " - ".join(
                             ["{0}-{1:.3f}".format(word[0], word[1]) for word in sorted_board_words])
-                        outf.write("Ranked by {0}: {1}\n".format(method.__name__, score_str))
+                        outf.write("Ranked by {0}: {1}\n".format(method_name, score_str))
+
+        self.concept_net.clear()
+        if self.eval_cache is not None:
+            self.eval_cache.flush()
+
+    def evaluate_rounds_to_file(self, in_file, out_file):
+        # streams every round of a results file through the evaluation a round at a time, so memory use doesn't
+        # grow with the file, each round is written back out with an "evaluation" of every hint
+        log.info("Evaluating rounds from %s", in_file)
+        with RoundWriter(out_file) as writer:
+            for record in read_rounds(in_file):
+                round_start = perf_counter_ns()
+                self.load_round(record)
+                scores = None
+                if self.eval_settings["eval_workers"] > 0:
+                    scores = self.__score_in_parallel([hint[1][0] for hints in self.hints.values() for hint in hints],
+                                                      self.board_words)
+                for level in self.hints.keys():
+                    for hint in record["levels"][str(level)]:
+                        hint["evaluation"] = {method_name: sorted_board_words for method_name, sorted_board_words
+                                              in self.__rank_board(hint["hint"], scores)}
+                writer.write(record)
+                self.concept_net.clear()  # its scores are only needed for the round they were fetched for
+                metrics.record("evaluate_round", perf_counter_ns() - round_start)
+                if writer.rounds % 100 == 0:
+                    log.info("Evaluated %d rounds", writer.rounds)
+            log.info("Evaluated %d rounds to %s", writer.rounds, out_file)
 
+        if self.eval_cache is not None:
+            self.eval_cache.flush()
+
+    def __rank_board(self, hint: str, scores=None):
+        # [(method name, [[board word, score], ...] best first)] for each evaluation method, scores are the ones
+        # worked out by __score_in_parallel if it was used
+        if scores is None:
+            self.__prefetch(hint, self.board_words)
+        ranked = []
+        for method in self.evaluation_methods:
+            log.debug("Evaluating with method: %s", method.__name__)
+            if scores is None:
+                scored_board_words = [[word, method(hint=hint, target=word)] for word in self.board_words]
+            else:
+                scored_board_words = [[word, scores[(method.__name__, hint, word)]] for word in self.board_words]
+            ranked.append((method.__name__, sorted(scored_board_words, key=lambda x: x[1], reverse=True)))
+        return ranked
+
+    def close(self):
+        if self.eval_pool is not None:
+            self.eval_pool.shutdown()
+            self.eval_pool = None
+        self.concept_net.close()
+        if self.eval_cache is not None:
+            self.eval_cache.close()
+
+    @metrics.timed("evaluate_hint")
     def evaluate_hint(self, hint: str, board_words: list):
+        self.__prefetch(hint, board_words)
         hint_scores = []
         for word in board_words:
             scores = []
             for method in self.evaluation_methods:
                 scores.append(method(hint, word))
             hint_scores.append([word, scores])
+        self.concept_net.clear()
+        if self.eval_cache is not None:
+            self.eval_cache.flush()
         return hint_scores
 
+    @metrics.timed("eval.prefetch")
+    def __prefetch(self, hint: str, board_words: list):
+        # the whole board is scored together, rather than one word at a time as each method asks for it
+        # method names are the keys the eval cache stores scores under
+        self.concept_net.prefetch([(hint, word) for word in self.__uncached(hint, board_words,
+                                                                            [self.concept_net_method])])
+        word_net_words = self.__uncached(hint, board_words, [self.__word_net_path_eval, self.__word_net_wup_eval,
+                                                             self.__word_net_lch_eval])
+        if len(word_net_words):
+            self.word_net.scores(hint, word_net_words)
+
+    @metrics.timed("eval.parallel")
+    def __score_in_parallel(self, hints: list, board_words: list):
+        # scores of every (method name, hint, board word), conceptnet requests are spread over its client's own
+        # threads while the cpu bound wordnet scoring of each hint goes to a pool of eval_workers processes
+        # (never threads, the scorers' memos and nltk's lazily loaded corpus aren't safe to share between them)
+        # the three wordnet metrics come out of one pass (see wordnet_scores), so a hint's wordnet unit covers all three
+        hints = list(dict.fromkeys(hints))  # a hint at more than one level is only scored once
+        word_net_methods = [self.__word_net_path_eval, self.__word_net_wup_eval, self.__word_net_lch_eval]
+        for hint in hints:
+            self.concept_net.prefetch([(hint, word) for word in self.__uncached(hint, board_words,
+                                                                                [self.concept_net_method])])
+
+        # the pool is kept between calls, so streaming many rounds doesn't start new workers for each one
+        if self.eval_pool is None:
+            self.eval_pool = ProcessPoolExecutor(max_workers=self.eval_settings["eval_workers"],
+                                                 initializer=_init_word_net,
+                                                 initargs=(self.eval_settings["wordnet_source"],
+                                                           self.eval_settings["wordnet_graph_dir"]))
+        scores = dict()
+        futures = [(hint, words, self.eval_pool.submit(_word_net_scores, hint, words))
+                   for hint, words in ((hint, self.__uncached(hint, board_words, word_net_methods))
+                                       for hint in hints) if len(words)]
+        for hint, words, future in futures:
+            for word, word_scores in zip(words, future.result()):
+                for method, score in zip(word_net_methods, word_scores):
+                    scores[(method.__name__, hint, word)] = score
+                    if self.eval_cache is not None:
+                        self.eval_cache.put(method.__name__, hint, word, score)
+
+        # anything not worked out above is either cached or already fetched by the conceptnet client
+        for hint in hints:
+            for word in board_words:
+                for method in self.evaluation_methods:
+                    if (method.__name__, hint, word) not in scores:
+                        scores[(method.__name__, hint, word)] = method(hint, word)
+        return scores
+
+    def __uncached(self, hint: str, board_words: list, methods: list):
+        if self.eval_cache is None:
+            return list(board_words)
+        return [word for word in board_words
+                if not all(self.eval_cache.contains(method.__name__, hint, word) for method in methods)]
+
     def __concept_net_eval(self, hint: str, target: str):
-        relatedness_url = "http://api.conceptnet.io/relatedness?node1=/c/en/{}&node2=/c/en/{}"
-        json = req.get(relatedness_url.format(hint, target)).json()
-        sleep(2)
-        return json["value"]
+        return self.concept_net.relatedness(hint, target)
 
+    def __numberbatch_eval(self, hint: str, target: str):
+        return self.concept_net.relatedness(hint, target)
+
+    # the three wordnet metrics are worked out together and cached per pair, so whichever runs first does the work
     def __word_net_path_eval(self, hint: str, target: str):
-        h_synsets = wn.synsets(hint)
-        t_synsets = wn.synsets(target)
-        lst = []
-        for h in h_synsets:
-            for t in t_synsets:
-                strength = wn.path_similarity(h, t)
-                lst.append(strength if strength is not None else -1)
-        if all([x == -1 for x in lst]):
-            return -9.999
-        else:
-            return max(lst)
+        return self.word_net.word_scores(hint, target)[0]
+
+    def __word_net_wup_eval(self, hint: str, target: str):
+        return self.word_net.word_scores(hint, target)[1]
 
     def __word_net_lch_eval(self, hint: str, target: str):
-        h_synsets = wn.synsets(hint)
-        t_synsets = wn.synsets(target)
-        lst = []
-        for h in h_synsets:
-            for t in t_synsets:
-                try:
-                    strength = wn.lch_similarity(h, t)
-                except WordNetError:
-                    strength = -1
-                lst.append(strength if strength is not None else -1)
-        if all([x == -1 for x in lst]):
-            return -9.999
-        else:
-            return max(lst)  # get strongest hint
+        return self.word_net.word_scores(hint, target)[2]
 
-    def __word_net_wup_eval(self, hint: str, target: str):
-        h_synsets = wn.synsets(hint)
-        t_synsets = wn.synsets(target)
-        lst = []
-        for h in h_synsets:
-            for t in t_synsets:
-                strength = wn.wup_similarity(h, t)
-                lst.append(strength if strength is not None else -1)
-        if all([x == -1 for x in lst]):
-            return -9.999
-        else:
-            return max(lst)
+
+_word_net = None  # scorer of each evaluation worker
+
+
+def _init_word_net(source="nltk", graph_dir=None):
+    # each worker process loads its own scorer
+    global _word_net
+    if source == "graph":
+        _word_net = WordNetGraph(graph_dir)
+    else:
+        _word_net = WordNetScorer()
+
+
+def _word_net_scores(hint, board_words):
+    return _word_net.scores(hint, board_words)
+
+
+class CpuFieldOperative:
+    # plays as a field operative, ranks the unrevealed board words by how close they are to the hint in a word model
+    # (the spymasters' own model unless guess_model is set, shared through word_models)
+    # only the word model is held, none of the evaluation's caches, clients or wordnet scorers are needed to guess
+    def __init__(self, model_name=None, settings_file="settings/spymaster_setts.txt",
+                 eval_settings_file="settings/field_operative_setts.txt"):
+        self.guess_settings = load_settings(sett_file=eval_settings_file,
+                                            default_dict={"guess_model": "",
+                                                          "guess_threshold": 0.35})
+        if model_name is None:
+            model_name = self.guess_settings["guess_model"] or load_settings(
+                sett_file=settings_file, default_dict={"model_name": "glove-wiki-100"})["model_name"]
+        self.word_model = word_models.get_word_model(model_name)
+
+    def rank(self, hint: str, board_words: list):
+        # (word, cosine similarity to the hint) for every board word the model knows, best first
+        known = [word for word in board_words if word in self.word_model.vocab]
+        if hint not in self.word_model.vocab or len(known) == 0:
+            return []
+        vectors = word_models.unit_vectors(self.word_model, [self.word_model.vocab[word].index for word in known])
+        scores = np.dot(vectors, word_models.unit_vectors(self.word_model, self.word_model.vocab[hint].index))
+        return [(known[i], float(scores[i])) for i in np.argsort(-scores)]
+
+    def guess(self, hint: str, hint_num: int, board_words: list, rng=rand):
+        # the board words to guess in order, the best is always guessed and the next ones only while they're at
+        # least guess_threshold similar to the hint, never more than the hint's number
+        ranked = self.rank(hint, board_words)
+        if len(ranked) == 0:
+            return rng.sample(board_words, min(1, len(board_words)))  # nothing to go on
+        guesses = [ranked[0][0]]
+        for word, score in ranked[1:max(hint_num, 1)]:
+            if score < self.guess_settings["guess_threshold"]:
+                break
+            guesses.append(word)
+        return guesses
 
 
 if __name__ == "__main__":
-    fa_logger = log.getLogger("fieldoperative")
-    fa_logger.setLevel(log.DEBUG)
-    handler = log.FileHandler("logs/field-operative-log.txt", "a", "utf-8")
-    handler.setFormatter(log.Formatter("%(asctime)s : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S"))
-    fa_logger.addHandler(handler)
+    # the operative logs through the root logger
+    log_setup.start_logging(log.getLogger(), [log_setup.file_handler("logs/field-operative-log.txt")])
 
     log.getLogger("urllib3").setLevel(log.WARNING)  # prevent log from filling with http info
 
@@ -1,19 +1,21 @@
 import datetime as dt
 import itertools as it
 import logging as log
-import random as rand
 import sys
 
-import numpy.random as npr
 import pygame as pgm
 
-from field_operative import FieldOperative
+import log_setup
+from field_operative import CpuFieldOperative
+from game_rules import GameRules
+from hint_server import HintClient
+from hint_worker import HintWorker
 from spymaster import SpyMaster
 from utils import load_settings
 
 
 # TODO add a lot of processing logging
-class Game:
+class Game(GameRules):
     def __init__(self, full_logger=None, game_logger=None):
         self.full_logger = full_logger
         self.game_logger = game_logger
@@ -28,20 +30,24 @@ class Game:
                                    {"scrn_w": 500, "scrn_h": 500,
                                     "back_hex": 0xB52E59, "fore_hex_light": 0xC8C8C8, "fore_hex_dark": 0x646464,
                                     "red_spymaster_cpu": True, "red_field_operative_cpu": False,
-                                    "blue_spymaster_cpu": True, "blue_field_operative_cpu": False})
+                                    "blue_spymaster_cpu": True, "blue_field_operative_cpu": False,
+                                    "hint_server_url": ""})
 
         self.surface = pgm.display.set_mode((self.setts["scrn_w"], self.setts["scrn_h"]))
 
         self.screen = "loading"  # current screen to display
         self.draw()  # set loading screen before loading in agents
 
-        self.red_spymaster = SpyMaster(full_log=self.full_logger, game_log=self.game_logger)
-        self.red_spymaster.word_model.init_sims()
-        self.red_field_operative = FieldOperative()
-
-        self.blue_spymaster = SpyMaster(full_log=self.full_logger, game_log=self.game_logger)
-        self.blue_spymaster.word_model.init_sims()
-        self.blue_field_operative = FieldOperative()
+        if self.setts["hint_server_url"] != "":
+            # hints come from a hint server's warm spymasters (see hint_server.py) rather than spymasters loaded here
+            self.red_spymaster = HintClient(self.setts["hint_server_url"])
+            self.blue_spymaster = HintClient(self.setts["hint_server_url"])
+        else:
+            # both spymasters share one normalised word model and indexer (see word_models)
+            self.red_spymaster = SpyMaster(full_log=self.full_logger, game_log=self.game_logger)
+            self.blue_spymaster = SpyMaster(full_log=self.full_logger, game_log=self.game_logger)
+        self.red_field_operative = CpuFieldOperative()
+        self.blue_field_operative = CpuFieldOperative()
 
         # intersection of both spymaster's game_words, means only words on board will be in both vocabs, no duplicates
         self.game_words = list(set(self.red_spymaster.game_words) & set(self.blue_spymaster.game_words))
@@ -55,6 +61,10 @@ class Game:
         self.hint_num = 0
         self.guess = None
         self.guesses_made = 0
+        self.hint_worker = None  # background cpu spymaster hint generation
+        self.board_words = list()  # dealt words, scored by each cpu spymaster's first hint worker of the game
+        self.unscored_spymasters = set()  # "red"/"blue" cpu spymasters that haven't scored this game's board yet
+        self.cpu_guesses = None  # guesses a cpu field operative has left to make this turn
 
         self.win_state = {"win": "",
                           "reason": ""}
@@ -113,47 +123,26 @@ class Game:
                         self.setts["blue_field_operative_cpu"] = False
 
                     if self.buttons["begin_game_btn"].collidepoint(pos):
-                        if self.game_logger is not None:
-                            # clear all previous handlers of game logging
-                            hdlrs = self.game_logger.handlers
-                            for hdlr in hdlrs:
-                                self.game_logger.removeHandler(hdlr)
+                        if self.hint_worker is not None:
+                            # wait for any cancelled round to stop before the spymasters are given a new board
+                            self.hint_worker.cancel(wait=True)
+                            self.hint_worker = None
 
+                        if self.game_logger is not None:
+                            # each game gets its own file, this replaces (and finishes writing) the last game's
                             log_file = "logs/gameplay-log-{0}.txt".format(
                                 dt.datetime.now().strftime("%Y-%m-%d-%H-%M-%S"))
-                            open(log_file, "w+")  # this creates the file if it doesn't exists and clears it if it does
-                            fh = log.FileHandler(log_file, "a", "utf-8")
-                            fh.setLevel(log.DEBUG)
-                            fh.setFormatter(log.Formatter("%(asctime)s : %(module)-15s : %(levelname)s : %(message)s",
-                                                          datefmt="%H:%M:%S"))
-                            self.game_logger.addHandler(fh)
-
-                        # randomly pick who starts
-                        self.current_agent = rand.choice(["rs", "bs"])
-                        rand.shuffle(self.game_words)
-                        word_gen = it.cycle(self.game_words)
-
-                        # if red goes first they have one more to guess, same for blue
-                        self.team_words["red"] = [next(word_gen) for i in
-                                                  range(9 if self.current_agent == "rs" else 8)]
-                        self.team_words["blue"] = [next(word_gen) for i in
-                                                   range(9 if self.current_agent == "bs" else 8)]
-                        # always 7 bystanders and 1 assassin
-                        self.team_words["grey"] = [next(word_gen) for i in range(7)]
-                        self.team_words["black"] = [next(word_gen) for i in range(1)]
-
-                        for team in self.team_words.keys():
-                            self.discovered_team_words[team] = []  # start of game, all words on board are undiscovered
-
-                        board_words = [x for x in it.chain.from_iterable(self.team_words.values())]
-                        rand.shuffle(board_words)
-                        # list of lists to display board state
-                        self.board = [board_words[5 * i: 5 * i + 5] for i in range(5)]
-
-                        self.hint = None
-                        self.hint_num = 0
-                        self.guess = None
-                        self.guesses_made = 0
+                            log_setup.start_logging(self.game_logger, [log_setup.file_handler(
+                                log_file, mode="w", fmt="%(asctime)s : %(module)-15s : %(levelname)s : %(message)s",
+                                datefmt="%H:%M:%S")])
+
+                        self.board_words = self.deal_board(self.game_words)
+                        self.cpu_guesses = None
+
+                        # spymasters score the board once, on their first hint worker rather than here on the pygame
+                        # thread, so each of their turns only has to reweight it (both share the one scoring)
+                        self.unscored_spymasters = {team for team in ["red", "blue"]
+                                                    if self.setts[team + "_spymaster_cpu"]}
 
                         # game logging done at end of setup to simplify code
                         if self.game_logger is not None:
@@ -170,20 +159,11 @@ class Game:
                             self.game_logger.info("{} team going first".format("Red" if self.current_agent[0] == "r"
                                                                                else "Blue"))
 
-                            # teams words info
-                            for team in ["red", "blue", "grey", "black"]:
-                                self.game_logger.info("{0} team words are: {1}".format(
-                                    team.title(), ", ".join(self.team_words[team])))
-
-                            # board layout info
-                            bw = [x for x in it.chain.from_iterable(self.team_words.values())]
-                            bw.sort(key=lambda x: len(x), reverse=True)
-                            longest = len(bw[0])
-                            board_str = "\n".join(["| ".join([self.board[x][y] +
-                                                              " " * (longest - len(self.board[x][y]) + 1)
-                                                              for x in range(5)])
-                                                   for y in range(5)])
-                            self.game_logger.info("Board layout: \n{0}".format(board_str))
+                            # teams words and board layout (rows of the board as shown)
+                            self.game_logger.info("Team words", extra={"data": {
+                                team: list(self.team_words[team]) for team in ["red", "blue", "grey", "black"]}})
+                            self.game_logger.info("Board layout", extra={"data": [
+                                [self.board[x][y] for x in range(5)] for y in range(5)]})
                             self.game_logger.info("Setup Complete!")
 
                         self.screen = "game"
@@ -195,6 +175,9 @@ class Game:
                     if self.buttons["back_btn"].collidepoint(pos):
                         self.screen = "setup"
 
+                        if self.hint_worker is not None:
+                            self.hint_worker.cancel()
+
                         if self.game_logger is not None:
                             self.game_logger.info("GAME QUIT")
 
@@ -205,16 +188,11 @@ class Game:
                                                             it.chain(self.discovered_team_words.values())]:
                                     self.guess = self.board[x][y]
 
-                    if self.buttons["pass_turn_btn"].collidepoint(pos):
-                        self.hint = None
-                        self.guesses_made = 0
+                    if self.buttons["pass_turn_btn"].collidepoint(pos) and self.current_agent[1] == "f":
                         if self.game_logger is not None:
                             self.game_logger.info("{} Field Operative passed their turn".format(
                                 "Red" if self.current_agent[0] == "r" else "Blue"))
-                        if self.current_agent == "rf":
-                            self.current_agent = "bs"
-                        elif self.current_agent == "bf":
-                            self.current_agent = "rs"
+                        self.pass_turn()
 
                         self.draw()  # skip past spymaster processing to draw game screen
                         self.draw()
@@ -223,50 +201,56 @@ class Game:
                     if self.buttons["back_btn"].collidepoint(pos):
                         self.screen = "main"
 
+    def __board_to_score(self, team):
+        # the board, the first time the team's spymaster is asked for a hint this game
+        if team not in self.unscored_spymasters:
+            return None
+        self.unscored_spymasters.discard(team)
+        return self.board_words
+
     def __process_game(self):
         if self.current_agent[1] == "s" and self.hint is None:  # --- spymaster and no existing hint ---
-            # TODO investigate if moving hint gen into a diff thread would prevent Not Responding window
+            # cpu hints are generated on a background thread, started on the first frame of the turn and picked up
+            # on whichever frame it finishes in
             if self.current_agent[0] == "r" and self.setts["red_spymaster_cpu"]:  # red team, comp generated hint
-                if self.game_logger is not None:
-                    self.game_logger.info("Red Spymaster generating hints...")
-                overlaps = self.red_spymaster.run_defined_round(ts=self.team_words["red"],
-                                                                os=self.team_words["blue"],
-                                                                bs=self.team_words["grey"],
-                                                                ks=self.team_words["black"])
-                hints = [hint for hint in it.chain.from_iterable([hints for hints in overlaps.values()])]
-                if self.red_spymaster.settings["game_hint_naive_method"]:
-                    hint = rand.choice(hints)
-                else:
-                    hint_pdf = [hint[1][1] / sum([hint[1][1] for hint in hints]) for hint in hints]
-                    hint_index = npr.choice([x for x in range(len(hints))], p=hint_pdf)
-                    hint = hints[hint_index]
-                self.hint = hint[1][0]
-                self.hint_num = len(hint[0])
-                if self.game_logger is not None:
-                    self.game_logger.info("Randomly chosen hint is \"{0} {1}\"".format(self.hint, str(self.hint_num)))
-                    self.game_logger.info("Passing turn to Red Field Operative")
-                self.current_agent = "rf"
+                if self.hint_worker is None:
+                    if self.game_logger is not None:
+                        self.game_logger.info("Red Spymaster generating hints...")
+                    self.hint_worker = HintWorker(self.red_spymaster,
+                                                  ts=self.team_words["red"],
+                                                  os=self.team_words["blue"],
+                                                  bs=self.team_words["grey"],
+                                                  ks=self.team_words["black"],
+                                                  board=self.__board_to_score("red"))
+                elif self.hint_worker.ready():
+                    overlaps = self.hint_worker.take()
+                    self.hint_worker = None
+                    self.give_hint(*self.choose_hint(
+                        overlaps, naive=self.red_spymaster.settings["game_hint_naive_method"]))
+                    if self.game_logger is not None:
+                        self.game_logger.info("Randomly chosen hint is \"{0} {1}\"".format(self.hint,
+                                                                                           str(self.hint_num)))
+                        self.game_logger.info("Passing turn to Red Field Operative")
 
             elif self.current_agent[0] == "b" and self.setts["blue_spymaster_cpu"]:  # blue team, comp generated hint
-                if self.game_logger is not None:
-                    self.game_logger.info("Blue Spymaster generating hints...")
-                overlaps = self.blue_spymaster.run_defined_round(ts=self.team_words["blue"],
-                                                                 os=self.team_words["red"],
-                                                                 bs=self.team_words["grey"],
-                                                                 ks=self.team_words["black"])
-                hints = [hint for hint in it.chain.from_iterable([hints for hints in overlaps.values()])]
-                if self.blue_spymaster.settings["game_hint_naive_method"]:
-                    hint = rand.choice(hints)
-                else:
-                    hint_pdf = [hint[1][1] / sum([hint[1][1] for hint in hints]) for hint in hints]
-                    hint_index = npr.choice([x for x in range(len(hints))], p=hint_pdf)
-                    hint = hints[hint_index]
-                self.hint = hint[1][0]
-                self.hint_num = len(hint[0])
-                if self.game_logger is not None:
-                    self.game_logger.info("Randomly chosen hint is \"{0} {1}\"".format(self.hint, str(self.hint_num)))
-                    self.game_logger.info("Passing turn to Blue Field Operative")
-                self.current_agent = "bf"
+                if self.hint_worker is None:
+                    if self.game_logger is not None:
+                        self.game_logger.info("Blue Spymaster generating hints...")
+                    self.hint_worker = HintWorker(self.blue_spymaster,
+                                                  ts=self.team_words["blue"],
+                                                  os=self.team_words["red"],
+                                                  bs=self.team_words["grey"],
+                                                  ks=self.team_words["black"],
+                                                  board=self.__board_to_score("blue"))
+                elif self.hint_worker.ready():
+                    overlaps = self.hint_worker.take()
+                    self.hint_worker = None
+                    self.give_hint(*self.choose_hint(
+                        overlaps, naive=self.blue_spymaster.settings["game_hint_naive_method"]))
+                    if self.game_logger is not None:
+                        self.game_logger.info("Randomly chosen hint is \"{0} {1}\"".format(self.hint,
+                                                                                           str(self.hint_num)))
+                        self.game_logger.info("Passing turn to Blue Field Operative")
 
             elif (self.current_agent[0] == "r" and not self.setts["red_spymaster_cpu"]) or \
                     (self.current_agent[0] == "b" and not self.setts["blue_spymaster_cpu"]):
@@ -276,81 +260,30 @@ class Game:
 
         elif self.current_agent[1] == "f":  # --- field operative ---
             # --- process cpu field operatives ---
-            if self.setts["red_field_operative_cpu"]:
-                self.guess = ""  # TODO add comp hint eval
-            elif self.setts["blue_field_operative_cpu"]:
-                self.guess = ""
+            # guesses are all picked at the start of the turn then made one per frame, so each shows on the board
+            team = "red" if self.current_agent[0] == "r" else "blue"
+            if self.setts[team + "_field_operative_cpu"]:
+                if self.cpu_guesses is None:
+                    operative = self.red_field_operative if team == "red" else self.blue_field_operative
+                    self.cpu_guesses = operative.guess(self.hint, self.hint_num,
+                                                       [x for x in it.chain.from_iterable(self.team_words.values())])
+                    if self.game_logger is not None:
+                        self.game_logger.info("{0} Field Operative plans to guess {1}".format(
+                            team.title(), ", ".join(self.cpu_guesses)))
+                if len(self.cpu_guesses):
+                    self.guess = self.cpu_guesses.pop(0)
+                else:  # guessed everything it was confident about
+                    if self.game_logger is not None:
+                        self.game_logger.info("{} Field Operative passed their turn".format(team.title()))
+                    self.cpu_guesses = None
+                    self.pass_turn()
 
             # --- process guess ---
             if self.guess is not None:  # only do processing is guess exists, so user gen'd can take more than one frame
-                if self.game_logger is not None:
-                    self.game_logger.info("{0} Field Operative picked board word {1} from hint {2}".format(
-                        "Red" if self.current_agent[0] == "r" else "Blue", self.guess, self.hint))
-                    self.game_logger.info("Guessed word {0} belongs to {1} team".format(
-                        self.guess, [team for team in self.team_words.keys() if self.guess in self.team_words[team]]))
-
-                # check for correct guess
-                if (self.current_agent[0] == "r" and self.guess in self.team_words["red"]) or \
-                        (self.current_agent[0] == "b" and self.guess in self.team_words["blue"]):
-                    self.guesses_made += 1
-
-                    if self.guesses_made >= self.hint_num + 1:  # if guess max reached reset counter and swap team
-                        self.hint = None
-                        self.guesses_made = 0
-                        if self.current_agent[0] == "r":
-                            self.current_agent = "bs"
-                        else:
-                            self.current_agent = "rs"
-                        if self.game_logger is not None:
-                            self.game_logger.info("Correct Guess! However, max guesses reached, " +
-                                                  "play passed to other team")
-                    else:
-                        if self.game_logger is not None:
-                            self.game_logger.info("Correct Guess! And max guesses not yet reached, continue guessing")
-
-                else:  # if incorrect guess
-                    if self.guess in self.team_words["black"]:
-                        self.win_state["reason"] = "assassin"
-                        if self.current_agent[0] == "r":
-                            self.win_state["win"] = "red"
-                        else:
-                            self.win_state["win"] = "blue"
-
-                        if self.game_logger is not None:
-                            self.game_logger.info("Found the assassin... Whoops!")
-
-                        self.screen = "win"
-
-                    else:  # guess in wrong team or bystander by process of elimination
-                        self.hint = None
-                        self.guesses_made = 0
-                        if self.current_agent[0] == "r":
-                            self.current_agent = "bs"
-                        else:
-                            self.current_agent = "rs"
-                        if self.game_logger is not None:
-                            self.game_logger.info("Incorrect Guess! Play passed to the other team")
-
-                for team in self.team_words.keys():
-                    if self.guess in self.team_words[team]:
-                        self.team_words[team].remove(self.guess)
-                        self.discovered_team_words[team].append(self.guess)
-                        self.guess = None
-
-                if self.team_words["red"] == []:
-                    self.win_state["win"] = "red"
-                    self.win_state["reason"] = "all"
-                    self.screen = "win"
-
-                    if self.game_logger is not None:
-                        self.game_logger.info("Red team wins! (They found all their words)")
-                elif self.team_words["blue"] == []:
-                    self.win_state["win"] = "blue"
-                    self.win_state["reason"] = "all"
+                if self.make_guess(self.guess):
                     self.screen = "win"
-
-                    if self.game_logger is not None:
-                        self.game_logger.info("Blue team wins! (They found all their words)")
+                if self.current_agent[1] != "f":  # turn over, the next cpu field operative starts afresh
+                    self.cpu_guesses = None
 
     def draw(self):
         if self.screen == "loading":
@@ -667,6 +600,8 @@ class Game:
         if self.hint is None and ((self.current_agent == "rs" and self.setts["red_spymaster_cpu"]) or
                                   (self.current_agent == "bs" and self.setts["blue_spymaster_cpu"])):
             cur_txt += ", generating hint..."
+            if self.hint_worker is not None:
+                cur_txt += " {0:.0%}".format(self.hint_worker.progress)
 
         # no hint exists and user generated
         if self.hint is None and ((self.current_agent == "rs" and not self.setts["red_spymaster_cpu"]) or
@@ -790,22 +725,9 @@ class Game:
 
 if __name__ == "__main__":
     # logging for program flow
-    f_logger = log.getLogger("game-full")
-
-    fh = log.FileHandler("logs/game-log.txt", "a", "utf-8")
-    fh.setLevel(log.DEBUG)
-    fh.setFormatter(log.Formatter("%(asctime)s : %(module)-15s : %(levelname)s : %(message)s",
-                                  datefmt="%d/%m - %H:%M:%S"))
-    f_logger.addHandler(fh)
-
-    ch = log.StreamHandler()
-    ch.setLevel(log.INFO)
-    ch.setFormatter(log.Formatter("%(asctime)s : %(module)-15s : %(levelname)s : %(message)s",
-                                  datefmt="%d/%m - %H:%M:%S"))
-    f_logger.addHandler(ch)
-
-    f_logger.propagate = False
-    f_logger.setLevel(log.DEBUG)
+    full_format = "%(asctime)s.%(msecs)03d : %(module)-15s : %(levelname)s : %(message)s"
+    f_logger = log_setup.start_logging("game-full", [log_setup.file_handler("logs/game-log.txt", fmt=full_format),
+                                                     log_setup.stream_handler(fmt=full_format)])
 
     # logging for game (file handler will be remade for each game and so is not needed here)
     g_logger = log.getLogger("game-game")
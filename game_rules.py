@@ -0,0 +1,125 @@
+import itertools as it
+import random as rand
+
+import numpy.random as npr
+
+
+class GameRules:
+    # the rules of codenames, shared by the pygame Game and the headless simulator
+    # classes using this need team_words, discovered_team_words, board, current_agent, hint, hint_num, guess,
+    # guesses_made, win_state and game_logger attributes
+    # rs = red spymaster, bs = blue spymaster, rf = red field operative, bf = blue field operative
+
+    def deal_board(self, game_words, rng=rand):
+        # randomly pick who starts
+        self.current_agent = rng.choice(["rs", "bs"])
+        rng.shuffle(game_words)
+        word_gen = it.cycle(game_words)
+
+        # if red goes first they have one more to guess, same for blue
+        self.team_words["red"] = [next(word_gen) for i in range(9 if self.current_agent == "rs" else 8)]
+        self.team_words["blue"] = [next(word_gen) for i in range(9 if self.current_agent == "bs" else 8)]
+        # always 7 bystanders and 1 assassin
+        self.team_words["grey"] = [next(word_gen) for i in range(7)]
+        self.team_words["black"] = [next(word_gen) for i in range(1)]
+
+        for team in self.team_words.keys():
+            self.discovered_team_words[team] = []  # start of game, all words on board are undiscovered
+
+        board_words = [x for x in it.chain.from_iterable(self.team_words.values())]
+        rng.shuffle(board_words)
+        # list of lists to display board state
+        self.board = [board_words[5 * i: 5 * i + 5] for i in range(5)]
+
+        self.hint = None
+        self.hint_num = 0
+        self.guess = None
+        self.guesses_made = 0
+        self.win_state = {"win": "",
+                          "reason": ""}
+        return board_words
+
+    def choose_hint(self, overlaps, naive=False, rng=rand, np_rng=npr):
+        # picks one of a spymaster's candidate hints, either uniformly or weighted by score, returns (hint, number)
+        hints = [hint for hint in it.chain.from_iterable([hints for hints in overlaps.values()])]
+        scored = [hint for hint in hints if hint[1][1] > 0]  # NO HINT FOUND has a score of -1
+        if naive or len(scored) == 0:
+            hint = rng.choice(hints)
+        else:
+            hint_pdf = [hint[1][1] / sum([hint[1][1] for hint in scored]) for hint in scored]
+            hint_index = np_rng.choice([x for x in range(len(scored))], p=hint_pdf)
+            hint = scored[hint_index]
+        return hint[1][0], len(hint[0])
+
+    def give_hint(self, hint, hint_num):
+        self.hint = hint
+        self.hint_num = hint_num
+        self.current_agent = self.current_agent[0] + "f"  # spymaster hands over to their field operative
+
+    def pass_turn(self):
+        self.hint = None
+        self.guesses_made = 0
+        if self.current_agent[0] == "r":
+            self.current_agent = "bs"
+        else:
+            self.current_agent = "rs"
+
+    def make_guess(self, guess):
+        # processes a guess by the current field operative, returns True if it ended the game
+        if self.game_logger is not None:
+            self.game_logger.info("{0} Field Operative picked board word {1} from hint {2}".format(
+                "Red" if self.current_agent[0] == "r" else "Blue", guess, self.hint))
+            self.game_logger.info("Guessed word {0} belongs to {1} team".format(
+                guess, [team for team in self.team_words.keys() if guess in self.team_words[team]]))
+
+        # check for correct guess
+        if (self.current_agent[0] == "r" and guess in self.team_words["red"]) or \
+                (self.current_agent[0] == "b" and guess in self.team_words["blue"]):
+            self.guesses_made += 1
+
+            if self.guesses_made >= self.hint_num + 1:  # if guess max reached reset counter and swap team
+                self.pass_turn()
+                if self.game_logger is not None:
+                    self.game_logger.info("Correct Guess! However, max guesses reached, " +
+                                          "play passed to other team")
+            else:
+                if self.game_logger is not None:
+                    self.game_logger.info("Correct Guess! And max guesses not yet reached, continue guessing")
+
+        else:  # if incorrect guess
+            if guess in self.team_words["black"]:
+                # finding the assassin loses the game, so the other team wins
+                self.win_state["reason"] = "assassin"
+                if self.current_agent[0] == "r":
+                    self.win_state["win"] = "blue"
+                else:
+                    self.win_state["win"] = "red"
+
+                if self.game_logger is not None:
+                    self.game_logger.info("Found the assassin... Whoops!")
+
+            else:  # guess in wrong team or bystander by process of elimination
+                self.pass_turn()
+                if self.game_logger is not None:
+                    self.game_logger.info("Incorrect Guess! Play passed to the other team")
+
+        for team in self.team_words.keys():
+            if guess in self.team_words[team]:
+                self.team_words[team].remove(guess)
+                self.discovered_team_words[team].append(guess)
+        self.guess = None
+
+        if self.team_words["red"] == []:
+            self.win_state["win"] = "red"
+            self.win_state["reason"] = "all"
+
+            if self.game_logger is not None:
+                self.game_logger.info("Red team wins! (They found all their words)")
+        elif self.team_words["blue"] == []:
+            self.win_state["win"] = "blue"
+            self.win_state["reason"] = "all"
+
+            if self.game_logger is not None:
+                self.game_logger.info("Blue team wins! (They found all their words)")
+
+        return self.win_state["win"] != ""
@@ -0,0 +1,335 @@
+import argparse
+import json
+import logging as log
+import queue
+import random as rand
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import monotonic, perf_counter, sleep
+
+import log_setup
+import metrics
+from round_records import RoundWriter, record_hints, round_record
+from spymaster import HintCancelled, SpyMaster, deal_teams
+from utils import load_settings
+
+"""
+Keeps warm spymasters resident and serves hints to any number of clients over local HTTP, e.g.
+    python hint_server.py --port 8765
+    POST /round  {"teams": {"t": [...], "o": [...], "b": [...], "k": [...]}}   -> a round record (see round_records)
+    POST /legal  {"teams": {...}, "hint": "word"}                             -> {"legal": true}
+    GET  /health                                                               -> {"status": "ok", "queued": 0, ...}
+    GET  /game_words                                                           -> {"game_words": [...]}
+Each spymaster has its own worker thread and requests wait in one bounded queue for the next free one. When the
+queue is full requests are turned away straight away with a 503 (and a Retry-After) rather than piling up, a request
+that waits longer than request_timeout gets a 504 and its round is cancelled.
+HintClient has the same run_defined_round, run_random_rounds, check_legality and game_words as a SpyMaster, so it can
+stand in for one (e.g. Game with hint_server_url set, or main.py --hint-server)
+"""
+
+TEAMS = ["t", "o", "b", "k"]
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class _Job:
+    def __init__(self, kind, teams, hint=None):
+        self.kind = kind  # "round" or "legal"
+        self.teams = {team: [str(word) for word in teams.get(team, [])] for team in TEAMS}
+        self.hint = hint
+        self.future = Future()
+        self.cancel = Event()
+        self.queued = monotonic()
+
+
+class HintService:
+    def __init__(self, spymasters=1, queue_size=32, request_timeout=60.0,
+                 spymaster_settings="settings/spymaster_setts.txt", full_log=None):
+        self.request_timeout = request_timeout
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = Lock()
+        self.busy = 0
+        self.served = 0
+        self.rejected = 0
+        self.started = monotonic()
+        self.ready = Event()
+        self.num_spymasters = spymasters
+        self.spymaster_settings = spymaster_settings
+        self.full_log = full_log
+        self.workers = []
+        self.load_error = None
+        self.game_words = list()  # of the first spymaster, every one has the same
+
+    def load(self):
+        # every spymaster shares the one copy of the word model (see word_models), so each extra one mostly costs
+        # its board matrix and spaCy pipeline
+        try:
+            for n in range(self.num_spymasters):
+                with metrics.timer("server.spymaster_load"):
+                    spymaster = SpyMaster(full_log=self.full_log, settings_file=self.spymaster_settings)
+                    spymaster.legality.load()  # rather than on the first request
+                if n == 0:
+                    self.game_words = list(spymaster.game_words)
+                worker = Thread(target=self.__work, args=(spymaster,), name="spymaster-{0}".format(n), daemon=True)
+                worker.start()
+                self.workers.append(worker)
+                log.info("Spymaster {0} of {1} ready".format(n + 1, self.num_spymasters))
+        except Exception as e:  # reported by health checks rather than leaving the server loading forever
+            log.exception("Failed loading spymasters")
+            self.load_error = "{0}: {1}".format(type(e).__name__, e)
+            if len(self.workers) == 0:
+                return
+        self.ready.set()
+
+    def submit(self, kind, teams, hint=None):
+        # queues a job, raising ServerBusy rather than waiting if the queue is full
+        job = _Job(kind, teams, hint)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            metrics.count("server.rejected")
+            raise ServerBusy("{0} requests already queued".format(self.jobs.maxsize))
+        return job
+
+    def result(self, job):
+        # waits for a job, cancelling it if it takes longer than request_timeout
+        try:
+            return job.future.result(timeout=self.request_timeout)
+        except FutureTimeout:
+            job.cancel.set()
+            metrics.count("server.timed_out")
+            raise
+
+    def __work(self, spymaster):
+        while True:
+            job = self.jobs.get()
+            if job.cancel.is_set():  # its client has already given up
+                continue
+            metrics.record("server.queue_wait", int((monotonic() - job.queued) * 1e9))
+            with self.lock:
+                self.busy += 1
+            try:
+                with metrics.timer("server." + job.kind):
+                    job.future.set_result(self.__run(spymaster, job))
+            except HintCancelled as e:
+                job.future.set_exception(e)
+            except Exception as e:  # handed back to the request's thread
+                log.exception("Request failed")
+                job.future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.served += 1
+
+    @staticmethod
+    def __run(spymaster, job):
+        if job.kind == "legal":
+            return {"legal": bool(spymaster.check_legality(job.teams, job.hint))}
+
+        # a board the spymaster already has scored (e.g. a later turn of the same game, with fewer words left) is only
+        # reweighted, the vocabulary is only scored again for a word it hasn't seen
+        board = [word for team in TEAMS for word in job.teams[team] if word in spymaster.word_model.vocab]
+        if any(word not in spymaster.board_index for word in board):
+            spymaster.start_game(board)
+        overlaps = spymaster.run_defined_round(ts=job.teams["t"], os=job.teams["o"], bs=job.teams["b"],
+                                               ks=job.teams["k"], cancel=job.cancel)
+        return round_record(spymaster.team_words, overlaps)
+
+    def health(self):
+        with self.lock:
+            status = "ok" if self.ready.is_set() else "loading" if self.load_error is None else "failed"
+            return {"status": status, "load_error": self.load_error,
+                    "spymasters": len(self.workers), "busy": self.busy, "queued": self.jobs.qsize(),
+                    "queue_size": self.jobs.maxsize, "served": self.served, "rejected": self.rejected,
+                    "uptime": monotonic() - self.started}
+
+
+class _HintHandler(BaseHTTPRequestHandler):
+    service = None  # set by serve
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.__reply(200, self.service.health())
+        elif self.path == "/metrics":
+            self.__reply(200, metrics.snapshot())
+        elif self.path == "/game_words":
+            if self.__loaded():
+                self.__reply(200, {"game_words": self.service.game_words})
+        else:
+            self.__reply(404, {"error": "no such path {0}".format(self.path)})
+
+    def do_POST(self):
+        if self.path not in ["/round", "/legal"]:
+            self.__reply(404, {"error": "no such path {0}".format(self.path)})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            teams = body["teams"]
+            if not isinstance(teams, dict):
+                raise TypeError("teams must be an object of team: [words]")
+            hint = body["hint"] if self.path == "/legal" else None
+        except (ValueError, KeyError, TypeError) as e:
+            self.__reply(400, {"error": "bad request: {0}".format(e)})
+            return
+        if not self.__loaded():
+            return
+
+        try:
+            job = self.service.submit(self.path[1:], teams, hint)
+            self.__reply(200, self.service.result(job))
+        except ServerBusy as e:
+            self.__reply(503, {"error": str(e)}, retry_after=1)
+        except FutureTimeout:
+            self.__reply(504, {"error": "no answer within {0}s".format(self.service.request_timeout)})
+        except Exception as e:
+            self.__reply(500, {"error": "{0}: {1}".format(type(e).__name__, e)})
+
+    def __loaded(self):
+        # replies that the spymasters aren't ready yet, if they aren't
+        if self.service.ready.is_set():
+            return True
+        if self.service.load_error is not None:
+            self.__reply(500, {"error": "spymasters failed to load: " + self.service.load_error})
+        else:
+            self.__reply(503, {"error": "spymasters still loading"}, retry_after=5)
+        return False
+
+    def __reply(self, status, body, retry_after=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        log.debug("%s - " + fmt, self.address_string(), *args)
+
+
+def serve(service, host="127.0.0.1", port=8765):
+    # starts answering straight away (health checks report "loading") and loads the spymasters in the background
+    handler = type("HintHandler", (_HintHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    Thread(target=service.load, name="spymaster-load", daemon=True).start()
+    log.info("Hint server listening on {0}:{1}".format(*server.server_address))
+    return server
+
+
+class HintClient:
+    # a spymaster on a hint server, busy (or still loading) responses are retried after the server's Retry-After
+    # settings are the few a spymaster's users read, from the same settings file
+    def __init__(self, url="http://127.0.0.1:8765", retries=4, timeout=120.0,
+                 settings_file="settings/spymaster_setts.txt"):
+        self.url = url.rstrip("/")
+        self.retries = retries
+        self.timeout = timeout
+        self.settings = load_settings(sett_file=settings_file, default_dict={"game_hint_naive_method": False})
+        self.team_sizes = load_settings(sett_file="settings/team_sizes.txt",  # for random rounds
+                                        default_dict={"t": 8, "o": 8, "k": 1, "b": 8})
+        self.__game_words = None
+        import requests as req  # only clients need it
+        self.session = req.Session()
+
+    def __request(self, method, path, body=None):
+        for attempt in range(self.retries + 1):
+            response = self.session.request(method, self.url + path, json=body, timeout=self.timeout)
+            if response.status_code != 503 or attempt == self.retries:
+                break
+            sleep(int(response.headers.get("Retry-After", "1")))
+        if response.status_code == 503:
+            raise ServerBusy(response.json().get("error", "server busy"))
+        response.raise_for_status()
+        return response.json()
+
+    def __post(self, path, body):
+        return self.__request("POST", path, body)
+
+    @property
+    def game_words(self):
+        # the server's spymasters' game words, asked for once
+        if self.__game_words is None:
+            self.__game_words = self.__request("GET", "/game_words")["game_words"]
+        return self.__game_words
+
+    def start_game(self, board_words):
+        # nothing to do, the server scores a board the first time a round on it is asked for
+        pass
+
+    def run_defined_round(self, ts: list, os: list, bs: list, ks: list, progress=None, cancel=None):
+        # progress and cancel as a spymaster's, so a HintWorker can run it, though progress only hears when it's done
+        overlaps = record_hints(self.__post("/round", {"teams": {"t": ts, "o": os, "b": bs, "k": ks}}))
+        if cancel is not None and cancel.is_set():
+            raise HintCancelled("Round cancelled")
+        if progress is not None:
+            progress(1.0, "done")
+        # targets as tuples, as a spymaster gives them
+        return {level: [(tuple(targets), hint) for targets, hint in hints] for level, hints in overlaps.items()}
+
+    def run_random_rounds(self, num_rounds, out_file, seed=0, report_every=100):
+        # as a spymaster's, round n is dealt with seed + n from the same game words so it's the same board
+        writer = out_file if isinstance(out_file, RoundWriter) else RoundWriter(out_file)
+        start = perf_counter()
+        try:
+            for n in range(num_rounds):
+                teams = deal_teams(self.game_words, self.team_sizes, rand.Random(seed + n))
+                record = {"seed": seed + n}
+                record.update(self.__post("/round", {"teams": teams}))
+                writer.write(record)
+                if (n + 1) % report_every == 0 or n + 1 == num_rounds:
+                    elapsed = perf_counter() - start
+                    log.info("{0}/{1} rounds, {2:.2f} rounds/s".format(n + 1, num_rounds, (n + 1) / elapsed))
+        finally:
+            if writer is not out_file:
+                writer.close()
+        elapsed = perf_counter() - start
+        return {"rounds": num_rounds, "seconds": elapsed, "rounds_per_second": num_rounds / max(elapsed, 1e-9)}
+
+    def check_legality(self, team_words, hint_word: str) -> bool:
+        return self.__post("/legal", {"teams": team_words, "hint": hint_word})["legal"]
+
+    def health(self):
+        return self.session.get(self.url + "/health", timeout=self.timeout).json()
+
+    def close(self):
+        self.session.close()
+
+
+def main():
+    settings = load_settings(sett_file="settings/hint_server_setts.txt",
+                             default_dict={"host": "127.0.0.1", "port": 8765, "spymasters": 1, "queue_size": 32,
+                                           "request_timeout": 60.0})
+    parser = argparse.ArgumentParser(description="Serve hints from warm spymasters over local HTTP")
+    parser.add_argument("--host", default=settings["host"])
+    parser.add_argument("--port", type=int, default=settings["port"])
+    parser.add_argument("--spymasters", type=int, default=settings["spymasters"],
+                        help="spymasters kept loaded, the most requests worked on at once")
+    parser.add_argument("--queue-size", type=int, default=settings["queue_size"],
+                        help="requests that can wait for a spymaster before more are turned away")
+    parser.add_argument("--timeout", type=float, default=settings["request_timeout"],
+                        help="seconds a request can take before it's cancelled")
+    args = parser.parse_args()
+
+    log_setup.start_logging(log.getLogger(), [log_setup.file_handler("logs/hint-server-log.txt"),
+                                              log_setup.stream_handler()], level=log.INFO)
+    service = HintService(spymasters=args.spymasters, queue_size=args.queue_size, request_timeout=args.timeout)
+    server = serve(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log_setup.stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from threading import Event, Thread
+
+from spymaster import HintCancelled
+
+
+class HintWorker:
+    # runs a spymaster's run_defined_round on a background thread so the pygame loop can keep drawing,
+    # poll ready() each frame and take() the overlaps once it is
+    # board is given on the spymaster's first turn of a game, it's scored (start_game) on the same thread first
+    def __init__(self, spymaster, ts: list, os: list, bs: list, ks: list, board=None):
+        self.spymaster = spymaster
+        self.progress = 0.0  # fraction of the round done
+        self.stage = "starting"
+        self.overlaps = None
+        self.error = None
+        self.cancelled = Event()
+        self.finished = Event()
+
+        # copies, the game keeps changing its own team lists
+        self.thread = Thread(target=self.__run, args=(list(ts), list(os), list(bs), list(ks),
+                                                      list(board) if board is not None else None), daemon=True)
+        self.thread.start()
+
+    def __run(self, ts, os, bs, ks, board):
+        try:
+            if board is not None:
+                self.__progress(0.0, "scoring board")
+                self.spymaster.start_game(board)
+            if self.cancelled.is_set():
+                raise HintCancelled("Round cancelled after scoring board")
+            self.overlaps = self.spymaster.run_defined_round(ts=ts, os=os, bs=bs, ks=ks,
+                                                             progress=self.__progress, cancel=self.cancelled)
+        except HintCancelled:
+            pass
+        except Exception as e:  # handed back to the game thread by take()
+            self.error = e
+        finally:
+            self.finished.set()
+
+    def __progress(self, done, stage):
+        self.progress = done
+        self.stage = stage
+
+    def ready(self):
+        return self.finished.is_set() and not self.cancelled.is_set()
+
+    def take(self):
+        if self.error is not None:
+            raise self.error
+        return self.overlaps
+
+    def cancel(self, wait=False):
+        # the round stops at its next stage, wait blocks until it has so the spymaster can safely be reused
+        self.cancelled.set()
+        if wait:
+            self.thread.join()
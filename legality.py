@@ -0,0 +1,129 @@
+from itertools import chain
+
+import metrics
+
+# only lemma_ is ever read, which spaCy 3 works out from the tagger's tags with the attribute ruler and lemmatizer,
+# everything else in the pipeline is left out
+LEMMATISER_EXCLUDE = ["parser", "ner", "senter"]
+
+
+def load_lemmatiser(model="en_core_web_sm"):
+    import spacy
+    with metrics.timer("spacy_load"):
+        if int(spacy.__version__.split(".")[0]) >= 3:
+            return spacy.load(model, exclude=LEMMATISER_EXCLUDE)  # excluded components aren't even read from disk
+        return spacy.load(model, disable=["parser", "ner"])  # spaCy 2 lemmatises from the tagger's tags too
+
+
+class LegalityChecker:
+    # decides whether hints are legal for a board, anything that only depends on the board is worked out once per
+    # board and anything that only depends on the hint is remembered between rounds
+    # spaCy, the stemmer, enchant and regex are only loaded the first time they're needed (see __getattr__), so
+    # nothing is loaded making one and checks that don't lemmatise never load spaCy
+    def __init__(self, spacy_nlp=None, stemmer=None, lang="en_US", batch_size=256, spacy_model="en_core_web_sm"):
+        if spacy_nlp is not None:
+            self.spacy_nlp = spacy_nlp  # lemmatiser
+        if stemmer is not None:
+            self.stemmer = stemmer
+        self.lang = lang  # US not UK due to word model using US dict
+        self.spacy_model = spacy_model
+        self.batch_size = batch_size
+
+        # per word memos, kept across rounds
+        self.lemma_stems = dict()
+        self.in_dictionary = dict()
+        self.alphabetic = dict()
+        self.patterns = dict()
+
+        # per board state
+        self.board_words = tuple()
+        self.board_lemma_stems = set()
+        self.board_patterns = list()
+
+    def load(self):
+        # loads everything now rather than when first needed, e.g. so a server's first request isn't slow
+        for name in ["spacy_nlp", "stemmer", "dictionary", "re", "non_alpha"]:
+            getattr(self, name)
+        return self
+
+    def set_board(self, team_words):
+        board_words = tuple(chain.from_iterable(team_words.values()))
+        if board_words == self.board_words:
+            return
+
+        self.board_words = board_words
+        # board words are lemmatised together so each one is tagged in the context of the others
+        self.board_lemma_stems = {self.stemmer.stem(token.lemma_) for token in
+                                  self.spacy_nlp(" ".join([word for word in board_words]))}
+        self.board_patterns = [self.__pattern(bw) for bw in board_words]
+
+    def check(self, hint):
+        return self.check_many([hint])[0]
+
+    def check_many(self, hints):
+        # lemmatise every hint not seen before in one pass, rather than one spacy call per hint
+        unseen = list(dict.fromkeys([hint for hint in hints if hint not in self.lemma_stems]))
+        with metrics.timer("legality.lemmatise"):
+            for hint, doc in zip(unseen, self.spacy_nlp.pipe(unseen, batch_size=self.batch_size)):
+                self.lemma_stems[hint] = self.stemmer.stem([token.lemma_ for token in doc][0])
+
+        metrics.count("legality.checked", len(hints))
+        return [self.__is_legal(hint) for hint in hints]
+
+    def __is_legal(self, hint):
+        if self.lemma_stems[hint] in self.board_lemma_stems:
+            metrics.count("legality.rejected.same_root")
+            return False  # illegal due to same root as a board word
+
+        hint_pattern = self.__pattern(hint)
+        if any(hint_pattern.match(bw) for bw in self.board_words):
+            metrics.count("legality.rejected.board_word_in_hint")
+            return False  # board word contained within hint
+        if any(pattern.match(hint) for pattern in self.board_patterns):
+            metrics.count("legality.rejected.hint_in_board_word")
+            return False  # hint contained within board word
+
+        return self.board_independent_legal(hint)
+
+    def board_independent_legal(self, hint, remember=True):
+        # the checks that don't depend on the board, words failing these can never be hints (see build_candidates.py)
+        alphabetic = self.alphabetic[hint] if hint in self.alphabetic else self.non_alpha.match(hint) is None
+        if remember:
+            self.alphabetic[hint] = alphabetic
+        if not alphabetic:
+            metrics.count("legality.rejected.non_alphabetic")
+            return False  # word contains non-alphabetic chars
+
+        in_dictionary = self.in_dictionary[hint] if hint in self.in_dictionary else self.dictionary.check(hint)
+        if remember:
+            self.in_dictionary[hint] = in_dictionary
+        if not in_dictionary:
+            metrics.count("legality.rejected.not_in_dictionary")
+            return False  # word not in US dictionary
+
+        return True
+
+    def __pattern(self, word):
+        if word not in self.patterns:
+            self.patterns[word] = self.re.compile(self.re.escape(".*{}.*".format(word)))
+        return self.patterns[word]
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't set yet, each is loaded and set the first time it's used
+        if name == "spacy_nlp":
+            value = load_lemmatiser(self.spacy_model)
+        elif name == "stemmer":
+            from nltk.stem.lancaster import LancasterStemmer
+            value = LancasterStemmer()
+        elif name == "dictionary":
+            import enchant
+            value = enchant.Dict(self.lang)
+        elif name == "re":
+            import regex
+            value = regex
+        elif name == "non_alpha":
+            value = self.re.compile(r"[^a-z]")
+        else:
+            raise AttributeError("{0} has no attribute {1}".format(type(self).__name__, name))
+        setattr(self, name, value)
+        return value
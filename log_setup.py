@@ -0,0 +1,107 @@
+import atexit
+import json
+import logging as log
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+"""
+Logging that stays off the hot path, e.g.
+    full_log = log_setup.start_logging("spymaster-full", [log_setup.file_handler("logs/spymaster-log.txt")])
+    full_log.debug("Hints for %s: %s", log_setup.Joined(", ", targets), log_setup.Joined(" // ", hints, "{0[0]}"))
+    full_log.debug("Round results", extra={"data": record})
+Loggers only put records on a queue, a listener thread formats and writes them. Arguments are kept as they are until
+then (and never formatted at all if the level is off), so anything logged mustn't be changed afterwards.
+Structured data passed as extra={"data": ...} is written as JSON, after the message or, with json_lines, as one JSON
+object per record
+"""
+
+FORMAT = "%(asctime)s.%(msecs)03d : %(levelname)s : %(message)s"
+DATEFMT = "%d/%m - %H:%M:%S"
+
+
+class Joined:
+    # sep.join of the items formatted with fmt, only done if the record is written
+    def __init__(self, sep, items, fmt="{0}"):
+        self.sep = sep
+        self.items = items
+        self.fmt = fmt
+
+    def __str__(self):
+        return self.sep.join(self.fmt.format(item) for item in self.items)
+
+
+class StructuredFormatter(log.Formatter):
+    # the usual text line, with any structured data after it as JSON
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, "data", None) is not None:
+            line += " " + json.dumps(record.data)
+        return line
+
+
+class JsonFormatter(log.Formatter):
+    # one JSON object per record
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name, "module": record.module,
+                 "message": record.getMessage()}
+        if getattr(record, "data", None) is not None:
+            entry["data"] = record.data
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(QueueHandler):
+    # QueueHandler formats each record before queueing it, on the logging thread, this leaves it to the listener
+    def prepare(self, record):
+        return record
+
+
+def file_handler(log_file, level=log.DEBUG, mode="a", json_lines=False, fmt=FORMAT, datefmt=DATEFMT):
+    handler = log.FileHandler(log_file, mode, "utf-8", delay=True)
+    handler.setLevel(level)
+    handler.setFormatter(JsonFormatter() if json_lines else StructuredFormatter(fmt, datefmt=datefmt))
+    return handler
+
+
+def stream_handler(level=log.INFO, fmt=FORMAT, datefmt=DATEFMT):
+    handler = log.StreamHandler()
+    handler.setLevel(level)
+    handler.setFormatter(StructuredFormatter(fmt, datefmt=datefmt))
+    return handler
+
+
+_listeners = dict()  # logger name -> (logger, queue handler, listener)
+
+
+def start_logging(logger, handlers, level=log.DEBUG):
+    # routes logger (a logger or its name) to handlers through a background listener, replacing any handlers it
+    # was given here before
+    logger = log.getLogger(logger) if isinstance(logger, str) else logger
+    stop_logging(logger)
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    handler = DeferredQueueHandler(records)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    _listeners[logger.name] = (logger, handler, listener)
+    return logger
+
+
+def stop_logging(logger=None):
+    # writes out everything still queued and closes the handlers, of every logger if none is given
+    names = list(_listeners.keys()) if logger is None else \
+        [logger if isinstance(logger, str) else logger.name]
+    for name in names:
+        if name not in _listeners:
+            continue
+        logger, handler, listener = _listeners.pop(name)
+        logger.removeHandler(handler)
+        listener.stop()
+        for target in listener.handlers:
+            target.close()
+
+
+atexit.register(stop_logging)
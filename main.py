@@ -1,8 +1,41 @@
+import argparse
+
+import log_setup
+import metrics
 from field_operative import FieldOperative
+from hint_server import HintClient
 from spymaster import SpyMaster
 
-sm = SpyMaster()
-sm.run_random_round(out_file="results.txt")
-ag = FieldOperative()
-ag.load_results_from_file("results.txt")
-ag.evaluate_hints_to_file("evaluation.txt")
+parser = argparse.ArgumentParser(description="Generate hints for random boards and evaluate them")
+parser.add_argument("--rounds", type=int, default=1, help="number of random boards")
+parser.add_argument("--seed", type=int, default=0, help="round n is dealt with seed + n")
+parser.add_argument("--results", default="results.jsonl", help="file to stream each round's hints to")
+parser.add_argument("--evaluation", default="evaluation.jsonl", help="file to stream evaluated rounds to")
+parser.add_argument("--no-eval", action="store_true", help="only generate hints")
+parser.add_argument("--metrics", default=None, help="file to append timing and counter snapshots to")
+parser.add_argument("--metrics-interval", type=float, default=60.0, help="seconds between metrics snapshots")
+parser.add_argument("--log", default=None, help="file to write the spymaster's full debug log to")
+parser.add_argument("--log-json", action="store_true", help="write the log as one JSON object per line")
+parser.add_argument("--hint-server", default=None,
+                    help="url of a hint server (see hint_server.py) to get hints from rather than loading a spymaster")
+args = parser.parse_args()
+
+if args.metrics is not None:
+    metrics.start_dump(args.metrics, interval=args.metrics_interval)
+
+full_log = None
+if args.log is not None:
+    full_log = log_setup.start_logging("spymaster-full", [log_setup.file_handler(args.log, json_lines=args.log_json)])
+
+sm = HintClient(args.hint_server) if args.hint_server is not None else SpyMaster(full_log=full_log)
+stats = sm.run_random_rounds(args.rounds, out_file=args.results, seed=args.seed)
+print("Generated {0} rounds in {1:.1f}s ({2:.2f} rounds/s)".format(stats["rounds"], stats["seconds"],
+                                                                   stats["rounds_per_second"]))
+if not args.no_eval:
+    ag = FieldOperative()
+    ag.evaluate_rounds_to_file(args.results, args.evaluation)
+    ag.close()
+if args.hint_server is not None:
+    sm.close()
+metrics.stop_dump()
+log_setup.stop_logging()
@@ -0,0 +1,129 @@
+import json
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+from threading import Event, Lock, Thread
+from time import perf_counter_ns, time
+
+import numpy as np
+
+"""
+In process timers and counters, e.g.
+    with metrics.timer("search"):
+        ...
+    metrics.count("legality.rejected.same_root")
+    metrics.snapshot()  # {"timers": {"search": {"count": .., "mean": .., "p50": .., ...}}, "counters": {..}}
+Timer percentiles are over each timer's most recent max_samples calls, counts and totals are over every call.
+start_dump appends a snapshot to a JSON Lines file every interval seconds
+"""
+
+
+class Metrics:
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.lock = Lock()
+        self.samples = dict()  # timer name -> recent durations in ns
+        self.totals = dict()  # timer name -> [calls, total ns]
+        self.counters = Counter()
+
+    @contextmanager
+    def timer(self, name):
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter_ns() - start)
+
+    def timed(self, name):
+        # decorator version of timer
+        def decorator(func):
+            @wraps(func)
+            def timed_func(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return timed_func
+        return decorator
+
+    def record(self, name, nanoseconds):
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.max_samples)
+                self.totals[name] = [0, 0]
+            self.samples[name].append(nanoseconds)
+            self.totals[name][0] += 1
+            self.totals[name][1] += nanoseconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        # timings in seconds
+        with self.lock:
+            samples = {name: np.array(times, dtype=np.float64) / 1e9 for name, times in self.samples.items()}
+            totals = {name: list(total) for name, total in self.totals.items()}
+            counters = dict(self.counters)
+        timers = dict()
+        for name, times in samples.items():
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            timers[name] = {"count": totals[name][0], "total": totals[name][1] / 1e9,
+                            "mean": totals[name][1] / 1e9 / totals[name][0],
+                            "p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(times.max())}
+        return {"timers": timers, "counters": counters}
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.totals.clear()
+            self.counters.clear()
+
+
+class MetricsDumper:
+    # appends a snapshot of metrics to out_file every interval seconds, and once more when stopped
+    def __init__(self, metrics, out_file, interval=60.0):
+        self.metrics = metrics
+        self.out_file = out_file
+        self.interval = interval
+        self.stopped = Event()
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        snapshot = self.metrics.snapshot()
+        snapshot["time"] = time()
+        with open(self.out_file, "a") as outf:
+            outf.write(json.dumps(snapshot) + "\n")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.dump()
+
+
+# process wide metrics, everything in the pipeline records to these
+metrics = Metrics()
+timer = metrics.timer
+timed = metrics.timed
+record = metrics.record
+count = metrics.count
+snapshot = metrics.snapshot
+reset = metrics.reset
+_dumper = None
+
+
+def start_dump(out_file, interval=60.0):
+    global _dumper
+    stop_dump()
+    _dumper = MetricsDumper(metrics, out_file, interval)
+    return _dumper
+
+
+def stop_dump():
+    global _dumper
+    if _dumper is not None:
+        _dumper.stop()
+        _dumper = None
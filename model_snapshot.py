@@ -0,0 +1,318 @@
+import argparse
+import json
+import logging as log
+import mmap
+import os
+import pickle
+import zlib
+from hashlib import sha1
+from time import perf_counter
+
+import numpy as np
+
+"""
+A word model and everything the spymaster derives from it packed into one file that is memory mapped when loaded, e.g.
+    python model_snapshot.py models/glove-wiki-100.bin --hnsw
+The file holds the L2 normalised vectors, the vocabulary (with a hash table to look words up in), the legal hint
+candidates and their vectors gathered into a matrix of their own, the game words' indices and optionally an hnsw
+graph. Nothing is parsed or copied on load (apart from the
+hnsw graph, which hnswlib can only load into its own memory), pages are read in as they're used and are shared with
+every other process mapping the same file. Layout:
+    b"SMSNAP01", header length (uint64), JSON header, then each section, 64 byte aligned, at the offset (from the end
+    of the header) the header gives along with its dtype and shape
+"""
+
+MAGIC = b"SMSNAP01"
+ALIGN = 64
+EMPTY = -1  # an unused hash table slot
+
+
+def word_hash(word_bytes):
+    return zlib.crc32(word_bytes)
+
+
+def words_hash(words):
+    # identifies the list of game words a snapshot's game word indices were worked out from
+    return sha1("\n".join(words).encode("utf-8")).hexdigest()
+
+
+class _VocabEntry:
+    # what gensim's vocab gives for a word, only the index is ever used
+    __slots__ = ["index"]
+
+    def __init__(self, index):
+        self.index = index
+
+
+class SnapshotVocab:
+    # word -> entry with the word's index, like a gensim model's vocab, looked up in the snapshot's hash table
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __contains__(self, word):
+        return self.snapshot.index(word) is not None
+
+    def __getitem__(self, word):
+        index = self.snapshot.index(word)
+        if index is None:
+            raise KeyError(word)
+        return _VocabEntry(index)
+
+    def get(self, word, default=None):
+        index = self.snapshot.index(word)
+        return _VocabEntry(index) if index is not None else default
+
+    def __len__(self):
+        return self.snapshot.vocab_size
+
+    def __iter__(self):
+        return iter(self.snapshot.index2word)
+
+
+class SnapshotWords:
+    # index -> word, like a gensim model's index2word, words are decoded as they're asked for
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return self.snapshot.vocab_size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.snapshot.word(i) for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.snapshot.word(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.snapshot.word(index)
+
+
+class SnapshotModel:
+    # stands in for a gensim KeyedVectors loaded with init_sims(replace=True), which is all the spymaster needs
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.vectors = snapshot.arrays["vectors"]
+        self.vectors_norm = self.vectors
+        self.vector_size = self.vectors.shape[1]
+        self.vocab = SnapshotVocab(snapshot)
+        self.index2word = SnapshotWords(snapshot)
+        self.quantized = None
+
+
+class ModelSnapshot:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as snap_file:
+            self.mm = mmap.mmap(snap_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} isn't a model snapshot".format(path))
+        header_length = int(np.frombuffer(self.mm, dtype=np.uint64, count=1, offset=len(MAGIC))[0])
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self.mm[start:start + header_length]).decode("utf-8"))
+        data_start = aligned(start + header_length)
+
+        # read only views straight onto the mapped file
+        self.arrays = dict()
+        for name, section in self.header["sections"].items():
+            self.arrays[name] = np.frombuffer(self.mm, dtype=section["dtype"], count=int(np.prod(section["shape"])),
+                                              offset=data_start + section["offset"]).reshape(section["shape"])
+        self.vocab_size = self.header["vocab_size"]
+        self.word_offsets = self.arrays["word_offsets"]
+        self.words_start = data_start + self.header["sections"]["words"]["offset"]
+        self.slots = self.arrays["hash_slots"]
+        self.mask = len(self.slots) - 1
+
+    def word(self, index):
+        start = self.words_start + int(self.word_offsets[index])
+        end = self.words_start + int(self.word_offsets[index + 1])
+        return self.mm[start:end].decode("utf-8")
+
+    def index(self, word):
+        # the word's vocab index, None if it isn't in the vocabulary
+        key = word.encode("utf-8")
+        slot = word_hash(key) & self.mask
+        while True:
+            index = int(self.slots[slot])
+            if index == EMPTY:
+                return None
+            start = self.words_start + int(self.word_offsets[index])
+            end = self.words_start + int(self.word_offsets[index + 1])
+            if end - start == len(key) and self.mm[start:end] == key:
+                return index
+            slot = (slot + 1) & self.mask
+
+    def model(self):
+        return SnapshotModel(self)
+
+    def candidates(self):
+        return self.arrays.get("candidates", None)
+
+    def candidate_vectors(self, count):
+        # normalised vectors of the first count candidates, a view onto the file, candidates are sorted so those below
+        # any vocab_limit are always the first ones
+        if "candidate_vectors" not in self.arrays:
+            return None
+        return self.arrays["candidate_vectors"][:count]
+
+    def game_words(self, file_words):
+        # the game words the model knows in file order, if the snapshot was built from these words, else None
+        if "game_words" not in self.arrays or self.header.get("game_words_hash", None) != words_hash(file_words):
+            return None
+        return [self.word(index) for index in self.arrays["game_words"]]
+
+    def hnsw_index(self, key):
+        # the hnsw graph built with the settings in key (see nn_backends.HnswBackend), None if it wasn't
+        if "hnsw" not in self.arrays or self.header["hnsw"]["key"] != list(key[1:]):
+            return None
+        return pickle.loads(self.arrays["hnsw"])
+
+
+def aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def build_snapshot(model_file, out_path=None, words_file="settings/game_words.txt", candidates_file=None,
+                   hnsw=False, hnsw_m=16, hnsw_ef_construction=200, vocab_limit=0, block_size=65536):
+    # vocab_limit is the spymaster setting the hnsw graph will be used with, it only covers the words below it
+    from gensim.models import KeyedVectors
+
+    import word_models
+
+    model_name = os.path.splitext(os.path.basename(model_file))[0]
+    model_dir = os.path.dirname(os.path.abspath(model_file))
+    out_path = out_path if out_path is not None else os.path.join(model_dir, word_models.snapshot_file(model_name))
+    candidates_file = candidates_file if candidates_file is not None else \
+        os.path.join(model_dir, word_models.candidates_file(model_name))
+
+    start = perf_counter()
+    log.info("Loading {0}".format(model_file))
+    word_model = KeyedVectors.load(model_file, mmap="r")
+    vocab_size, vector_size = word_model.vectors.shape
+    vocab_hash = word_models.vocab_hash(word_model)
+
+    # vocabulary as one utf-8 blob, plus an open addressed hash table of word -> index at most half full
+    encoded = [word.encode("utf-8") for word in word_model.index2word]
+    word_offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    word_offsets[1:] = np.cumsum([len(word) for word in encoded])
+    num_slots = 1 << max(int(2 * vocab_size - 1).bit_length(), 1)
+    slots = [EMPTY] * num_slots
+    for index, word in enumerate(encoded):
+        slot = word_hash(word) & (num_slots - 1)
+        while slots[slot] != EMPTY:
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot] = index
+
+    sections = {"vectors": ((vocab_size, vector_size), np.float32),
+                "words": ((int(word_offsets[-1]),), np.uint8),
+                "word_offsets": (word_offsets.shape, np.int64),
+                "hash_slots": ((num_slots,), np.int32)}
+    arrays = {"word_offsets": word_offsets, "hash_slots": np.array(slots, dtype=np.int32)}
+    header = {"model_name": model_name, "vocab_size": vocab_size, "vector_size": vector_size,
+              "vocab_hash": vocab_hash}
+
+    if os.path.exists(candidates_file):
+        saved = np.load(candidates_file)
+        if str(saved["vocab_hash"]) == vocab_hash:
+            arrays["candidates"] = saved["indices"].astype(np.int64)
+            sections["candidates"] = (arrays["candidates"].shape, np.int64)
+            sections["candidate_vectors"] = ((len(arrays["candidates"]), vector_size), np.float32)
+        else:
+            log.warning("{0} was built for a different vocabulary, leaving candidates out".format(candidates_file))
+
+    if words_file is not None:
+        file_words = [w.replace(" ", "_").strip() for w in open(words_file, "r").readlines()]
+        arrays["game_words"] = np.array([word_model.vocab[w].index for w in file_words if w in word_model.vocab],
+                                        dtype=np.int64)
+        sections["game_words"] = (arrays["game_words"].shape, np.int64)
+        header["game_words_hash"] = words_hash(file_words)
+
+    def normalised_blocks(rows=None):
+        # normalised vectors of the given rows (every row if None) a block at a time
+        total = vocab_size if rows is None else len(rows)
+        for block_start in range(0, total, block_size):
+            block_rows = slice(block_start, block_start + block_size) if rows is None else \
+                rows[block_start:block_start + block_size]
+            block = np.asarray(word_model.vectors[block_rows], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1)
+            norms[norms == 0] = 1
+            yield block_rows, block / norms[:, None]
+
+    if hnsw:
+        import hnswlib
+
+        # labelled, limited and keyed the same way HnswBackend builds it, so it can be used in place of building one
+        limit = min(vocab_limit, vocab_size) if vocab_limit > 0 else vocab_size
+        rows = arrays["candidates"] if "candidates" in arrays else np.arange(vocab_size)
+        rows = rows[rows < limit]
+        index = hnswlib.Index(space="ip", dim=vector_size)
+        index.init_index(max_elements=len(rows), M=hnsw_m, ef_construction=hnsw_ef_construction)
+        log.info("Building hnsw graph over {0} words".format(len(rows)))
+        for block_rows, block in normalised_blocks(rows):
+            index.add_items(block, block_rows)
+        arrays["hnsw"] = np.frombuffer(pickle.dumps(index), dtype=np.uint8)
+        sections["hnsw"] = (arrays["hnsw"].shape, np.uint8)
+        header["hnsw"] = {"key": [limit, hnsw_m, hnsw_ef_construction, "candidates" if len(rows) < limit else "all"]}
+
+    offset = 0
+    header["sections"] = dict()
+    for name, (shape, dtype) in sections.items():
+        header["sections"][name] = {"offset": offset, "dtype": np.dtype(dtype).str, "shape": list(shape)}
+        offset = aligned(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    log.info("Writing {0}".format(out_path))
+    with open(out_path + ".tmp", "wb") as out_file:
+        out_file.write(MAGIC)
+        out_file.write(np.uint64(len(header_bytes)).tobytes())
+        out_file.write(header_bytes)
+        for name, section in header["sections"].items():
+            out_file.seek(data_start + section["offset"])
+            if name == "vectors":
+                for block_rows, block in normalised_blocks():
+                    out_file.write(block.tobytes())
+            elif name == "candidate_vectors":
+                for block_rows, block in normalised_blocks(arrays["candidates"]):
+                    out_file.write(block.tobytes())
+            elif name == "words":
+                out_file.write(b"".join(encoded))
+            else:
+                out_file.write(np.ascontiguousarray(arrays[name]).tobytes())
+        out_file.truncate(data_start + offset)
+    os.replace(out_path + ".tmp", out_path)  # a half written snapshot is never left where it would be loaded
+
+    build_time = perf_counter() - start
+    log.info("Saved snapshot of {0} ({1} words) in {2:.1f}s".format(model_name, vocab_size, build_time))
+    return out_path, os.path.getsize(out_path), build_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a word model into a memory mapped snapshot for fast loading")
+    parser.add_argument("model", help="path of a saved KeyedVectors model")
+    parser.add_argument("--out", default=None, help="snapshot file, defaults to next to the model")
+    parser.add_argument("--words", default="settings/game_words.txt", help="game words to store the indices of")
+    parser.add_argument("--candidates", default=None, help="legal candidates (see build_candidates.py), "
+                                                           "defaults to the ones next to the model")
+    parser.add_argument("--hnsw", action="store_true", help="also build and store an hnsw graph")
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--hnsw-ef-construction", type=int, default=200)
+    parser.add_argument("--vocab-limit", type=int, default=0,
+                        help="the spymaster's vocab_limit, the hnsw graph only covers the words below it")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/build-log.txt", level=log.INFO)
+    out_path, size, build_time = build_snapshot(args.model, args.out, words_file=args.words,
+                                                candidates_file=args.candidates, hnsw=args.hnsw,
+                                                hnsw_m=args.hnsw_m, hnsw_ef_construction=args.hnsw_ef_construction,
+                                                vocab_limit=args.vocab_limit)
+    print("Wrote {0} ({1:.1f} MB) in {2:.1f}s".format(out_path, size / 2 ** 20, build_time))
+
+
+if __name__ == "__main__":
+    main()
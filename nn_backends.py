@@ -0,0 +1,210 @@
+import os
+from threading import Lock
+
+import numpy as np
+
+import word_models
+
+# process wide cache of built graph indexes, keyed by model name and build settings
+_hnsw_indexes = dict()
+_lock = Lock()
+
+
+def top_k_indices(matrix, queries, k, block_size, scales=None):
+    # scores every query against each row of matrix (one row per vocab word) in blocks of rows, keeping a running
+    # top-k per query so a block of vocab x queries scores is the most that is ever held in memory,
+    # returns k x queries arrays of row indices and scores, best first
+    k = min(k, len(matrix))
+
+    best_scores = np.empty((0, len(queries)), dtype=np.float32)
+    best_indices = np.empty((0, len(queries)), dtype=np.int64)
+    for start in range(0, len(matrix), block_size):
+        block_scores = np.dot(matrix[start:start + block_size], queries.T)
+        if scales is not None:
+            block_scores *= scales[start:start + block_size, None]  # int8 rows are stored divided by their scale
+        block_indices = np.broadcast_to(np.arange(start, start + len(block_scores))[:, None], block_scores.shape)
+        best_scores = np.concatenate([best_scores, block_scores])
+        best_indices = np.concatenate([best_indices, block_indices])
+        if len(best_scores) > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=0)[:k]
+            best_scores = np.take_along_axis(best_scores, keep, axis=0)
+            best_indices = np.take_along_axis(best_indices, keep, axis=0)
+
+    order = np.argsort(-best_scores, axis=0, kind="stable")
+    return np.take_along_axis(best_indices, order, axis=0), np.take_along_axis(best_scores, order, axis=0)
+
+
+def top_k(matrix, queries, excluded, topn, block_size, index2word, scales=None):
+    best_indices, best_scores = top_k_indices(matrix, queries, topn + max(len(e) for e in excluded), block_size,
+                                              scales=scales)
+    return to_words(best_indices, best_scores, excluded, topn, index2word)
+
+
+def to_words(best_indices, best_scores, excluded, topn, index2word):
+    results = []
+    for col in range(best_indices.shape[1]):
+        results.append([(index2word[index], float(score))
+                        for index, score in zip(best_indices[:, col], best_scores[:, col])
+                        if index not in excluded[col]][:topn])
+    return results
+
+
+class NearestNeighbourBackend:
+    # finds the vocab words closest (by cosine similarity) to each of a batch of unit length queries,
+    # search returns one [(word, score), ...] list per query, best first, never including that query's excluded indices
+    exact = False
+
+    def __init__(self, word_model, settings, full_log=None):
+        self.word_model = word_model
+        self.settings = settings
+        self.full_log = full_log
+
+    def search(self, queries, excluded, topn=50):
+        raise NotImplementedError
+
+
+class ExactBackend(NearestNeighbourBackend):
+    # brute force blocked dot product over the (optionally vocab_limit'ed) normalised vectors, for quantized models the
+    # compact matrix is scanned and the best rerank_candidates per query are then rescored exactly in float32
+    exact = True
+
+    def __init__(self, word_model, settings, full_log=None):
+        super().__init__(word_model, settings, full_log)
+        self.vectors, self.scales = word_models.scan_matrix(word_model, limit=settings["vocab_limit"])
+        self.quantized = getattr(word_model, "quantized", None) is not None
+
+        # vocab index of each row of vectors, None when every row is searched
+        self.rows = candidate_rows(word_model, settings, len(self.vectors), full_log=full_log)
+        if self.rows is not None:
+            self.vectors, self.scales = word_models.candidate_matrix(settings["model_name"], word_model, self.rows,
+                                                                     limit=settings["vocab_limit"])
+
+    def search(self, queries, excluded, topn=50):
+        return self.search_matrix(self.vectors, queries, queries, excluded, topn=topn, scales=self.scales)
+
+    def search_matrix(self, matrix, matrix_queries, queries, excluded, topn=50, scales=None):
+        # matrix_queries are scored against matrix, queries are the matching unit vectors used for exact reranking
+        # matrix has one row per row of self.vectors
+        k = topn + max(len(e) for e in excluded)
+        if not self.quantized:
+            best_indices, best_scores = top_k_indices(matrix, matrix_queries, k, self.settings["search_block_size"],
+                                                      scales=scales)
+            if self.rows is not None:
+                best_indices = self.rows[best_indices]
+            return to_words(best_indices, best_scores, excluded, topn, self.word_model.index2word)
+
+        candidates, approx = top_k_indices(matrix, matrix_queries, max(k, self.settings["rerank_candidates"]),
+                                           self.settings["search_block_size"], scales=scales)
+        if self.rows is not None:
+            candidates = self.rows[candidates]
+        # every query's candidates are rescored at once against the union of their exact vectors
+        rows, positions = np.unique(candidates, return_inverse=True)
+        exact = np.dot(word_models.unit_vectors(self.word_model, rows), queries.T)
+        scores = np.take_along_axis(exact, positions.reshape(candidates.shape), axis=0)
+
+        order = np.argsort(-scores, axis=0, kind="stable")
+        return to_words(np.take_along_axis(candidates, order, axis=0), np.take_along_axis(scores, order, axis=0),
+                        excluded, topn, self.word_model.index2word)
+
+
+class AnnoyBackend(NearestNeighbourBackend):
+    # prebuilt annoy forest (see build_indexes.py), queried one vector at a time
+    def __init__(self, word_model, settings, full_log=None):
+        super().__init__(word_model, settings, full_log)
+        self.indexer = word_models.get_indexer(settings["model_name"], num_trees=settings["annoy_trees"],
+                                               full_log=full_log)
+        if self.indexer is None:
+            raise ValueError("No usable annoy index for {0}".format(settings["model_name"]))
+
+        # an annoy index covers the whole vocabulary, so non candidates are dropped from what it returns instead
+        rows = candidate_rows(word_model, settings, len(word_model.index2word), full_log=full_log)
+        self.allowed = None if rows is None else {word_model.index2word[index] for index in rows}
+
+    def search(self, queries, excluded, topn=50):
+        # over fetch when filtering candidates, roughly in proportion to how much of the vocabulary they make up
+        fetch = topn if self.allowed is None else \
+            int(topn * len(self.word_model.index2word) / max(len(self.allowed), 1))
+        results = []
+        for query, ex in zip(queries, excluded):
+            words = [self.word_model.index2word[index] for index in ex]
+            results.append([(word, float(score)) for word, score in self.indexer.most_similar(query, fetch + len(ex))
+                            if word not in words and (self.allowed is None or word in self.allowed)][:topn])
+        return results
+
+
+class HnswBackend(NearestNeighbourBackend):
+    # hierarchical navigable small world graph (hnswlib), loaded from the models folder if already built there,
+    # otherwise built (and saved) on first use
+    def __init__(self, word_model, settings, full_log=None):
+        super().__init__(word_model, settings, full_log)
+        import hnswlib  # only needed when this backend is picked
+
+        vectors, scales = word_models.scan_matrix(word_model, limit=settings["vocab_limit"])
+        # only the legal candidates go into the graph, labelled with their vocab index
+        rows = candidate_rows(word_model, settings, len(vectors), full_log=full_log)
+        rows = rows if rows is not None else np.arange(len(vectors))
+        key = (settings["model_name"], len(vectors), settings["hnsw_m"], settings["hnsw_ef_construction"],
+               "candidates" if len(rows) < len(vectors) else "all")
+        index_path = os.path.join(word_models.MODELS_DIR, "{0}-{1}-hnsw-{2}-{3}-{4}.bin".format(*key))
+
+        with _lock:
+            self.index = _hnsw_indexes.get(key, None)
+            snapshot = getattr(word_model, "snapshot", None)
+            if self.index is None and snapshot is not None:
+                self.index = snapshot.hnsw_index(key)  # None unless the snapshot's was built with these settings
+                if self.index is not None and full_log is not None:
+                    full_log.debug("Loaded hnsw index from snapshot {0}".format(snapshot.path))
+            if self.index is None:
+                self.index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+                if os.path.exists(index_path):
+                    if full_log is not None:
+                        full_log.debug("Loading hnsw index {0}".format(index_path))
+                    self.index.load_index(index_path, max_elements=len(rows))
+                else:
+                    if full_log is not None:
+                        full_log.info("Building hnsw index for {0}, this will take a while...".format(key[0]))
+                    self.index.init_index(max_elements=len(rows), M=settings["hnsw_m"],
+                                          ef_construction=settings["hnsw_ef_construction"])
+                    for start in range(0, len(rows), settings["search_block_size"]):
+                        block_rows = rows[start:start + settings["search_block_size"]]
+                        block = np.asarray(vectors[block_rows], dtype=np.float32)
+                        if scales is not None:
+                            block *= scales[block_rows, None]
+                        self.index.add_items(block, block_rows)
+                    self.index.save_index(index_path)
+                _hnsw_indexes[key] = self.index
+
+    def search(self, queries, excluded, topn=50):
+        k = topn + max(len(e) for e in excluded)
+        self.index.set_ef(max(self.settings["hnsw_ef"], k))  # ef below k isn't allowed
+        labels, distances = self.index.knn_query(queries, k=k)
+        results = []
+        for row, ex in enumerate(excluded):
+            # inner product distance is 1 - similarity
+            results.append([(self.word_model.index2word[index], float(1 - distance))
+                            for index, distance in zip(labels[row], distances[row]) if index not in ex][:topn])
+        return results
+
+
+def candidate_rows(word_model, settings, limit, full_log=None):
+    # vocab indices (below limit) worth searching, None to search everything
+    if not settings["legal_candidates_only"]:
+        return None
+    rows = word_models.get_candidates(settings["model_name"], word_model, full_log=full_log)
+    return rows[rows < limit] if rows is not None else None
+
+
+BACKENDS = {"exact": ExactBackend, "annoy": AnnoyBackend, "hnsw": HnswBackend}
+
+
+def get_backend(name, word_model, settings, full_log=None):
+    if name not in BACKENDS:
+        if full_log is not None:
+            full_log.warning("Unknown nearest neighbour backend {0}, using exact".format(name))
+        name = "exact"
+    try:
+        return BACKENDS[name](word_model, settings, full_log=full_log)
+    except (ImportError, ValueError) as e:
+        if full_log is not None:
+            full_log.warning("Couldn't load {0} backend ({1}), using exact".format(name, e))
+        return ExactBackend(word_model, settings, full_log=full_log)
@@ -0,0 +1,130 @@
+import argparse
+import gzip
+import logging as log
+import os
+from time import perf_counter
+
+import numpy as np
+
+import word_models
+
+"""
+Offline stand in for the ConceptNet relatedness api, which scores pairs by the cosine similarity of their Numberbatch
+vectors. Build the model once from a Numberbatch release, e.g.
+    python numberbatch.py numberbatch-en-17.06.txt.gz
+which keeps only english terms and saves them as a KeyedVectors model in MODELS_DIR
+"""
+
+NUMBERBATCH_FILE = "conceptnet-numberbatch-300.bin"
+
+
+class NumberbatchRelatedness:
+    # same interface as ConceptNetClient, so FieldOperative can use either
+    def __init__(self, model_file=None):
+        self.model_file = model_file if model_file is not None else \
+            os.path.join(word_models.MODELS_DIR, NUMBERBATCH_FILE)
+        from gensim.models import KeyedVectors  # only needed once the numberbatch source is picked
+
+        log.info("Loading Numberbatch vectors from {0}".format(self.model_file))
+        # memory mapped, only the rows of the words being compared are ever read
+        self.word_model = KeyedVectors.load(self.model_file, mmap="r")
+        self.scores = dict()  # (hint, target) -> relatedness, filled by prefetch
+
+    def __term(self, word):
+        # conceptnet terms are lower case with _ between words, and a missing term has no relatedness to anything
+        term = word.strip().lower().replace(" ", "_")
+        return term if term in self.word_model.vocab else None
+
+    def related_to(self, hint: str, targets: list):
+        # relatedness of a hint to every target as one array, in the order of targets
+        scores = np.zeros(len(targets), dtype=np.float32)
+        hint_term = self.__term(hint)
+        if hint_term is None:
+            return scores
+        terms = [self.__term(target) for target in targets]
+        known = [i for i, term in enumerate(terms) if term is not None]
+        if len(known) == 0:
+            return scores
+
+        vectors = np.asarray(self.word_model.vectors[[self.word_model.vocab[hint_term].index] +
+                                                     [self.word_model.vocab[terms[i]].index for i in known]],
+                             dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1
+        vectors /= norms[:, None]
+        scores[known] = np.dot(vectors[1:], vectors[0])
+        return scores
+
+    def relatedness(self, hint: str, target: str):
+        score = self.scores.get((hint, target), None)
+        if score is None:
+            score = float(self.related_to(hint, [target])[0])
+        return score
+
+    def relatedness_many(self, pairs):
+        # scored the same way as prefetch, but handed straight back rather than kept in scores
+        scores = self.__score_pairs(pairs)
+        return [scores[pair] for pair in pairs]
+
+    def prefetch(self, pairs):
+        # kept until clear, which the field operative calls once each round is scored
+        self.scores.update(self.__score_pairs(pairs))
+
+    def __score_pairs(self, pairs):
+        # pairs are grouped by hint so each hint is scored against all of its targets at once
+        by_hint = dict()
+        for hint, target in pairs:
+            by_hint.setdefault(hint, []).append(target)
+        scores = dict()
+        for hint, targets in by_hint.items():
+            for target, score in zip(targets, self.related_to(hint, targets)):
+                scores[(hint, target)] = float(score)
+        return scores
+
+    def clear(self):
+        self.scores.clear()
+
+    def close(self):
+        self.clear()
+
+
+def build_numberbatch(numberbatch_file, out_file, lang="en"):
+    # converts a Numberbatch text release (english only or multilingual) into a KeyedVectors model of one language
+    from gensim.models import KeyedVectors
+
+    prefix = "/c/{0}/".format(lang)
+    opener = gzip.open if numberbatch_file.endswith(".gz") else open
+    words, vectors = [], []
+    start = perf_counter()
+    with opener(numberbatch_file, "rt", encoding="utf-8") as inf:
+        inf.readline()  # header of row count and vector size
+        for line in inf:
+            term, values = line.rstrip().split(" ", 1)
+            if term.startswith("/c/"):
+                if not term.startswith(prefix):
+                    continue
+                term = term[len(prefix):]
+            words.append(term)
+            vectors.append(np.array(values.split(" "), dtype=np.float32))
+
+    word_model = KeyedVectors(len(vectors[0]))
+    word_model.add(words, np.vstack(vectors))
+    word_model.save(out_file)
+    log.info("Saved {0} {1} terms to {2} in {3:.1f}s".format(len(words), lang, out_file, perf_counter() - start))
+    return len(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline Numberbatch model used to score hints")
+    parser.add_argument("numberbatch", help="Numberbatch text release, optionally gzipped")
+    parser.add_argument("--out", default=os.path.join(word_models.MODELS_DIR, NUMBERBATCH_FILE))
+    parser.add_argument("--lang", default="en", help="language of the terms to keep")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/build-log.txt", level=log.INFO)
+    print("Kept {0} terms".format(build_numberbatch(args.numberbatch, args.out, args.lang)))
+
+
+if __name__ == "__main__":
+    main()
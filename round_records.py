@@ -0,0 +1,54 @@
+import json
+
+"""
+Rounds are stored as JSON Lines, one record per round, so files can be appended to and read back a round at a time
+whatever their size. A round record looks like
+    {"teams": {"t": [...], "o": [...], "b": [...], "k": [...]},
+     "levels": {"1": [{"targets": ["grace"], "hint": "prevenient", "score": 0.68}, ...], "2": [...]}}
+with any extra fields (e.g. a seed) alongside, evaluation records add "evaluation" to each hint
+"""
+
+
+def round_record(team_words, overlaps, **extra):
+    record = dict(extra)
+    record["teams"] = {team: list(words) for team, words in team_words.items()}
+    record["levels"] = {str(level): [{"targets": list(hint[0]), "hint": hint[1][0], "score": float(hint[1][1])}
+                                     for hint in overlaps[level]]
+                        for level in sorted(overlaps.keys())}
+    return record
+
+
+def record_hints(record):
+    # a record's hints in the form spymasters return them, {level: [(targets, (hint, score)), ...]}
+    return {int(level): [(hint["targets"], (hint["hint"], hint["score"])) for hint in hints]
+            for level, hints in record["levels"].items()}
+
+
+def read_rounds(in_file):
+    # yields one record at a time, only the current round is ever held in memory
+    with open(in_file, "r", encoding="utf-8") as inf:
+        for line in inf:
+            if line.strip() != "":
+                yield json.loads(line)
+
+
+class RoundWriter:
+    # writes records as they come, flushing each so a reader (or a crash) never sees half a round
+    def __init__(self, out_file, mode="w"):
+        self.out_file = out_file
+        self.outf = open(out_file, mode, encoding="utf-8")
+        self.rounds = 0
+
+    def write(self, record):
+        self.outf.write(json.dumps(record) + "\n")
+        self.outf.flush()
+        self.rounds += 1
+
+    def close(self):
+        self.outf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
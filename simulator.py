@@ -0,0 +1,164 @@
+import argparse
+import json
+import logging as log
+import random as rand
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+import numpy as np
+
+from field_operative import CpuFieldOperative
+from game_rules import GameRules
+from spymaster import SpyMaster
+
+"""
+Plays cpu vs cpu games of codenames without pygame, using the same rules as the game, e.g.
+    python simulator.py 10000 --workers 8 --out logs/self-play.jsonl --blue-weights settings/other_weights.txt
+One JSON line is written per game as it finishes and a summary is printed once all games are done
+"""
+
+
+class HeadlessGame(GameRules):
+    def __init__(self, red_spymaster, blue_spymaster, guesser, game_words, max_turns=50):
+        self.red_spymaster = red_spymaster
+        self.blue_spymaster = blue_spymaster
+        self.guesser = guesser
+        self.game_words = game_words
+        self.max_turns = max_turns  # stops two spymasters that can't find hints playing forever
+
+        self.game_logger = None
+        self.team_words = dict()
+        self.discovered_team_words = dict()
+        self.board = list()
+        self.current_agent = "rs"
+        self.hint = None
+        self.hint_num = 0
+        self.guess = None
+        self.guesses_made = 0
+        self.win_state = {"win": "",
+                          "reason": ""}
+
+    def play(self, seed):
+        start = perf_counter()
+        rng = rand.Random(seed)
+        np_rng = np.random.RandomState(seed)
+        rand.seed(seed)  # spymasters pick target combinations with the random module
+
+        board_words = self.deal_board(list(self.game_words), rng=rng)
+        first = "red" if self.current_agent[0] == "r" else "blue"
+        self.red_spymaster.start_game(board_words)
+        self.blue_spymaster.start_game(board_words)
+
+        spymaster_time = 0.0
+        guesser_time = 0.0
+        hints = []
+        turns = 0
+        while self.win_state["win"] == "" and turns < self.max_turns:
+            team, other = ("red", "blue") if self.current_agent[0] == "r" else ("blue", "red")
+            spymaster = self.red_spymaster if team == "red" else self.blue_spymaster
+
+            turn_start = perf_counter()
+            overlaps = spymaster.run_defined_round(ts=self.team_words[team], os=self.team_words[other],
+                                                   bs=self.team_words["grey"], ks=self.team_words["black"])
+            self.give_hint(*self.choose_hint(overlaps, naive=spymaster.settings["game_hint_naive_method"],
+                                             rng=rng, np_rng=np_rng))
+            spymaster_time += perf_counter() - turn_start
+
+            turn_start = perf_counter()
+            guesses = self.guesser.guess(self.hint, self.hint_num,
+                                         [word for words in self.team_words.values() for word in words], rng=rng)
+            guesser_time += perf_counter() - turn_start
+
+            found = 0
+            for guess in guesses:
+                if self.make_guess(guess):
+                    break
+                if self.current_agent != team[0] + "f":
+                    break  # wrong guess or out of guesses
+                found += 1
+            if self.current_agent == team[0] + "f":
+                self.pass_turn()  # the guesser has nothing more it wants to guess
+            hints.append([team, self.hint, self.hint_num, found])
+            turns += 1
+
+        return {"seed": seed,
+                "winner": self.win_state["win"],
+                "reason": self.win_state["reason"] if self.win_state["win"] != "" else "turn limit",
+                "first": first,
+                "turns": turns,
+                "red_left": len(self.team_words["red"]),
+                "blue_left": len(self.team_words["blue"]),
+                "hints": hints,
+                "seconds": perf_counter() - start,
+                "spymaster_seconds": spymaster_time,
+                "guesser_seconds": guesser_time}
+
+
+_game = None  # one per worker process, so models are loaded once per process rather than once per game
+
+
+def _init_worker(red_settings, red_weights, blue_settings, blue_weights, words_file, guesser_model, max_turns):
+    global _game
+    red_spymaster = SpyMaster(teams_file=red_weights, words_file=words_file, settings_file=red_settings)
+    blue_spymaster = SpyMaster(teams_file=blue_weights, words_file=words_file, settings_file=blue_settings)
+    guesser = CpuFieldOperative(model_name=guesser_model if guesser_model is not None
+                                else red_spymaster.settings["model_name"])
+    # same as the game, only words both spymasters know can go on the board
+    game_words = sorted(set(red_spymaster.game_words) & set(blue_spymaster.game_words))
+    _game = HeadlessGame(red_spymaster, blue_spymaster, guesser, game_words, max_turns=max_turns)
+
+
+def _play(seed):
+    return _game.play(seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play cpu vs cpu games of codenames without a display")
+    parser.add_argument("games", type=int, help="number of games to play")
+    parser.add_argument("--workers", type=int, default=None, help="processes to play games in, default one per cpu")
+    parser.add_argument("--seed", type=int, default=0, help="game n is played with seed + n")
+    parser.add_argument("--red-settings", default="settings/spymaster_setts.txt")
+    parser.add_argument("--red-weights", default="settings/team_weights.txt")
+    parser.add_argument("--blue-settings", default="settings/spymaster_setts.txt")
+    parser.add_argument("--blue-weights", default="settings/team_weights.txt")
+    parser.add_argument("--words", default="settings/game_words.txt")
+    parser.add_argument("--guesser-model", default=None, help="word model of the guesser, default red's model")
+    parser.add_argument("--max-turns", type=int, default=50)
+    parser.add_argument("--out", default="logs/self-play.jsonl", help="file to stream game results to")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(process)d : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/simulator-log.txt", level=log.INFO)
+
+    totals = {"red": 0, "blue": 0, "": 0}
+    assassins = 0
+    first_wins = 0
+    turns = 0
+    start = perf_counter()
+    with open(args.out, "w") as outf, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                initargs=(args.red_settings, args.red_weights, args.blue_settings, args.blue_weights,
+                                          args.words, args.guesser_model, args.max_turns)) as pool:
+        futures = [pool.submit(_play, args.seed + n) for n in range(args.games)]
+        for done, future in enumerate(as_completed(futures)):
+            result = future.result()
+            outf.write(json.dumps(result) + "\n")
+            outf.flush()
+
+            totals[result["winner"]] += 1
+            assassins += result["reason"] == "assassin"
+            first_wins += result["winner"] == result["first"]
+            turns += result["turns"]
+            if (done + 1) % 100 == 0 or done + 1 == args.games:
+                print("{0}/{1} games, {2:.1f} games/s, red {3} - blue {4} (unfinished {5})".format(
+                    done + 1, args.games, (done + 1) / (perf_counter() - start), totals["red"], totals["blue"],
+                    totals[""]))
+
+    print("Red wins: {0:.1%}, blue wins: {1:.1%}, first team wins: {2:.1%}, assassin endings: {3:.1%}, "
+          "mean turns: {4:.1f}".format(totals["red"] / max(args.games, 1), totals["blue"] / max(args.games, 1),
+                                       first_wins / max(args.games, 1), assassins / max(args.games, 1),
+                                       turns / max(args.games, 1)))
+
+
+if __name__ == "__main__":
+    main()
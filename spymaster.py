@@ -1,21 +1,38 @@
 import logging as log  # logging spymaster
 from itertools import combinations, chain, cycle
 from math import sqrt  # adjust search weighting as search scope increases
-from random import shuffle
+import random as rand
+from time import perf_counter, perf_counter_ns
 
-import enchant  # load american english language
-import regex as re
-import spacy  # lemmatisation
-from gensim.models import KeyedVectors  # lading pre-trained word vectors
-from gensim.similarities.index import AnnoyIndexer
-from nltk.stem.lancaster import LancasterStemmer  # stemming
+import numpy as np
 
+import metrics
+import log_setup
+import nn_backends
+import word_models
+from legality import LegalityChecker
+from round_records import RoundWriter, round_record
 from utils import load_settings
 
 
+HINT_FORMAT = "{0[0]}:{0[1]:.5f}"  # a [hint, score] pair in the debug log
+
+
+class HintCancelled(Exception):
+    pass
+
+
+def deal_teams(game_words, team_sizes, rng=rand):
+    # a random board of team_sizes words per team from game_words, the same rng always deals the same board
+    game_words = list(game_words)
+    rng.shuffle(game_words)
+    word_gen = cycle(game_words)
+    return {team: [next(word_gen) for i in range(team_sizes[team])] for team in ["t", "o", "b", "k"]}
+
+
 class SpyMaster:
     def __init__(self, teams_file="settings/team_weights.txt", words_file="settings/game_words.txt",
-                 full_log=None, game_log=None):
+                 full_log=None, game_log=None, settings_file="settings/spymaster_setts.txt"):
         self.full_log = full_log
         self.game_log = game_log
         if self.full_log is not None:
@@ -23,13 +40,18 @@ class SpyMaster:
         if self.game_log is not None:
             self.game_log.info("SpyMaster initialising...")
         # spymaster stuff
-        self.settings = load_settings(sett_file="settings/spymaster_setts.txt",
+        self.settings = load_settings(sett_file=settings_file,
                                       default_dict={"max_top_hints": 10, "max_levels": 2,
-                                                    "model_name": "glove-wiki-100", "use_annoy_indexer": True,
-                                                    "vocab_limit": 0,
+                                                    "model_name": "glove-wiki-100", "nn_backend": "exact",
+                                                    "annoy_trees": 5, "hnsw_m": 16, "hnsw_ef_construction": 200,
+                                                    "hnsw_ef": 100,
+                                                    "model_normalized_only": True, "vector_storage": "float32",
+                                                    "rerank_candidates": 300, "legal_candidates_only": True,
+                                                    "vocab_limit": 0, "search_block_size": 65536,
+                                                    "use_snapshot": True, "models_dir": "",
                                                     "game_hint_naive_method": False})
 
-        self.strategy = load_settings(sett_file="settings/spymaster_setts.txt",
+        self.strategy = load_settings(sett_file=settings_file,
                                       default_dict={"level_{}_limit".format(str(x + 1)): 0
                                                     for x in range(self.settings["max_levels"])})
 
@@ -40,15 +62,26 @@ class SpyMaster:
         self.team_weights = load_settings(sett_file=teams_file,
                                           default_dict={"t": 30, "b": -1, "o": -3, "k": -10})
         self.team_words = dict()  # made as an attribute to save passing back and forth while running rounds
+        self.team_sizes = load_settings(sett_file="settings/team_sizes.txt",  # for random rounds
+                                        default_dict={"t": 8, "o": 8, "k": 1, "b": 8})
+
+        # per game board state, set by start_game
+        self.board_words = list()
+        self.board_index = dict()
+        self.board_vectors = None
+        self.board_sims = None  # vocab x board word similarities
+        self.board_gram = None  # board word x board word similarities
 
         # nlp stuff
+        if self.settings["models_dir"] != "":  # otherwise models/ next to the code
+            word_models.set_models_dir(self.settings["models_dir"])
         self.word_model = self.load_word_model(model_name=self.settings["model_name"],
                                                game_words_file=words_file)  # keyed vector model for generating hints
 
-        self.indexer = self.load_indexer(model_name=self.settings["model_name"])
+        self.nn_backend = self.load_nn_backend(backend_name=self.settings["nn_backend"])
 
-        self.ls = LancasterStemmer()  # stemmer for checking hint legality
-        self.spacy_nlp = spacy.load("en_core_web_sm")  # lemmatiser for checking hint legality
+        # the stemmer, spaCy lemmatiser and dictionary it checks hints with are loaded by the first round
+        self.legality = LegalityChecker()
 
         if self.full_log is not None:
             self.full_log.info("SpyMaster initialised!")
@@ -59,83 +92,38 @@ class SpyMaster:
         if self.full_log is not None:
             self.full_log.info("Loading word model...")
 
-        if model_name == "word2vec-gnews-300":
-            if self.full_log is not None:
-                self.full_log.debug("Loading Google News 300")
-            word_model = KeyedVectors.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440"
-                                           r"\MajorProject\models\word2vec-gnews-300.bin")
-        elif model_name == "glove-twitter-100":
-            if self.full_log is not None:
-                self.full_log.debug("Loading Twitter 100")
-            word_model = KeyedVectors.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440"
-                                           r"\MajorProject\models\glove-twitter-100.bin")
-        elif model_name == "glove-twitter-200":
-            if self.full_log is not None:
-                self.full_log.debug("Loading Twitter 200")
-            word_model = KeyedVectors.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440"
-                                           r"\MajorProject\models\glove-twitter-200.bin")
-        elif model_name == "glove-wiki-300":
-            if self.full_log is not None:
-                self.full_log.debug("Loading Wiki 300")
-            word_model = KeyedVectors.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440"
-                                           r"\MajorProject\models\glove-wiki-300.bin")
-        else:
-            if self.full_log is not None:
-                self.full_log.debug("Loading Wiki 100")
-            word_model = KeyedVectors.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440"
-                                           r"\MajorProject\models\glove-wiki-100.bin")
+        # shared with any other SpyMaster in this process using the same model
+        word_model = word_models.get_word_model(model_name, normalized_only=self.settings["model_normalized_only"],
+                                                storage=self.settings["vector_storage"],
+                                                snapshot=self.settings["use_snapshot"], full_log=self.full_log)
 
         if self.full_log is not None:
             self.full_log.info("Done loading models")
         self.__load_game_words(word_model, words_file=game_words_file)
         return word_model
 
-    def load_indexer(self, model_name):
+    def load_nn_backend(self, backend_name):
         if self.full_log is not None:
-            self.full_log.info("Loading word model indexer...")
+            self.full_log.info("Loading {0} nearest neighbour backend...".format(backend_name))
 
-        indexer = None
+        # exact, annoy or hnsw, see nn_backends
+        backend = nn_backends.get_backend(backend_name, self.word_model, self.settings, full_log=self.full_log)
 
-        if self.settings["use_annoy_indexer"]:
-            if model_name == "glove-twitter-100":
-                if self.full_log is not None:
-                    self.full_log.debug("Loading Twitter 100")
-                indexer = AnnoyIndexer()
-                indexer.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440" +
-                             r"\MajorProject\models\glove-twitter-100-5-trees.ann")
-            elif model_name == "glove-twitter-200":
-                if self.full_log is not None:
-                    self.full_log.debug("Loading Twitter 200")
-                indexer = AnnoyIndexer()
-                indexer.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440" +
-                             r"\MajorProject\models\glove-twitter-200-5-trees.ann")
-            elif model_name == "glove-wiki-300":
-                if self.full_log is not None:
-                    self.full_log.debug("Loading Wiki 300")
-                indexer = AnnoyIndexer()
-                indexer.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440" +
-                             r"\MajorProject\models\glove-wiki-300-5-trees.ann")
-            elif model_name == "glove-wiki-100":
-                if self.full_log is not None:
-                    self.full_log.debug("Loading Wiki 100")
-                indexer = AnnoyIndexer()
-                indexer.load(r"C:\Users\benja\OneDrive\Documents\UniWork\Aberystwyth\Year3\CS39440" +
-                             r"\MajorProject\models\glove-wiki-100-5-trees.ann")
-            if self.full_log is not None:
-                self.full_log.info("Done loading model indexer")
-        else:
-            if self.full_log is not None:
-                self.full_log.warning("No indexer selected, using default")
-
-        return indexer
+        if self.full_log is not None:
+            self.full_log.info("Done loading nearest neighbour backend")
+        return backend
 
     def __load_game_words(self, word_model, words_file="settings/game_words.txt"):
         if self.full_log is not None:
             self.full_log.info("Loading game words...")
         file_words = [w.replace(" ", "_").strip() for w in open(words_file, "r").readlines()]
+        snapshot = getattr(word_model, "snapshot", None)
+        game_words = snapshot.game_words(file_words) if snapshot is not None else None
         try:
-            game_words = [w for w in file_words if w in word_model.vocab]
-            missing = [w for w in file_words if w not in game_words]
+            if game_words is None:
+                game_words = [w for w in file_words if w in word_model.vocab]
+            known = set(game_words)
+            missing = [w for w in file_words if w not in known]
         except AttributeError:
             log.warning("No word model to filter game words by, assuming all are valid")
             game_words = file_words
@@ -154,39 +142,95 @@ class SpyMaster:
             self.game_log.info("Loaded {0} words, {1} missing)".format(len(self.game_words), len(missing)))
             self.game_log.info("Loaded words: {0}".format(", ".join(missing)))
 
-    def run_random_round(self, out_file=None):
+    @metrics.timed("start_game")
+    def start_game(self, board_words):
+        # scores the whole vocabulary against every board word once, each turn after this only has to reweight the
+        # columns of this matrix rather than search the vocabulary again
+        # any other spymaster in this process starting the same board with the same model and search rows (e.g. the
+        # other team's) shares the matrices rather than working them out again
         if self.full_log is not None:
-            self.full_log.info("Running round with random teams...")
-            self.full_log.debug("Shuffling words")
-        if self.game_log is not None:
-            self.game_log.info("Running round with random teams...")
+            self.full_log.info("Scoring vocabulary against board for new game...")
 
-        shuffle(self.game_words)
-        word_gen = cycle(self.game_words)
+        self.board_words = [word for word in board_words if word in self.word_model.vocab]
+        self.board_index = {word: col for col, word in enumerate(self.board_words)}
+        self.board_vectors = word_models.unit_vectors(self.word_model, [self.word_model.vocab[word].index
+                                                                        for word in self.board_words])
+
+        if not self.nn_backend.exact:
+            self.board_sims = None  # only the exact backend can search the board matrix
+            if self.full_log is not None:
+                self.full_log.info("Not an exact backend, turns will search the vocabulary")
+            return
+
+        quantized = getattr(self.word_model, "quantized", None)
+        key = (self.settings["model_name"], quantized.storage if quantized is not None else "float32",
+               self.settings["vocab_limit"], self.nn_backend.rows is not None, tuple(self.board_words))
+        self.board_sims, self.board_gram = word_models.board_matrices(key, self.__score_board)
 
         if self.full_log is not None:
-            self.full_log.debug("Loading team sizes...")
-        team_sizes = load_settings(sett_file="settings/team_sizes.txt",
-                                   default_dict={"t": 8, "o": 8, "k": 1, "b": 8})
+            self.full_log.info("Done scoring board ({0} words)".format(len(self.board_words)))
+
+    def __score_board(self):
+        # the rows the exact backend searches, this is the compact matrix if the model is quantized (any error this
+        # adds is removed by the backend's rerank) and only the legal candidates if they have been built
+        vectors, scales = self.nn_backend.vectors, self.nn_backend.scales
+        board_sims = np.empty((len(vectors), len(self.board_words)), dtype=np.float32)
+        for start in range(0, len(vectors), self.settings["search_block_size"]):
+            board_sims[start:start + self.settings["search_block_size"]] = \
+                np.dot(vectors[start:start + self.settings["search_block_size"]], self.board_vectors.T)
+            if scales is not None:
+                board_sims[start:start + self.settings["search_block_size"]] *= \
+                    scales[start:start + self.settings["search_block_size"], None]
+        board_gram = np.dot(self.board_vectors, self.board_vectors.T)  # needed to normalise reweighted queries
+        return board_sims, board_gram
+
+    def run_random_round(self, out_file=None, rng=rand):
         if self.full_log is not None:
-            self.full_log.debug("Team sizes: {0}".format(" - ".join([k + ":" + str(team_sizes[k]) for
-                                                                     k in ["t", "o", "b", "k"]])))
+            self.full_log.info("Running round with random teams...")
+        if self.game_log is not None:
+            self.game_log.info("Running round with random teams...")
+
+        self.__deal_random_teams(rng)
+        return self.__run_round(out_file=out_file, rng=rng)
 
+    def run_random_rounds(self, num_rounds, out_file, seed=0, report_every=100):
+        # runs num_rounds rounds on random boards, round n dealt with seed + n so any round can be rerun on its own,
+        # each round is written to out_file (a file name or RoundWriter) as soon as it's done
+        writer = out_file if isinstance(out_file, RoundWriter) else RoundWriter(out_file)
+        start = perf_counter()
+        try:
+            for n in range(num_rounds):
+                rng = rand.Random(seed + n)
+                self.__deal_random_teams(rng)
+                # the board is scored once, after which every target combination of the round is a lookup into it
+                self.start_game([word for team in ["t", "o", "b", "k"] for word in self.team_words[team]])
+                self.__run_round(out_file=writer, seed=seed + n, rng=rng)
+                if (n + 1) % report_every == 0 or n + 1 == num_rounds:
+                    elapsed = perf_counter() - start
+                    log.info("{0}/{1} rounds, {2:.2f} rounds/s".format(n + 1, num_rounds, (n + 1) / elapsed))
+                    if self.full_log is not None:
+                        self.full_log.info("{0}/{1} rounds, {2:.2f} rounds/s".format(n + 1, num_rounds,
+                                                                                     (n + 1) / elapsed))
+        finally:
+            if writer is not out_file:
+                writer.close()
+        elapsed = perf_counter() - start
+        return {"rounds": num_rounds, "seconds": elapsed, "rounds_per_second": num_rounds / max(elapsed, 1e-9)}
+
+    def __deal_random_teams(self, rng):
         if self.full_log is not None:
+            self.full_log.debug("Shuffling words")
+            self.full_log.debug("Team sizes: %s", self.team_sizes)
             self.full_log.debug("Generating team words...")
-        self.team_words = {team: [next(word_gen) for i in range(team_sizes[team])] for team in ["t", "o", "b", "k"]}
+        self.team_words = deal_teams(self.game_words, self.team_sizes, rng)
         if self.full_log is not None:
-            self.full_log.info("Team words:\n{0}".format("\n".join([team + ": " + ", ".join(self.team_words[team])
-                                                                    for team in ["t", "o", "b", "k"]])))
+            self.full_log.info("Team words", extra={"data": dict(self.team_words)})
         if self.game_log is not None:
-            self.game_log.info("Randomly generated teams are:\n{0}".format("\n".join([team + ": " +
-                                                                                      ", ".join(self.team_words[team])
-                                                                                      for team in
-                                                                                      ["t", "o", "b", "k"]])))
-
-        return self.__run_round(out_file=out_file)
+            self.game_log.info("Randomly generated teams are", extra={"data": dict(self.team_words)})
 
-    def run_defined_round(self, ts: list, os: list, bs: list, ks: list, out_file=None):
+    def run_defined_round(self, ts: list, os: list, bs: list, ks: list, out_file=None, progress=None, cancel=None):
+        # progress is called as progress(fraction done, stage name) as the round goes on, cancel is a threading.Event
+        # that stops the round (raising HintCancelled) at the next stage once set
         if self.full_log is not None:
             self.full_log.info("Running round with predefined teams...")
         if self.game_log is not None:
@@ -196,73 +240,82 @@ class SpyMaster:
         self.team_words["b"] = [b for b in bs if b in self.word_model.vocab]
         self.team_words["k"] = [k for k in ks if k in self.word_model.vocab]
         if self.full_log is not None:
-            self.full_log.info("Team words:\n{0}".format("\n".join([team + ": " + ", ".join(self.team_words[team])
-                                                                    for team in ["t", "o", "b", "k"]])))
+            self.full_log.info("Team words", extra={"data": dict(self.team_words)})
         if self.game_log is not None:
-            self.game_log.info("Given teams are:\n{0}".format("\n".join([team + ": " + ", ".join(self.team_words[team])
-                                                                         for team in ["t", "o", "b", "k"]])))
-        return self.__run_round(out_file=out_file)
+            self.game_log.info("Given teams are", extra={"data": dict(self.team_words)})
+        return self.__run_round(out_file=out_file, progress=progress, cancel=cancel)
 
-    def __run_round(self, out_file=None):
+    @metrics.timed("round")
+    def __run_round(self, out_file=None, progress=None, cancel=None, seed=None, rng=rand):
         if self.full_log is not None:
             self.full_log.info("Running round")
 
         if self.full_log is not None:
             self.full_log.info("Finding hints for overlap levels")
-        overlaps = dict()
+        targets = dict()
         for i in range(self.settings["max_levels"]):
+            targets[i + 1] = self.__get_targets(i + 1, rng=rng)
+        self.__report(progress, cancel, 0.05, "picked targets")
+
+        # every target combination of every level is searched in one batch
+        hints = self.__get_hints(list(chain.from_iterable(targets.values())), progress=progress, cancel=cancel)
+        self.__report(progress, cancel, 0.95, "filtered")
+
+        overlaps = dict()
+        for level in sorted(targets.keys()):
             if self.full_log is not None:
-                self.full_log.info("Finding hints for {0} word(s)".format(str(i + 1)))
-            overlaps[i + 1] = self.__get_top_hints_multi(i + 1)
+                self.full_log.info("Finding hints for %d word(s)", level)
+            overlaps[level] = self.__get_top_hints_multi(targets[level], hints)
 
+        # the same record is logged and written out, it's never changed after this
+        record = round_record({team: self.team_words[team] for team in ["t", "o", "b", "k"]}, overlaps,
+                              **({"seed": seed} if seed is not None else {}))
         if self.full_log is not None:
             self.full_log.info("Finished making hints")
-            self.full_log.debug("Results:")
-            self.full_log.debug("{0:7} | {1:30} | {2:15} | {3:10}".format("Level", "Words", "Hint", "Score"))
-            for level in sorted(overlaps.keys()):
-                self.full_log.debug("{0:^7} | {1:^30} | {2:^15} | {3:^10}".format("-", "--", "-", "--"))
-                for hint in overlaps[level]:
-                    self.full_log.debug("{0:7} | {1:30} | {2:15} | {3:10}".format(level, ",".join(hint[0]),
-                                                                                  hint[1][0], hint[1][1]))
-
+            self.full_log.debug("Round results", extra={"data": record})
         if self.game_log is not None:
             self.game_log.info("Finished making hints")
-            self.game_log.info("Candidate hints are:")
-            self.game_log.info("{0:10}|{1:30}|{2:10}".format("Hint", "Target", "Score"))
-            for hint in chain.from_iterable([overlaps[level] for level in overlaps.keys()]):
-                self.game_log.info("{0:10}|{1:30}|{2:10}".format(hint[1][0], ", ".join(hint[0]), hint[1][1]))
+            self.game_log.info("Candidate hints are: %s", log_setup.Joined(
+                ", ", chain.from_iterable(record["levels"].values()), "{0[hint]} ({0[score]:.3f}) for {0[targets]}"))
 
         if out_file is not None:
             if self.full_log is not None:
                 self.full_log.info("Output file detected, writing hints")
-            with open(out_file, "w") as outf:
-                outf.write("Teams:\n")
-                for team in ["t", "o", "b", "k"]:
-                    outf.write("{0}: {1}\n".format(team, " - ".join(self.team_words[team])))
-                outf.write("Hints:\n")
-                for level in sorted(overlaps.keys()):
-                    outf.write("Level: {0}\n".format(str(level)))
-                    outf.write("{0:40}{1:20}{2:20}\n".format("Target", "Hint", "Score"))
-                    for hint in overlaps[level]:
-                        outf.write("{0:40}{1:20}{2:20}\n".format(",".join(hint[0]), hint[1][0], hint[1][1]))
+            # out_file is either a RoundWriter or the name of a file to write the round to
+            with metrics.timer("output"):
+                if isinstance(out_file, RoundWriter):
+                    out_file.write(record)
+                else:
+                    with RoundWriter(out_file) as writer:
+                        writer.write(record)
             if self.full_log is not None:
                 self.full_log.info("Done")
+            self.__report(progress, None, 1.0, "done")
             return None
         else:
             if self.full_log is not None:
                 self.full_log.info("No out file given")
+            self.__report(progress, None, 1.0, "done")
             return overlaps
 
-    def __get_top_hints_multi(self, overlap=1):
-        multis = []
+    @staticmethod
+    def __report(progress, cancel, done, stage):
+        if cancel is not None and cancel.is_set():
+            raise HintCancelled("Round cancelled after {0}".format(stage))
+        if progress is not None:
+            progress(done, stage)
 
+    def __get_targets(self, overlap=1, rng=rand):
         combos = [c for c in combinations(self.team_words["t"], overlap)]
-        shuffle(combos)
-        targets = combos[:self.strategy["level_{}_limit".format(str(overlap))]]
+        rng.shuffle(combos)
+        return combos[:self.strategy["level_{}_limit".format(str(overlap))]]
+
+    @metrics.timed("sort")
+    def __get_top_hints_multi(self, targets, hints):
+        multis = []
 
         for multi in targets:
-            hints = self.__get_hints(multi)
-            for hint in hints:
+            for hint in hints[multi]:
                 multis.append((multi, hint))
                 # multis = [ [[target1, ...], [hint1, score1]]
                 #            [[target1, ...], [hint2, score2]]
@@ -270,61 +323,84 @@ class SpyMaster:
                 #            [[target2, ...], [hint4, score4]]
                 #            ... ] Allows hints to be sorted on individual strength
             if self.full_log is not None:
-                self.full_log.debug("Words: {0:20} Hints: {1}".format("|".join(multi),
-                                                                      " // ".join(["{0}-{1}".format(hint[0], hint[1])
-                                                                                   for hint in hints])))
+                self.full_log.debug("Words: %s Hints: %s", log_setup.Joined("|", multi),
+                                    log_setup.Joined(" // ", hints[multi], HINT_FORMAT))
 
         multis = sorted(multis, key=lambda x: x[1][1], reverse=True)
         return multis[0:self.settings["max_top_hints"] if self.settings["max_top_hints"] > 0 else None]
 
-    def __get_hints(self, ts):
-        hints_raw = self.word_model.most_similar(positive=[(t, self.team_weights["t"] / sqrt(len(ts)))
-                                                           for t in ts],
-                                                 negative=[(b, self.team_weights["b"])
-                                                           for b in self.team_words["b"]] +
-                                                          [(o, self.team_weights["o"])
-                                                           for o in self.team_words["o"]] +
-                                                          [(k, self.team_weights["k"])
-                                                           for k in self.team_words["k"]],
-                                                 topn=50, indexer=self.indexer,
-                                                 restrict_vocab=self.settings["vocab_limit"] if
-                                                 self.settings["vocab_limit"] != 0 else None)
-        hints_filtered = [raw for raw in hints_raw if self.__check_legal(raw[0])]
-        if self.full_log is not None:
-            self.full_log.debug("Found {0} legal hints (of {1} searched) for {2}: {3}".format(
-                len(hints_filtered), len(hints_raw), ", ".join(ts),
-                " // ".join(["{0}:{1:.5f}".format(h[0], h[1]) for h in hints_filtered])))
-        if len(hints_filtered) == 0:
-            hints_filtered = [["NO HINT FOUND", -1]]
+    def __get_hints(self, targets, progress=None, cancel=None):
+        # finds hints for many target combinations at once, returns {targets: [[hint, score], ...]}
+        if len(targets) == 0:
+            return dict()
+
+        # the opponent, bystander and assassin words are the same for every combination on this board
+        negatives = [(b, self.team_weights["b"]) for b in self.team_words["b"]] + \
+                    [(o, self.team_weights["o"]) for o in self.team_words["o"]] + \
+                    [(k, self.team_weights["k"]) for k in self.team_words["k"]]
+        # same weighting most_similar would use (the mean is dropped when the query is normalised)
+        weighted = [[(t, self.team_weights["t"] / sqrt(len(ts))) for t in ts] for ts in targets]
+
+        # like most_similar, the words making up each query are never offered as hints for it
+        negative_indices = {self.word_model.vocab[word].index for word, weight in negatives}
+        excluded = [negative_indices | {self.word_model.vocab[t].index for t in ts} for ts in targets]
+
+        search_start = perf_counter_ns()
+        if self.nn_backend.exact and self.board_sims is not None and \
+                all(word in self.board_index for word, weight in chain(negatives, chain.from_iterable(weighted))):
+            # mid game, every query is a weighted sum of board words, so the vocab x board similarities worked out
+            # at the start of the game only need reweighting, words already revealed just get no weight
+            weights = np.zeros((len(targets), len(self.board_words)), dtype=np.float32)
+            for row, positives in enumerate(weighted):
+                for word, weight in chain(negatives, positives):
+                    weights[row, self.board_index[word]] += weight
+            norms = np.sqrt(np.einsum("ij,jk,ik->i", weights, self.board_gram, weights))
+            hints_raw = self.nn_backend.search_matrix(self.board_sims, weights / norms[:, None],
+                                                      np.dot(weights, self.board_vectors) / norms[:, None],
+                                                      excluded, topn=50)
+        else:
+            negative_sum = np.zeros(self.word_model.vector_size, dtype=np.float32)
+            for word, weight in negatives:
+                negative_sum += weight * word_models.unit_vectors(self.word_model, self.word_model.vocab[word].index)
+
+            # one query row per combination
+            queries = np.empty((len(targets), len(negative_sum)), dtype=np.float32)
+            for row, positives in enumerate(weighted):
+                query = negative_sum.copy()
+                for word, weight in positives:
+                    query += weight * word_models.unit_vectors(self.word_model, self.word_model.vocab[word].index)
+                queries[row] = query / np.linalg.norm(query)
+
+            hints_raw = self.nn_backend.search(queries, excluded, topn=50)
+        metrics.record("search", perf_counter_ns() - search_start)
+        metrics.count("search.queries", len(targets))
+
+        self.__report(progress, cancel, 0.6, "searched")
+
+        # every candidate for every combination is checked against the board in one go
+        candidates = list(dict.fromkeys(chain.from_iterable([[h[0] for h in raw] for raw in hints_raw])))
+        legal = dict(zip(candidates, self.__check_legal(candidates)))
+
+        hints = dict()
+        for ts, raw in zip(targets, hints_raw):
+            hints_filtered = [hint for hint in raw if legal[hint[0]]]
             if self.full_log is not None:
-                self.full_log.debug("Illegal Hints (since all were illegal): {0}".format(
-                    " // ".join(["{0}:{1:.5f}".format(h[0], h[1]) for h in hints_raw])))
-        return hints_filtered
-
-    def __check_legal(self, hint):
-        board_words = [x for x in chain.from_iterable(self.team_words.values())]
-
-        board_lemma_stems = [self.ls.stem(token.lemma_) for token in
-                             self.spacy_nlp(" ".join([word for word in board_words]))]
-        hint_lemma_stem = self.ls.stem([token.lemma_ for token in self.spacy_nlp(hint)][0])
-        matches = [hint_lemma_stem == bls for bls in board_lemma_stems]
-        # list of Trues and Falses
-        # True = illegal due to same root
-
-        matches = matches + [re.match(re.escape(".*{}.*".format(hint)), bw) for bw in board_words]
-        # True = board word contained within hint
-
-        matches = matches + [re.match(re.escape(".*{}.*".format(bw)), hint) for bw in board_words]
-        # True = hint contained within board word
-
-        d = enchant.Dict("en_US")
-        matches.append(not d.check(hint))
-        # True = word not in US dictionary (US not UK due to word model using US dict)
-
-        matches.append(re.match(r"[^a-z]", hint))
-        # True = word contains non-alphabetic chars
+                self.full_log.debug("Found %d legal hints (of %d searched) for %s: %s", len(hints_filtered), len(raw),
+                                    log_setup.Joined(", ", ts), log_setup.Joined(" // ", hints_filtered, HINT_FORMAT))
+            if len(hints_filtered) == 0:
+                metrics.count("hints.none_legal")
+                hints_filtered = [["NO HINT FOUND", -1]]
+                if self.full_log is not None:
+                    self.full_log.debug("Illegal Hints (since all were illegal): %s",
+                                        log_setup.Joined(" // ", raw, HINT_FORMAT))
+            hints[ts] = hints_filtered
+        return hints
 
-        return not any(matches)  # If any Trues exist the hint is not legal
+    @metrics.timed("legality")
+    def __check_legal(self, hints):
+        # returns one True/False per hint, True = legal for the current board
+        self.legality.set_board(self.team_words)
+        return self.legality.check_many(hints)
 
     def check_legality(self, team_words, hint_word: str) -> bool:
         if self.full_log is not None:
@@ -339,16 +415,11 @@ class SpyMaster:
                 self.game_log.info("Team {0} - {1}".format(team, ", ".join(team_words[team])))
             self.team_words[team] = team_words.get(team, [])
 
-        return self.__check_legal(hint=hint_word)
+        return self.__check_legal([hint_word])[0]
 
 
 if __name__ == "__main__":
-    sm_full_logger = log.getLogger("spymaster-full")
-    sm_full_logger.setLevel(log.DEBUG)
-    sm_full_logger.propagate = False
-    handler = log.FileHandler("logs/spymaster-log.txt", "a", "utf-8")
-    handler.setFormatter(log.Formatter("%(asctime)s : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S"))
-    sm_full_logger.addHandler(handler)
+    sm_full_logger = log_setup.start_logging("spymaster-full", [log_setup.file_handler("logs/spymaster-log.txt")])
 
     sm = SpyMaster(full_log=sm_full_logger)
     print(sm.run_defined_round(ts=["angel"],
@@ -0,0 +1,127 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from conceptnet_client import ConceptNetClient, RateLimitError
+
+"""
+ConceptNetClient against a local stand-in for the relatedness api, which can be told to fail the first few requests
+for a pair
+"""
+
+
+class _StubApi:
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = []  # (node1, node2) of every request, in the order they came
+        self.failures = dict()  # (node1, node2) -> [status, ...] answered before the real score
+        handler = type("StubHandler", (_StubHandler,), {"api": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{0}".format(self.server.server_port)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self, node1, node2):
+        return sum(1 for pair in self.requests if pair == ("/c/en/" + node1, "/c/en/" + node2))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    api = None
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        pair = (query["node1"][0], query["node2"][0])
+        with self.api.lock:
+            self.api.requests.append(pair)
+            failures = self.api.failures.get(pair, [])
+            status = failures.pop(0) if len(failures) else 200
+        # a made up score that's different for each pair of terms
+        node1, node2 = (node.rsplit("/", 1)[1] for node in pair)
+        body = json.dumps({"value": len(node1) / 100 + len(node2) / 1000}).encode("utf-8")
+        self.send_response(status)
+        if status != 200:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    stub = _StubApi()
+    yield stub
+    stub.close()
+
+
+def make_client(api, **kwargs):
+    settings = dict(requests_per_hour=3600000, burst=100, workers=4, retries=2, backoff=0.01, timeout=5.0)
+    settings.update(kwargs)
+    return ConceptNetClient(base_url=api.url, **settings)
+
+
+def test_identical_and_reversed_pairs_share_a_request(api):
+    client = make_client(api)
+    try:
+        scores = client.relatedness_many([("cat", "dog"), ("dog", "cat"), ("cat", "dog"), ("cat", "mouse")])
+    finally:
+        client.close()
+    assert scores[0] == scores[1] == scores[2] == pytest.approx(0.033)
+    assert scores[3] == pytest.approx(0.035)
+    assert len(api.requests) == 2 and api.count("cat", "dog") == 1 and api.count("cat", "mouse") == 1
+
+
+def test_rate_limited_and_failed_requests_are_retried(api):
+    api.failures[("/c/en/cat", "/c/en/dog")] = [429, 503]
+    client = make_client(api)
+    try:
+        assert client.relatedness("dog", "cat") == pytest.approx(0.033)
+    finally:
+        client.close()
+    assert api.count("cat", "dog") == 3 and client.requests == 3
+
+
+def test_gives_up_after_retries_but_can_try_again(api):
+    api.failures[("/c/en/cat", "/c/en/dog")] = [429, 429, 429]
+    client = make_client(api)
+    try:
+        with pytest.raises(RateLimitError):
+            client.relatedness("cat", "dog")
+        assert client.relatedness("cat", "dog") == pytest.approx(0.033)  # a failed pair isn't remembered
+    finally:
+        client.close()
+    assert api.count("cat", "dog") == 4
+
+
+def test_requests_past_the_burst_wait_for_the_bucket(api):
+    # 20 requests a second after a burst of 2, so 6 requests take at least 4 / 20 seconds
+    client = make_client(api, requests_per_hour=20 * 3600, burst=2)
+    start = monotonic()
+    try:
+        client.relatedness_many([("cat", word) for word in ["ant", "bee", "cow", "dog", "eel", "fox"]])
+    finally:
+        client.close()
+    assert monotonic() - start >= 0.19
+    assert len(api.requests) == 6
+
+
+def test_clear_forgets_finished_pairs(api):
+    client = make_client(api)
+    try:
+        client.relatedness("cat", "dog")
+        client.clear()
+        assert len(client.futures) == 0
+        client.relatedness("cat", "dog")
+    finally:
+        client.close()
+    assert api.count("cat", "dog") == 2
@@ -0,0 +1,179 @@
+import os
+from itertools import combinations
+from math import sqrt
+
+import numpy as np
+import pytest
+
+import word_models
+from spymaster import SpyMaster
+
+"""
+The batched exact search (and the board reweighting it's replaced by mid game) against a brute force search with
+most_similar's semantics, on a small synthetic model standing in for a gensim one
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_NAME = "synthetic-test"
+VOCAB_SIZE = 3000
+VOCAB_LIMIT = 2000
+TEAM_WEIGHTS = {"t": 40, "o": -4, "b": -1, "k": -12}
+TOP_HINTS = 10
+
+
+class _StandInModel:
+    # the parts of gensim's KeyedVectors the spymaster uses
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.vector_size = vectors.shape[1]
+        self.index2word = ["w{0}".format(i) for i in range(len(vectors))]
+        self.vocab = {word: _Vocab(i) for i, word in enumerate(self.index2word)}
+
+    def init_sims(self, replace=False):
+        self.vectors_norm = self.vectors / np.linalg.norm(self.vectors, axis=1)[:, None]
+        if replace:
+            self.vectors = self.vectors_norm
+
+
+class _Vocab:
+    def __init__(self, index):
+        self.index = index
+
+
+class _AllLegal:
+    # the legality checks need spaCy and enchant, every hint passes here so only the search is compared
+    def set_board(self, team_words):
+        pass
+
+    def check_many(self, hints):
+        return [True] * len(hints)
+
+
+def synthetic_vectors(seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((VOCAB_SIZE, 32)) * rng.uniform(0.5, 3, (VOCAB_SIZE, 1))).astype(np.float32)
+
+
+def most_similar(vectors, rows, positive, negative, topn):
+    # most_similar over the given rows, every word weighted, the query words themselves are never returned
+    unit = vectors / np.linalg.norm(vectors, axis=1)[:, None]
+    query = np.zeros(vectors.shape[1], dtype=np.float64)
+    for index, weight in positive + negative:
+        query += weight * unit[index]
+    query /= np.linalg.norm(query)
+    scores = np.dot(unit[rows], query)
+    excluded = {index for index, weight in positive + negative}
+    return [(rows[i], scores[i]) for i in np.argsort(-scores) if rows[i] not in excluded][:topn]
+
+
+def reference_round(vectors, rows, teams, max_levels=2):
+    # the hints a round should give, found one combination at a time with most_similar
+    index = {"w{0}".format(i): i for i in range(VOCAB_SIZE)}
+    negative = [(index[word], TEAM_WEIGHTS[team]) for team in ["b", "o", "k"] for word in teams[team]]
+    overlaps = dict()
+    for level in range(1, max_levels + 1):
+        multis = []
+        for targets in combinations(teams["t"], level):
+            positive = [(index[word], TEAM_WEIGHTS["t"] / sqrt(level)) for word in targets]
+            multis += [(targets, ("w{0}".format(row), score))
+                       for row, score in most_similar(vectors, rows, positive, negative, 50)]
+        overlaps[level] = sorted(multis, key=lambda x: x[1][1], reverse=True)[:TOP_HINTS]
+    return overlaps
+
+
+@pytest.fixture
+def make_spymaster(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_DIR)  # team sizes are read from settings/
+    monkeypatch.setattr(word_models, "MODELS_DIR", str(tmp_path))
+    word_models.clear()
+
+    def make(vectors, storage="float32", vocab_limit=0, candidates=None):
+        model = _StandInModel(vectors.copy())
+        if candidates is not None:
+            np.savez(os.path.join(str(tmp_path), word_models.candidates_file(MODEL_NAME)), indices=candidates,
+                     vocab_hash=word_models.vocab_hash(model))
+        word_models.register_word_model(MODEL_NAME, model, storage=storage)
+
+        settings_file = tmp_path / "spymaster_setts.txt"
+        settings_file.write_text("\n".join([
+            "max_top_hints:int:{0}".format(TOP_HINTS), "max_levels:int:2", "level_1_limit:int:100",
+            "level_2_limit:int:100", "nn_backend:str:exact", "model_name:str:" + MODEL_NAME,
+            "vocab_limit:int:{0}".format(vocab_limit), "search_block_size:int:700", "vector_storage:str:" + storage,
+            "rerank_candidates:int:300", "legal_candidates_only:bool:{0}".format(candidates is not None)]))
+        words_file = tmp_path / "game_words.txt"
+        words_file.write_text("\n".join(model.index2word[:100]))
+        spymaster = SpyMaster(settings_file=str(settings_file), words_file=str(words_file))
+        spymaster.legality = _AllLegal()
+        return spymaster
+
+    yield make
+    word_models.clear()
+
+
+def board(rng):
+    # spread over the whole vocabulary, so some board words are past any vocab_limit
+    words = ["w{0}".format(i) for i in rng.choice(VOCAB_SIZE, 25, replace=False)]
+    return {"t": words[:5], "o": words[5:13], "b": words[13:24], "k": words[24:]}
+
+
+def assert_same_hints(overlaps, expected):
+    assert sorted(overlaps.keys()) == sorted(expected.keys())
+    for level in expected:
+        assert [(tuple(targets), hint[0]) for targets, hint in overlaps[level]] == \
+               [(targets, hint[0]) for targets, hint in expected[level]]
+        np.testing.assert_allclose([hint[1] for targets, hint in overlaps[level]],
+                                   [hint[1] for targets, hint in expected[level]], rtol=1e-5, atol=1e-6)
+
+
+def play(spymaster, teams):
+    return spymaster.run_defined_round(ts=teams["t"], os=teams["o"], bs=teams["b"], ks=teams["k"])
+
+
+@pytest.mark.parametrize("storage", ["float32", "float16", "int8"])
+@pytest.mark.parametrize("vocab_limit", [0, VOCAB_LIMIT])
+@pytest.mark.parametrize("with_candidates", [False, True])
+def test_batched_search_matches_most_similar(make_spymaster, storage, vocab_limit, with_candidates):
+    vectors = synthetic_vectors()
+    rng = np.random.default_rng(1)
+    candidates = np.sort(rng.choice(VOCAB_SIZE, VOCAB_SIZE // 2, replace=False)) if with_candidates else None
+    rows = np.arange(vocab_limit or VOCAB_SIZE)
+    if candidates is not None:
+        rows = candidates[candidates < len(rows)]
+    spymaster = make_spymaster(vectors, storage=storage, vocab_limit=vocab_limit, candidates=candidates)
+
+    teams = board(rng)
+    assert_same_hints(play(spymaster, teams), reference_round(vectors, rows, teams))
+
+
+@pytest.mark.parametrize("storage", ["float32", "float16", "int8"])
+@pytest.mark.parametrize("vocab_limit", [0, VOCAB_LIMIT])
+def test_mid_game_reweighting_matches_most_similar(make_spymaster, storage, vocab_limit):
+    vectors = synthetic_vectors()
+    rows = np.arange(vocab_limit or VOCAB_SIZE)
+    spymaster = make_spymaster(vectors, storage=storage, vocab_limit=vocab_limit)
+
+    rng = np.random.default_rng(2)
+    teams = board(rng)
+    spymaster.start_game([word for team in ["t", "o", "b", "k"] for word in teams[team]])
+    assert spymaster.board_sims is not None
+    assert_same_hints(play(spymaster, teams), reference_round(vectors, rows, teams))
+
+    # a few turns in, revealed words are left out of the query but the board's similarities are reused
+    revealed = {"t": teams["t"][3:], "o": teams["o"][4:], "b": teams["b"][7:], "k": []}
+    teams = {team: words[:len(words) - len(revealed[team])] for team, words in teams.items()}
+    assert_same_hints(play(spymaster, teams), reference_round(vectors, rows, teams))
+
+
+def test_spymasters_share_a_board(make_spymaster):
+    vectors = synthetic_vectors()
+    teams = board(np.random.default_rng(3))
+    board_words = [word for team in ["t", "o", "b", "k"] for word in teams[team]]
+    red, blue = make_spymaster(vectors), make_spymaster(vectors)
+    red.start_game(board_words)
+    blue.start_game(board_words)
+    # the board is scored once and both spymasters reweight the same matrices
+    assert blue.board_sims is red.board_sims and blue.board_gram is red.board_gram
+    assert_same_hints(play(blue, teams), play(red, teams))
+
+    blue.start_game(list(reversed(board_words)))
+    assert blue.board_sims is not red.board_sims
@@ -0,0 +1,155 @@
+import random as rand
+from concurrent.futures import TimeoutError as FutureTimeout
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+
+import pytest
+import requests
+
+import hint_server
+from round_records import read_rounds
+from spymaster import deal_teams
+
+"""
+HintService and HintClient against spymasters standing in for loaded ones, which hold each round until released
+"""
+
+TEAMS = {"t": ["apple", "berlin"], "o": ["cat"], "b": ["dog"], "k": ["egg"]}
+GAME_WORDS = ["apple", "berlin", "cat", "dog", "egg", "fish", "goat", "hat", "ice", "jam"]
+
+
+class _StandInSpymaster:
+    def __init__(self, rounds):
+        self.rounds = rounds  # (ts, ...) of every round run, shared by all the stand ins
+        self.release = rounds.release
+        self.word_model = type("StandInModel", (), {"vocab": set(GAME_WORDS)})
+        self.game_words = list(GAME_WORDS)
+        self.board_words = []
+        self.board_index = dict()
+        self.team_words = dict()
+        self.legality = type("StandInLegality", (), {"load": lambda self: None})()
+
+    def start_game(self, board_words):
+        self.board_words = list(board_words)
+        self.board_index = {word: col for col, word in enumerate(board_words)}
+
+    def run_defined_round(self, ts, os, bs, ks, cancel=None):
+        with self.rounds.lock:
+            self.rounds.append(tuple(ts))
+        # held until released, or until the round is cancelled
+        while not self.release.is_set():
+            if cancel is not None and cancel.is_set():
+                raise hint_server.HintCancelled("Round cancelled")
+            sleep(0.01)
+        self.team_words = {"t": ts, "o": os, "b": bs, "k": ks}
+        return {1: [((ts[0],), ("hint", 0.5))]}
+
+    def check_legality(self, team_words, hint):
+        return hint not in team_words["t"]
+
+
+class _Rounds(list):
+    def __init__(self):
+        super().__init__()
+        self.lock = Lock()
+        self.release = Event()
+
+
+@pytest.fixture
+def rounds(monkeypatch):
+    played = _Rounds()
+    monkeypatch.setattr(hint_server, "SpyMaster", lambda **kwargs: _StandInSpymaster(played))
+    yield played
+    played.release.set()  # lets any worker still holding a round finish
+
+
+def start(service):
+    server = hint_server.serve(service, port=0)
+    Thread(target=server.serve_forever, daemon=True).start()
+    assert service.ready.wait(5)
+    return server, "http://127.0.0.1:{0}".format(server.server_address[1])
+
+
+def wait_for(condition, timeout=5.0):
+    end = monotonic() + timeout
+    while not condition():
+        assert monotonic() < end
+        sleep(0.01)
+
+
+def test_full_queue_turns_requests_away(rounds):
+    service = hint_server.HintService(spymasters=1, queue_size=1, request_timeout=5.0)
+    server, url = start(service)
+    try:
+        first = Thread(target=requests.post, args=(url + "/round",), kwargs={"json": {"teams": TEAMS}}, daemon=True)
+        first.start()
+        wait_for(lambda: service.busy == 1)
+        queued = service.submit("round", TEAMS)  # fills the queue
+
+        response = requests.post(url + "/round", json={"teams": TEAMS})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert service.health()["rejected"] == 1
+
+        rounds.release.set()
+        assert service.result(queued)["teams"]["t"] == TEAMS["t"]
+        first.join(5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_slow_round_times_out_and_is_cancelled(rounds):
+    service = hint_server.HintService(spymasters=1, queue_size=4, request_timeout=0.2)
+    server, url = start(service)
+    try:
+        assert requests.post(url + "/round", json={"teams": TEAMS}).status_code == 504
+
+        job = service.submit("round", TEAMS)
+        with pytest.raises(FutureTimeout):
+            service.result(job)
+        assert job.cancel.is_set()
+        # the spymaster gives up on the round rather than finishing it
+        with pytest.raises(hint_server.HintCancelled):
+            job.future.result(timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cancelled_jobs_are_skipped(rounds):
+    service = hint_server.HintService(spymasters=1, queue_size=4, request_timeout=5.0)
+    service.load()
+    holding = service.submit("round", dict(TEAMS, t=["apple"]))
+    wait_for(lambda: service.busy == 1)
+    skipped = service.submit("round", dict(TEAMS, t=["berlin"]))
+    skipped.cancel.set()  # its client has given up while it waited
+    after = service.submit("round", dict(TEAMS, t=["cat"]))
+
+    rounds.release.set()
+    assert service.result(holding)["levels"]["1"][0]["targets"] == ["apple"]
+    assert service.result(after)["levels"]["1"][0]["targets"] == ["cat"]
+    assert list(rounds) == [("apple",), ("cat",)]
+    assert not skipped.future.done()
+
+
+def test_client_stands_in_for_a_spymaster(rounds, tmp_path):
+    rounds.release.set()
+    service = hint_server.HintService(spymasters=2)
+    server, url = start(service)
+    client = hint_server.HintClient(url)
+    try:
+        assert client.game_words == GAME_WORDS
+        overlaps = client.run_defined_round(ts=TEAMS["t"], os=TEAMS["o"], bs=TEAMS["b"], ks=TEAMS["k"])
+        assert overlaps == {1: [(("apple",), ("hint", 0.5))]}
+        assert not client.check_legality(TEAMS, "apple") and client.check_legality(TEAMS, "fish")
+
+        # random rounds are dealt as a spymaster deals them
+        stats = client.run_random_rounds(3, str(tmp_path / "rounds.jsonl"), seed=7)
+        records = list(read_rounds(str(tmp_path / "rounds.jsonl")))
+        assert stats["rounds"] == 3 and [record["seed"] for record in records] == [7, 8, 9]
+        assert records[1]["teams"] == deal_teams(GAME_WORDS, client.team_sizes, rand.Random(8))
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
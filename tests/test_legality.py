@@ -0,0 +1,121 @@
+import re
+from itertools import chain
+
+from legality import LegalityChecker
+
+"""
+LegalityChecker against the spymaster's original one hint at a time __check_legal, with small stand-ins for spaCy,
+the stemmer and the dictionary
+"""
+
+LEMMAS = {"mice": "mouse", "running": "run", "runner": "run", "rivers": "river", "catfish": "catfish"}
+DICTIONARY = {"mouse", "mice", "running", "runner", "cat", "catfish", "water", "wat", "ice", "river", "rivers", "x-ray",
+              "forest", "3d"}
+
+FIRST_BOARD = {"t": ["mouse", "runner"], "o": ["cat"], "b": ["water"], "k": ["ice"]}
+SECOND_BOARD = {"t": ["river", "runner"], "o": ["forest"], "b": ["water"], "k": ["ice"]}
+HINTS = ["mice", "running", "mouse", "catfish", "wat", "3d", "x-ray", "zzyzx", "river", "rivers", "forest"]
+
+
+class _Token:
+    def __init__(self, word):
+        self.lemma_ = LEMMAS.get(word, word)
+
+
+class _StandInNlp:
+    # lemmatises each space separated word on its own, counting the calls made
+    def __init__(self):
+        self.calls = 0
+        self.piped = []
+
+    def __call__(self, text):
+        self.calls += 1
+        return [_Token(word) for word in text.split(" ")]
+
+    def pipe(self, texts, batch_size=256):
+        for text in texts:
+            self.piped.append(text)
+            yield [_Token(word) for word in text.split(" ")]
+
+
+class _StandInStemmer:
+    def stem(self, word):
+        return word[:-1] if word.endswith("s") else word
+
+
+class _StandInDictionary:
+    def check(self, word):
+        return word in DICTIONARY
+
+
+def make_checker():
+    checker = LegalityChecker(spacy_nlp=_StandInNlp(), stemmer=_StandInStemmer())
+    checker.dictionary = _StandInDictionary()
+    checker.re = re
+    return checker
+
+
+def original_check_legal(team_words, hint):
+    # the spymaster's __check_legal before LegalityChecker, spaCy and enchant swapped for the same stand-ins
+    spacy_nlp, ls, d = _StandInNlp(), _StandInStemmer(), _StandInDictionary()
+    board_words = [x for x in chain.from_iterable(team_words.values())]
+
+    board_lemma_stems = [ls.stem(token.lemma_) for token in spacy_nlp(" ".join([word for word in board_words]))]
+    hint_lemma_stem = ls.stem([token.lemma_ for token in spacy_nlp(hint)][0])
+    matches = [hint_lemma_stem == bls for bls in board_lemma_stems]
+    matches = matches + [re.match(re.escape(".*{}.*".format(hint)), bw) for bw in board_words]
+    matches = matches + [re.match(re.escape(".*{}.*".format(bw)), hint) for bw in board_words]
+    matches.append(not d.check(hint))
+    matches.append(re.match(r"[^a-z]", hint))
+    return not any(matches)
+
+
+def test_same_verdicts_as_the_original_check():
+    checker = make_checker()
+    for board in [FIRST_BOARD, SECOND_BOARD, FIRST_BOARD]:
+        checker.set_board(board)
+        assert checker.check_many(HINTS) == [original_check_legal(board, hint) for hint in HINTS]
+
+
+def test_each_rule():
+    checker = make_checker()
+    checker.set_board(FIRST_BOARD)
+    verdicts = dict(zip(HINTS, checker.check_many(HINTS)))
+    assert not verdicts["mice"]  # same root as mouse
+    assert not verdicts["running"]  # same root as runner
+    assert not verdicts["mouse"]  # a board word itself
+    # containment is checked with the escaped ".*word.*" pattern the original used, which only matches that text
+    # literally, so like before these two are left to the other rules
+    assert verdicts["catfish"] == original_check_legal(FIRST_BOARD, "catfish")  # board word inside the hint
+    assert verdicts["wat"] == original_check_legal(FIRST_BOARD, "wat")  # hint inside a board word
+    assert not verdicts["3d"]  # non alphabetic
+    assert not verdicts["zzyzx"]  # not in the dictionary
+    assert verdicts["river"]
+
+
+def test_board_independent_checks():
+    checker = make_checker()
+    assert checker.board_independent_legal("river")
+    assert not checker.board_independent_legal("3d")
+    assert not checker.board_independent_legal("zzyzx", remember=False)
+    assert "zzyzx" not in checker.in_dictionary and checker.in_dictionary["river"]
+    # a hint is legal exactly when it passes both the board checks and these
+    checker.set_board(FIRST_BOARD)
+    for hint in HINTS:
+        assert not checker.check(hint) or checker.board_independent_legal(hint)
+
+
+def test_board_change_replaces_the_board_memo():
+    checker = make_checker()
+    checker.set_board(FIRST_BOARD)
+    assert checker.check_many(["river", "rivers", "forest"]) == [True, True, True]
+    assert checker.spacy_nlp.piped == ["river", "rivers", "forest"]
+
+    checker.set_board(dict(FIRST_BOARD))  # the same board again isn't lemmatised again
+    assert checker.spacy_nlp.calls == 1
+
+    checker.set_board(SECOND_BOARD)
+    assert checker.spacy_nlp.calls == 2
+    assert checker.check_many(["river", "rivers", "forest", "mice"]) == [False, False, False, True]
+    # hints are only ever lemmatised once, whatever the board
+    assert checker.spacy_nlp.piped == ["river", "rivers", "forest", "mice"]
@@ -0,0 +1,92 @@
+import numpy as np
+
+import nn_backends
+import word_models
+
+"""
+The registry's shared candidate matrix and indexers, with models standing in for loaded ones
+"""
+
+
+class _StandInSnapshot:
+    def __init__(self, candidates, vectors):
+        self.rows = candidates
+        self.vectors = vectors
+
+    def candidates(self):
+        return self.rows
+
+    def candidate_vectors(self, count):
+        return self.vectors[self.rows[:count]]
+
+
+class _StandInModel:
+    def __init__(self, vectors, snapshot):
+        self.vectors = self.vectors_norm = vectors
+        self.quantized = None
+        self.snapshot = snapshot
+
+
+def unit_vectors(count=100, size=8):
+    vectors = np.random.default_rng(0).standard_normal((count, size)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1)[:, None]
+
+
+def test_candidate_matrix_without_snapshot_candidates():
+    # a snapshot built without candidates, the rows come from a candidates .npz instead
+    vectors = unit_vectors()
+    rows = np.arange(0, 100, 3)
+    word_models.clear()
+    try:
+        model = _StandInModel(vectors, _StandInSnapshot(None, vectors))
+        matrix, scales = word_models.candidate_matrix("stand-in", model, rows)
+    finally:
+        word_models.clear()
+    np.testing.assert_array_equal(matrix, vectors[rows])
+    assert scales is None
+
+
+def test_candidate_matrix_with_different_snapshot_candidates():
+    # the snapshot's candidates are fewer than (or not) the rows searched, so they can't be used
+    vectors = unit_vectors()
+    rows = np.arange(0, 100, 3)
+    word_models.clear()
+    try:
+        for candidates in [rows[:5], np.arange(0, 100, 2)]:
+            matrix, scales = word_models.candidate_matrix(
+                "stand-in-{0}".format(len(candidates)), _StandInModel(vectors, _StandInSnapshot(candidates, vectors)),
+                rows)
+            np.testing.assert_array_equal(matrix, vectors[rows])
+    finally:
+        word_models.clear()
+
+
+def test_candidate_matrix_from_snapshot_candidates():
+    vectors = unit_vectors()
+    snapshot_rows = np.arange(0, 100, 3)
+    word_models.clear()
+    try:
+        # below a vocab_limit the rows are a prefix of the snapshot's candidates
+        matrix, scales = word_models.candidate_matrix(
+            "stand-in", _StandInModel(vectors, _StandInSnapshot(snapshot_rows, vectors)), snapshot_rows[:10], limit=30)
+    finally:
+        word_models.clear()
+    np.testing.assert_array_equal(matrix, vectors[snapshot_rows[:10]])
+
+
+def test_missing_annoy_index_falls_back_to_exact(tmp_path, monkeypatch):
+    # an index built with a different number of trees is never opened, the spymaster searches exactly instead
+    monkeypatch.setattr(word_models, "MODELS_DIR", str(tmp_path))
+    (tmp_path / word_models.indexer_file("glove-wiki-100", 100)).write_bytes(b"")
+    vectors = unit_vectors()
+    model = _StandInModel(vectors, None)
+    model.index2word = ["w{0}".format(i) for i in range(len(vectors))]
+    settings = {"model_name": "glove-wiki-100", "annoy_trees": 5, "vocab_limit": 0, "legal_candidates_only": False,
+                "search_block_size": 64}
+    word_models.clear()
+    try:
+        assert word_models.get_indexer("glove-wiki-100", num_trees=5) is None
+        assert word_models.get_indexer("glove-wiki-100", num_trees=100) is None  # its .d file is missing
+        assert isinstance(nn_backends.get_backend("annoy", model, settings), nn_backends.ExactBackend)
+    finally:
+        word_models.clear()
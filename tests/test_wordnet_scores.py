@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from wordnet_graph import WordNetGraph, build_graph
+from wordnet_scores import NO_SCORE, WordNetScorer
+
+"""
+WordNetScorer and WordNetGraph against nltk's own path_similarity, wup_similarity and lch_similarity on a fixed set of
+word pairs, within and across parts of speech, skipped without nltk's WordNet corpus
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+wn = pytest.importorskip("nltk.corpus").wordnet
+try:
+    wn.ensure_loaded()
+except LookupError:
+    pytest.skip("nltk's WordNet corpus isn't installed", allow_module_level=True)
+
+NOUNS = [("dog", "cat"), ("car", "bicycle"), ("apple", "orange"), ("dogs", "cats"), ("water", "ice")]
+VERBS = [("run", "walk"), ("eat", "devour"), ("think", "believe")]
+ADJECTIVES = [("happy", "sad"), ("big", "large"), ("cold", "hot")]
+CROSS_POS = [("apple", "eat"), ("dog", "run"), ("happy", "dog"), ("quickly", "run")]
+NO_SYNSETS = [("zzyzx", "dog"), ("dog", "zzyzx")]
+PAIRS = NOUNS + VERBS + ADJECTIVES + CROSS_POS + NO_SYNSETS
+
+
+def nltk_synset_scores(h, t):
+    # (path, wup, lch) as nltk gives them, lch is None across parts of speech where nltk refuses to compare them
+    lch = h.lch_similarity(t) if h.pos() == t.pos() else None
+    return h.path_similarity(t), h.wup_similarity(t), lch
+
+
+def nltk_word_scores(hint, target):
+    # the best of each over every pair of the words' synsets, as the field operative scored them before
+    best = [-1, -1, -1]
+    for h in wn.synsets(hint):
+        for t in wn.synsets(target):
+            for i, score in enumerate(nltk_synset_scores(h, t)):
+                if score is not None and score > best[i]:
+                    best[i] = score
+    return tuple(NO_SCORE if score == -1 else score for score in best)
+
+
+@pytest.mark.parametrize("hint,target", PAIRS)
+def test_word_scores_match_nltk(hint, target):
+    assert WordNetScorer().word_scores(hint, target) == pytest.approx(nltk_word_scores(hint, target), rel=1e-9)
+
+
+def test_synset_scores_match_nltk():
+    scorer = WordNetScorer()
+    for hint, target in NOUNS + VERBS + ADJECTIVES + CROSS_POS:
+        for h in wn.synsets(hint):
+            for t in wn.synsets(target):
+                expected = list(nltk_synset_scores(h, t))
+                if h.pos() != t.pos():
+                    expected[2] = -1
+                scores = scorer.synset_scores(h, t)
+                assert [score is None for score in scores] == [score is None for score in expected], (h, t)
+                assert [score for score in scores if score is not None] == \
+                       pytest.approx([score for score in expected if score is not None], rel=1e-9), (h, t)
+
+
+def test_scores_follow_the_targets_order():
+    scorer = WordNetScorer()
+    targets = ["cat", "zzyzx", "eat", "orange"]
+    assert scorer.scores("apple", targets) == [scorer.word_scores("apple", target) for target in targets]
+
+
+@pytest.fixture(scope="module")
+def graph(tmp_path_factory):
+    # the repo's compiled graph when it was built from the installed corpus, otherwise one compiled for the tests
+    graph_dir = os.path.join(REPO_DIR, "models", "wordnet-graph")
+    meta = dict()
+    if os.path.exists(os.path.join(graph_dir, "meta.json")):
+        with open(os.path.join(graph_dir, "meta.json"), "r") as meta_file:
+            meta = json.load(meta_file)
+    if meta.get("wordnet_version", None) != wn.get_version():
+        graph_dir = str(tmp_path_factory.mktemp("wordnet-graph"))
+        try:
+            build_graph(graph_dir)
+        except (LookupError, OSError, MemoryError) as e:
+            pytest.skip("couldn't compile the WordNet graph: {0}".format(e))
+    return WordNetGraph(graph_dir)
+
+
+def test_graph_pair_scores_match_nltk(graph):
+    pairs = [(h, t) for hint, target in NOUNS + VERBS + ADJECTIVES + CROSS_POS
+             for h in wn.synsets(hint) for t in wn.synsets(target)]
+    ph = np.searchsorted(graph.names, [h.name() for h, t in pairs]).astype(np.int64)
+    pt = np.searchsorted(graph.names, [t.name() for h, t in pairs]).astype(np.int64)
+    scores = graph.pair_scores(ph, pt)
+    for (h, t), row in zip(pairs, scores):
+        # nan where nltk gives None, lch is -1 across parts of speech
+        expected = [np.nan if score is None else score for score in nltk_synset_scores(h, t)]
+        if h.pos() != t.pos():
+            expected[2] = -1
+        np.testing.assert_allclose(row, expected, rtol=1e-9, err_msg="{0} {1}".format(h, t))
+
+
+@pytest.mark.parametrize("hint,target", PAIRS)
+def test_all_three_scorers_agree(graph, hint, target):
+    expected = nltk_word_scores(hint, target)
+    assert WordNetScorer().word_scores(hint, target) == pytest.approx(expected, rel=1e-9)
+    assert graph.scores(hint, [target])[0] == pytest.approx(expected, rel=1e-9)
+    assert graph.word_scores(hint, target) == pytest.approx(expected, rel=1e-9)
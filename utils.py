@@ -1,14 +1,23 @@
 import logging as log
-from distutils.util import strtobool
+
+
+def strtobool(value: str):
+    # as distutils' strtobool, which is slow to import and gone from newer pythons
+    value = value.strip().lower()
+    if value in ["y", "yes", "t", "true", "on", "1"]:
+        return 1
+    if value in ["n", "no", "f", "false", "off", "0"]:
+        return 0
+    raise ValueError("invalid truth value {0}".format(value))
 
 
 def load_settings(sett_file: str, default_dict: dict):
     # loads settings in the form of <setting name>:<type>:<value> from file
-    # type is any one of str, int, bool
+    # type is any one of str, int, bool, hex, float
     # all types other than these will be interpreted as str
     log.info("Loading settings for {0} from {1}... ".format(", ".join(default_dict.keys()), sett_file))
     lines = [line.strip() for line in open(sett_file).readlines()]
-    splits = [line.split(":") for line in lines]  # reads in a definitions list for settings
+    splits = [line.split(":", 2) for line in lines]  # reads in a definitions list for settings, values may hold ":"
     settings = [key for key in default_dict.keys()]
 
     for split in splits:
@@ -21,6 +30,8 @@ def load_settings(sett_file: str, default_dict: dict):
                 default_dict[split[0]] = strtobool(split[2])
             elif split[1] == "hex":
                 default_dict[split[0]] = int(split[2], 16)
+            elif split[1] == "float":
+                default_dict[split[0]] = float(split[2])
             else:
                 default_dict[split[0]] = split[2]
 
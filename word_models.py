@@ -0,0 +1,332 @@
+import json
+import logging as log
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import sha1
+from threading import Lock
+
+import numpy as np
+
+import metrics
+from model_snapshot import ModelSnapshot
+
+# where models and everything built from them live, models/ next to this file unless the spymaster settings say
+# otherwise (see set_models_dir)
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+# model name -> file in MODELS_DIR, anything not listed falls back to glove-wiki-100
+MODEL_FILES = {"word2vec-gnews-300": "word2vec-gnews-300.bin",
+               "glove-twitter-100": "glove-twitter-100.bin",
+               "glove-twitter-200": "glove-twitter-200.bin",
+               "glove-wiki-300": "glove-wiki-300.bin",
+               "glove-wiki-100": "glove-wiki-100.bin"}
+
+# models that have annoy indexes built for them (see build_indexes.py)
+INDEXED_MODELS = ["glove-twitter-100", "glove-twitter-200", "glove-wiki-300", "glove-wiki-100"]
+
+# process wide registries, every SpyMaster in a process shares the same model and indexer for a given model name
+_word_models = dict()
+_indexers = dict()
+_candidates = dict()
+_candidate_matrices = dict()
+_lock = Lock()
+
+# the most recently scored boards (see board_matrices), under a lock of their own so scoring one doesn't hold up loads
+MAX_SHARED_BOARDS = 4
+_boards = OrderedDict()
+_boards_lock = Lock()
+
+
+def set_models_dir(models_dir):
+    # models already loaded stay registered under their name, so this is set before the first one is loaded
+    global MODELS_DIR
+    MODELS_DIR = models_dir
+
+
+def model_path(model_name):
+    return os.path.join(MODELS_DIR, MODEL_FILES.get(model_name, MODEL_FILES["glove-wiki-100"]))
+
+
+class QuantizedVectors:
+    # L2 normalised vectors stored compactly, either float16 or int8 with a per row scale, the raw float32 vectors
+    # stay memory mapped on disk and only the rows being reranked are ever read from them
+    def __init__(self, raw_vectors, storage="float16", block_size=65536):
+        self.raw = raw_vectors
+        self.storage = storage
+        self.norms = np.empty(len(raw_vectors), dtype=np.float32)
+        self.matrix = np.empty(raw_vectors.shape, dtype=np.float16 if storage == "float16" else np.int8)
+        self.scales = None if storage == "float16" else np.empty(len(raw_vectors), dtype=np.float32)
+
+        for start in range(0, len(raw_vectors), block_size):
+            block = np.asarray(raw_vectors[start:start + block_size], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1)
+            norms[norms == 0] = 1
+            block = block / norms[:, None]
+            self.norms[start:start + len(block)] = norms
+            if self.scales is None:
+                self.matrix[start:start + len(block)] = block.astype(np.float16)
+            else:
+                scales = np.abs(block).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self.matrix[start:start + len(block)] = np.rint(block / scales[:, None]).astype(np.int8)
+                self.scales[start:start + len(block)] = scales
+
+        self.matrix.setflags(write=False)
+
+    def rows(self, indices):
+        # exact float32 unit vectors for the given rows
+        return np.asarray(self.raw[indices], dtype=np.float32) / self.norms[indices, None]
+
+
+def snapshot_file(model_name):
+    return "{0}.snap".format(model_name)
+
+
+def get_word_model(model_name, normalized_only=True, storage="float32", snapshot=True, full_log=None):
+    # normalized_only replaces the raw vectors with their L2 normalised copies so only one matrix is held in memory,
+    # otherwise the raw vectors are kept and the normalised ones are held alongside them (as init_sims() does)
+    # storage float16 or int8 instead keeps a compact normalised copy in memory (word_model.quantized) and leaves the
+    # raw vectors memory mapped, vectors_norm is never built
+    # snapshot loads the model's snapshot (see model_snapshot.py) if it has one, unless the raw vectors are wanted
+    # the first load of a model decides its mode, later callers get the same shared object back
+    with _lock:
+        key = model_name if model_name in MODEL_FILES or model_name in _word_models else "glove-wiki-100"
+        word_model = _word_models.get(key, None)
+        if word_model is not None:
+            if full_log is not None:
+                full_log.debug("Reusing loaded word model {0}".format(key))
+            return word_model
+
+        snapshot_path = os.path.join(MODELS_DIR, snapshot_file(key))
+        if snapshot and normalized_only and os.path.exists(snapshot_path):
+            if full_log is not None:
+                full_log.debug("Loading {0} from snapshot {1} ({2})".format(key, snapshot_path, storage))
+            with metrics.timer("model_load"):
+                word_model = ModelSnapshot(snapshot_path).model()  # already normalised and read only
+                if storage in ["float16", "int8"]:
+                    word_model.quantized = QuantizedVectors(word_model.vectors, storage=storage)
+            _word_models[key] = word_model
+            return word_model
+
+        if full_log is not None:
+            full_log.debug("Loading {0} from {1} ({2})".format(key, model_path(key), storage))
+
+        from gensim.models import KeyedVectors  # gensim is slow to import, only loaded when a model is
+        with metrics.timer("model_load"):
+            if storage in ["float16", "int8"]:
+                word_model = KeyedVectors.load(model_path(key), mmap="r")
+                word_model.quantized = QuantizedVectors(word_model.vectors, storage=storage)
+            else:
+                word_model = KeyedVectors.load(model_path(key))
+                word_model.quantized = None
+                if normalized_only:
+                    word_model.init_sims(replace=True)  # vectors_norm becomes the same array as vectors
+                else:
+                    word_model.init_sims()
+                # the model is shared between SpyMasters, so guard against anything writing into it
+                word_model.vectors.setflags(write=False)
+                word_model.vectors_norm.setflags(write=False)
+
+        _word_models[key] = word_model
+        return word_model
+
+
+def register_word_model(model_name, word_model, normalized_only=True, storage="float32"):
+    # lets an already built model (e.g. a small synthetic one) stand in for a named model
+    with _lock:
+        if storage in ["float16", "int8"]:
+            word_model.quantized = QuantizedVectors(word_model.vectors, storage=storage)
+        else:
+            word_model.quantized = None
+            if normalized_only:
+                word_model.init_sims(replace=True)
+            else:
+                word_model.init_sims()
+            word_model.vectors.setflags(write=False)
+            word_model.vectors_norm.setflags(write=False)
+        _word_models[model_name] = word_model
+
+
+def unit_vectors(word_model, indices):
+    # exact float32 normalised vectors for the given vocab indices, whatever the storage
+    if getattr(word_model, "quantized", None) is not None:
+        return word_model.quantized.rows(indices)
+    return word_model.vectors_norm[indices]
+
+
+def scan_matrix(word_model, limit=0):
+    # the normalised matrix to scan when searching the vocabulary and its per row scales (None if not needed),
+    # this is the compact copy when the model is quantized
+    quantized = getattr(word_model, "quantized", None)
+    limit = limit if limit != 0 else None
+    if quantized is not None:
+        return quantized.matrix[:limit], quantized.scales[:limit] if quantized.scales is not None else None
+    return word_model.vectors_norm[:limit], None
+
+
+@lru_cache(maxsize=None)
+def _annoy_indexer_search_k():
+    # made on first use so gensim and annoy are only imported if an annoy index is
+    from gensim.similarities.index import AnnoyIndexer
+
+    class AnnoyIndexerSearchK(AnnoyIndexer):
+        # gensim's AnnoyIndexer always queries with annoy's default search_k, this one uses whatever it was built with
+        def __init__(self, model=None, num_trees=None, search_k=-1):
+            self.search_k = search_k
+            super().__init__(model, num_trees)
+
+        def most_similar(self, vector, num_neighbors):
+            ids, distances = self.index.get_nns_by_vector(vector, num_neighbors, search_k=self.search_k,
+                                                          include_distances=True)
+            return [(self.labels[ids[i]], 1 - distances[i] / 2) for i in range(len(ids))]
+
+    return AnnoyIndexerSearchK
+
+
+def __getattr__(name):
+    # word_models.AnnoyIndexerSearchK still works as if it were defined here
+    if name == "AnnoyIndexerSearchK":
+        return _annoy_indexer_search_k()
+    raise AttributeError("module {0} has no attribute {1}".format(__name__, name))
+
+
+def indexer_file(model_name, num_trees):
+    return "{0}-{1}-trees.ann".format(model_name, num_trees)
+
+
+def vocab_hash(word_model):
+    if getattr(word_model, "snapshot", None) is not None:
+        return word_model.snapshot.header["vocab_hash"]
+    return sha1("\n".join(word_model.index2word).encode("utf-8")).hexdigest()
+
+
+def get_indexer(model_name, num_trees=5, full_log=None):
+    with _lock:
+        if model_name not in INDEXED_MODELS:
+            if full_log is not None:
+                full_log.warning("No indexer available for {0}".format(model_name))
+            return None
+
+        indexer = _indexers.get((model_name, num_trees), None)
+        if indexer is not None:
+            if full_log is not None:
+                full_log.debug("Reusing loaded indexer for {0}".format(model_name))
+            return indexer
+
+        index_path = os.path.join(MODELS_DIR, indexer_file(model_name, num_trees))
+        if not os.path.exists(index_path) or not os.path.exists(index_path + ".d"):
+            if full_log is not None:
+                full_log.warning("No indexer built for {0} with {1} trees ({2})".format(model_name, num_trees,
+                                                                                        index_path))
+            return None
+        if full_log is not None:
+            full_log.debug("Loading indexer {0}".format(index_path))
+
+        meta = None
+        if os.path.exists(index_path + ".json"):
+            with open(index_path + ".json", "r") as meta_file:
+                meta = json.load(meta_file)
+        elif full_log is not None:
+            full_log.warning("No metadata for {0}, can't check it matches the model".format(index_path))
+
+        word_model = _word_models.get(model_name, None)
+        if meta is not None and word_model is not None and \
+                (meta["vocab_size"] != len(word_model.index2word) or meta["vocab_hash"] != vocab_hash(word_model)):
+            if full_log is not None:
+                full_log.warning("Indexer {0} was built for a different vocabulary than {1}, not using it".format(
+                    index_path, model_name))
+            return None
+
+        with metrics.timer("indexer_load"):
+            indexer = _annoy_indexer_search_k()(search_k=meta["search_k"] if meta is not None else -1)
+            indexer.load(index_path)
+        _indexers[(model_name, num_trees)] = indexer
+        return indexer
+
+
+def candidates_file(model_name):
+    return "{0}-candidates.npz".format(model_name)
+
+
+def get_candidates(model_name, word_model, full_log=None):
+    # sorted vocab indices of the words that pass the board independent legality checks (see build_candidates.py),
+    # None if they haven't been built for this model
+    with _lock:
+        if model_name in _candidates:
+            return _candidates[model_name]
+
+        candidates = None
+        snapshot = getattr(word_model, "snapshot", None)
+        candidates_path = os.path.join(MODELS_DIR, candidates_file(model_name))
+        if snapshot is not None and snapshot.candidates() is not None:
+            candidates = snapshot.candidates()  # mapped straight from the snapshot
+        elif not os.path.exists(candidates_path):
+            if full_log is not None:
+                full_log.warning("No legal candidates built for {0}, searching the whole vocabulary".format(
+                    model_name))
+        else:
+            with metrics.timer("candidates_load"):
+                saved = np.load(candidates_path)
+                indices = saved["indices"]
+            if str(saved["vocab_hash"]) != vocab_hash(word_model):
+                if full_log is not None:
+                    full_log.warning("Legal candidates {0} were built for a different vocabulary than {1}, "
+                                     "searching the whole vocabulary".format(candidates_path, model_name))
+            else:
+                candidates = indices
+                if full_log is not None:
+                    full_log.debug("Loaded {0} legal candidates of {1} words for {2}".format(
+                        len(candidates), len(word_model.index2word), model_name))
+
+        _candidates[model_name] = candidates
+        return candidates
+
+
+def candidate_matrix(model_name, word_model, rows, limit=0):
+    # the scan matrix (and scales) of just the candidate rows, gathered once per process and shared by every backend
+    # searching them, rows are the sorted candidates below limit (see nn_backends.candidate_rows)
+    with _lock:
+        key = (model_name, limit, len(rows))
+        if key not in _candidate_matrices:
+            vectors, scales = scan_matrix(word_model, limit=limit)
+            snapshot = getattr(word_model, "snapshot", None)
+            # the snapshot's own candidates may be missing (built without them, the rows then come from the .npz)
+            snapshot_rows = snapshot.candidates() if snapshot is not None else None
+            matrix = None
+            if snapshot_rows is not None and getattr(word_model, "quantized", None) is None and \
+                    len(snapshot_rows) >= len(rows) and np.array_equal(rows, snapshot_rows[:len(rows)]):
+                matrix = snapshot.candidate_vectors(len(rows))  # mapped straight from the snapshot, nothing copied
+            if matrix is None:
+                matrix = vectors[rows]
+                matrix.setflags(write=False)
+            _candidate_matrices[key] = (matrix, scales[rows] if scales is not None else None)
+        return _candidate_matrices[key]
+
+
+def board_matrices(key, build):
+    # the vocab x board similarities and board gram matrix of a board, worked out once by build() and shared by every
+    # spymaster scoring the same board, key is (model name, storage, vocab_limit, candidates only, board words) so
+    # the rows searched are the same, only the last MAX_SHARED_BOARDS boards are kept
+    with _boards_lock:
+        if key in _boards:
+            _boards.move_to_end(key)
+            return _boards[key]
+        board_sims, board_gram = build()
+        board_sims.setflags(write=False)
+        board_gram.setflags(write=False)
+        _boards[key] = (board_sims, board_gram)
+        while len(_boards) > MAX_SHARED_BOARDS:
+            _boards.popitem(last=False)
+        return _boards[key]
+
+
+def clear():
+    with _lock:
+        _word_models.clear()
+        _indexers.clear()
+        _candidates.clear()
+        _candidate_matrices.clear()
+    with _boards_lock:
+        _boards.clear()
+        log.debug("Cleared word model registry")
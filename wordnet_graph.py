@@ -0,0 +1,240 @@
+import argparse
+import json
+import logging as log
+import os
+from functools import lru_cache
+from time import perf_counter
+
+import numpy as np
+
+from wordnet_scores import NO_SCORE
+
+"""
+WordNet's hypernym hierarchy compiled into flat arrays, so path, Wu-Palmer and Leacock-Chodorow similarity for a hint
+against a whole board are worked out with a few numpy operations instead of walking nltk's synset objects. Build it
+once (needs nltk's wordnet data), e.g.
+    python wordnet_graph.py --out models/wordnet-graph
+Every array is saved as its own .npy file and memory mapped when loaded. Scores are the same as WordNetScorer's
+"""
+
+POS_CODES = {"n": 0, "v": 1, "a": 2, "s": 3, "r": 4}
+INF = np.iinfo(np.int32).max // 4  # no route, small enough that adding two distances can't overflow
+ARRAYS = ["names", "pos", "min_depth", "max_depth", "height", "anc_offsets", "anc_ids", "anc_dist",
+          "lemmas", "lemma_offsets", "lemma_synsets"]
+
+
+def segments(offsets, rows):
+    # (segment number, position) of every entry of the given rows of a CSR style table
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    seg = np.repeat(np.arange(len(rows)), lengths)
+    firsts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    pos = np.arange(lengths.sum()) - np.repeat(firsts, lengths) + np.repeat(starts, lengths)
+    return seg, pos, firsts
+
+
+class WordNetGraph:
+    # same interface as WordNetScorer
+    def __init__(self, graph_dir, pair_cache_size=65536):
+        log.info("Loading WordNet graph from {0}".format(graph_dir))
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(graph_dir, name + ".npy"), mmap_mode="r"))
+        with open(os.path.join(graph_dir, "meta.json"), "r") as meta_file:
+            self.meta = json.load(meta_file)
+        self.root = len(self.names)  # id of the simulated root, which sorts before every real synset
+        self.needs_root = np.asarray(self.pos) != POS_CODES["n"]
+        # lch depth of each part of speech without and with the simulated root
+        self.lch_depth = np.zeros((len(POS_CODES), 2), dtype=np.float64)
+        for pos, depths in self.meta["lch_depths"].items():
+            self.lch_depth[POS_CODES[pos]] = depths
+        self.pair_cache_size = pair_cache_size
+        self.memo = dict()
+        self.synsets = lru_cache(maxsize=None)(self.__synsets)
+
+    def __synsets(self, word):
+        key = word.lower()
+        i = np.searchsorted(self.lemmas, key)
+        if i < len(self.lemmas) and self.lemmas[i] == key:
+            return np.asarray(self.lemma_synsets[self.lemma_offsets[i]:self.lemma_offsets[i + 1]])
+        # not a lemma (e.g. a plural), nltk's morphy finds its base form
+        from nltk.corpus import wordnet as wn
+        names = [s.name() for s in wn.synsets(word)]
+        return np.searchsorted(self.names, names).astype(np.int64)
+
+    def word_scores(self, hint: str, target: str):
+        scores = self.memo.get((hint, target), None)
+        if scores is None:
+            scores = self.scores(hint, [target])[0]
+        return scores
+
+    def scores(self, hint: str, targets: list):
+        # (path, wup, lch) of the hint against every target, in the order of targets
+        h_ids = self.synsets(hint)
+        t_lists = [self.synsets(target) for target in targets]
+        best = np.full((len(targets), 3), -1.0)
+        if len(h_ids) > 0 and sum(len(ids) for ids in t_lists) > 0:
+            t_ids = np.concatenate(t_lists).astype(np.int64)
+            t_words = np.repeat(np.arange(len(targets)), [len(ids) for ids in t_lists])
+            # every (hint synset, target synset) pair
+            ph = np.repeat(np.asarray(h_ids, dtype=np.int64), len(t_ids))
+            pt = np.tile(t_ids, len(h_ids))
+            scores = self.pair_scores(ph, pt)
+            np.maximum.at(best, np.tile(t_words, len(h_ids)), np.where(np.isnan(scores), -1, scores))
+
+        results = [tuple(NO_SCORE if score == -1 else float(score) for score in row) for row in best]
+        if len(self.memo) + len(targets) > self.pair_cache_size:
+            self.memo.clear()
+        self.memo.update({(hint, target): result for target, result in zip(targets, results)})
+        return results
+
+    def pair_scores(self, ph, pt):
+        # (path, wup, lch) for arrays of synset id pairs, nan where there's no score, lch is -1 across parts of speech
+        synsets = np.unique(np.concatenate([ph, pt]))
+        hi = np.searchsorted(synsets, ph)
+        ti = np.searchsorted(synsets, pt)
+
+        # shortest hypernym distances of each synset involved, over only the ancestors any of them share
+        seg, pos, _ = segments(self.anc_offsets, synsets)
+        universe, columns = np.unique(np.asarray(self.anc_ids)[pos], return_inverse=True)
+        dist = np.full((len(synsets), len(universe)), INF, dtype=np.int64)
+        dist[seg, columns] = np.asarray(self.anc_dist)[pos]
+
+        root = self.needs_root[ph] | self.needs_root[pt]
+        height = np.asarray(self.height, dtype=np.int64)
+        root_route = np.where(root, height[ph] + height[pt] + 2, INF)
+
+        # every ancestor of the target side of each pair, with its distance from the hint side where it's shared
+        pair, pos, firsts = segments(self.anc_offsets, pt)
+        anc = np.asarray(self.anc_ids)[pos].astype(np.int64)
+        h_dist = dist[hi[pair], np.searchsorted(universe, anc)]
+        common = h_dist < INF
+        distance = np.minimum.reduceat(np.where(common, h_dist + np.asarray(self.anc_dist)[pos], INF), firsts)
+        distance = np.minimum(distance, root_route)
+        found = distance < INF
+
+        path = np.where(found, 1.0 / (distance + 1), np.nan)
+
+        depth = self.lch_depth[self.pos[ph], root.astype(np.int64)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lch = np.where(found & (depth > 0), -np.log((distance + 1) / (2.0 * depth)), np.nan)
+        lch = np.where(np.asarray(self.pos)[ph] == np.asarray(self.pos)[pt], lch, -1)
+
+        # lowest common subsumer, the shared ancestor with the greatest min depth, ties to the first by name
+        n = self.root + 1
+        min_depth = np.asarray(self.min_depth, dtype=np.int64)
+        key = np.maximum.reduceat(np.where(common, min_depth[anc] * n + (n - 1 - anc), -1), firsts)
+        subsumer = np.where(key >= 0, n - 1 - key % n, -1)
+        sub_depth = np.where(key >= 0, key // n, -1)
+        # the simulated root has min depth 0 and comes first by name, so it wins any tie at 0
+        subsumer = np.where(root & (sub_depth <= 0), self.root, subsumer)
+        # unless the hint synset itself is one of the subsumers
+        h_is_common = dist[ti, np.searchsorted(universe, ph)] < INF
+        h_wins = h_is_common & (min_depth[ph] == np.maximum(sub_depth, 0))
+        subsumer = np.where(h_wins, ph, subsumer)
+
+        wup = np.full(len(ph), np.nan)
+        real = (subsumer >= 0) & (subsumer != self.root)
+        at_root = subsumer == self.root
+        h_len = np.zeros(len(ph), dtype=np.int64)
+        t_len = np.zeros(len(ph), dtype=np.int64)
+        if real.any():
+            # shortest route from each side down to its subsumer, through any ancestor of the subsumer
+            subs = subsumer[real]
+            pair, pos, firsts = segments(self.anc_offsets, subs)
+            columns = np.searchsorted(universe, np.asarray(self.anc_ids)[pos])
+            s_dist = np.asarray(self.anc_dist)[pos]
+            sub_height = height[subs] + 1
+            for side, lengths in ((hi[real], h_len), (ti[real], t_len)):
+                routes = np.minimum.reduceat(dist[side[pair], columns] + s_dist, firsts)
+                side_height = height[synsets[side]] + 1
+                lengths[real] = np.where(root[real], np.minimum(routes, side_height + sub_height), routes)
+        h_len[at_root] = height[ph[at_root]] + 1
+        t_len[at_root] = height[pt[at_root]] + 1
+        scored = real | at_root
+        sub_max_depth = np.where(at_root, 0, np.asarray(self.max_depth, dtype=np.int64)[np.minimum(subsumer,
+                                                                                                   self.root - 1)])
+        depth = sub_max_depth + 1
+        wup[scored] = (2.0 * depth[scored]) / (h_len[scored] + t_len[scored] + 2 * depth[scored])
+
+        return np.stack([path, wup, lch], axis=1)
+
+
+def build_graph(out_dir):
+    from nltk.corpus import wordnet as wn
+
+    start = perf_counter()
+    synsets = sorted(wn.all_synsets(), key=lambda s: s.name())
+    names = [s.name() for s in synsets]
+    ids = {name: i for i, name in enumerate(names)}
+    log.info("Compiling {0} synsets".format(len(synsets)))
+
+    # every synset's ancestors (itself included) by their shortest hypernym distance, sorted by id
+    offsets = [0]
+    anc_ids, anc_dist, height = [], [], []
+    for synset in synsets:
+        ancestors = dict()
+        frontier = [synset]
+        distance = 0
+        while frontier:
+            frontier = [s for s in frontier if s.name() not in ancestors]
+            for s in frontier:
+                ancestors[s.name()] = distance
+            frontier = [h for s in frontier for h in s.hypernyms() + s.instance_hypernyms()]
+            distance += 1
+        row = sorted((ids[name], d) for name, d in ancestors.items())
+        anc_ids.extend(i for i, d in row)
+        anc_dist.extend(d for i, d in row)
+        height.append(max(ancestors.values()))
+        offsets.append(len(anc_ids))
+
+    # lemma -> its synsets in the order wn.synsets gives them
+    lemmas = sorted(set(name.lower() for name in wn.all_lemma_names()))
+    lemma_offsets = [0]
+    lemma_synsets = []
+    for lemma in lemmas:
+        lemma_synsets.extend(ids[s.name()] for s in wn.synsets(lemma))
+        lemma_offsets.append(len(lemma_synsets))
+
+    max_depths = {pos: max([s.max_depth() for s in synsets if s.pos() == pos], default=0) for pos in POS_CODES}
+    arrays = {"names": np.array(names),
+              "pos": np.array([POS_CODES[s.pos()] for s in synsets], dtype=np.int8),
+              "min_depth": np.array([s.min_depth() for s in synsets], dtype=np.int16),
+              "max_depth": np.array([s.max_depth() for s in synsets], dtype=np.int16),
+              "height": np.array(height, dtype=np.int16),
+              "anc_offsets": np.array(offsets, dtype=np.int64),
+              "anc_ids": np.array(anc_ids, dtype=np.int32),
+              "anc_dist": np.array(anc_dist, dtype=np.int16),
+              "lemmas": np.array(lemmas),
+              "lemma_offsets": np.array(lemma_offsets, dtype=np.int64),
+              "lemma_synsets": np.array(lemma_synsets, dtype=np.int32)}
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, name + ".npy"), array)
+    meta = {"wordnet_version": wn.get_version(),
+            "synsets": len(synsets),
+            "lemmas": len(lemmas),
+            "ancestor_entries": len(anc_ids),
+            # as nltk's lch_similarity, the simulated root adds one to the depth
+            "lch_depths": {pos: [depth, depth + 1] for pos, depth in max_depths.items()},
+            "build_seconds": perf_counter() - start}
+    with open(os.path.join(out_dir, "meta.json"), "w") as meta_file:
+        json.dump(meta, meta_file, indent=2)
+    log.info("Saved WordNet graph to {0}: {1}".format(out_dir, meta))
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile WordNet's hypernym hierarchy for the field operative")
+    parser.add_argument("--out", default="models/wordnet-graph", help="directory to write the graph arrays to")
+    args = parser.parse_args()
+
+    log.basicConfig(format="%(asctime)s : %(levelname)s : %(message)s", datefmt="%d/%m - %H:%M:%S",
+                    filename="logs/build-log.txt", level=log.INFO)
+    meta = build_graph(args.out)
+    print("Compiled {0} synsets and {1} lemmas in {2:.1f}s".format(meta["synsets"], meta["lemmas"],
+                                                                   meta["build_seconds"]))
+
+
+if __name__ == "__main__":
+    main()
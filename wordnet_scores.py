@@ -0,0 +1,127 @@
+import math
+from collections import deque
+from functools import lru_cache
+
+"""
+Path, Wu-Palmer and Leacock-Chodorow similarity between words, worked out together from one walk of each synset's
+hypernyms. Gives the same scores as nltk's path_similarity, wup_similarity and lch_similarity (with their default
+simulated root for verbs and adjectives), taking the best over every pair of synsets of the two words
+"""
+
+ROOT = "*ROOT*"  # stands in for the simulated root that joins the separate verb (and adjective) hierarchies
+NO_SCORE = -9.999  # score of words with no comparable synsets
+METRICS = ("path", "wup", "lch")
+NOUN = "n"  # nltk's wn.NOUN
+
+
+class WordNetScorer:
+    def __init__(self, pair_cache_size=65536):
+        self.ancestors = dict()  # synset -> {ancestor (including itself): shortest hypernym distance}
+        self.max_depths = dict()  # (pos, simulate root) -> deepest synset of that part of speech, for lch
+        self.synsets = lru_cache(maxsize=None)(self.__synsets)
+        self.word_scores = lru_cache(maxsize=pair_cache_size)(self.__word_scores)
+
+    def scores(self, hint: str, targets: list):
+        # (path, wup, lch) of the hint against every target, in the order of targets
+        return [self.word_scores(hint, target) for target in targets]
+
+    def __word_scores(self, hint, target):
+        best = [-1, -1, -1]
+        for h in self.synsets(hint):
+            for t in self.synsets(target):
+                for i, score in enumerate(self.synset_scores(h, t)):
+                    if score is not None and score > best[i]:
+                        best[i] = score
+        return tuple(NO_SCORE if score == -1 else score for score in best)
+
+    def synset_scores(self, h, t):
+        # (path, wup, lch) of two synsets, None where nltk would give None, lch is -1 across parts of speech
+        # since nltk refuses to compare them
+        root = self.__needs_root(h) or self.__needs_root(t)
+        h_ancestors = self.__ancestors(h, root)
+        t_ancestors = self.__ancestors(t, root)
+        common = h_ancestors.keys() & t_ancestors.keys()
+
+        distance = 0 if h == t else self.__distance(h_ancestors, t_ancestors, common)
+        path = None if distance is None else 1.0 / (distance + 1)
+
+        if h.pos() != t.pos():
+            lch = -1
+        else:
+            depth = self.__max_depth(h.pos(), root)
+            lch = None if distance is None or depth == 0 else -math.log((distance + 1) / (2.0 * depth))
+
+        return path, self.__wup(h, t, h_ancestors, t_ancestors, common, root), lch
+
+    def __wup(self, h, t, h_ancestors, t_ancestors, common, root):
+        # the lowest common subsumer is the common ancestor furthest from the top by its shortest route,
+        # ties go to h itself then to the first by name (the simulated root sorts first)
+        if len(common) == 0:
+            return None
+        lowest = max(self.__min_depth(s) for s in common)
+        subsumers = sorted([s for s in common if self.__min_depth(s) == lowest], key=self.__name)
+        subsumer = h if h in subsumers else subsumers[0]
+
+        depth = (0 if subsumer == ROOT else subsumer.max_depth()) + 1
+        s_ancestors = self.__ancestors(subsumer, root)
+        h_len = self.__path_to(h, h_ancestors, subsumer, s_ancestors)
+        t_len = self.__path_to(t, t_ancestors, subsumer, s_ancestors)
+        if h_len is None or t_len is None:
+            return None
+        return (2.0 * depth) / (h_len + t_len + 2 * depth)
+
+    def __path_to(self, synset, ancestors, subsumer, s_ancestors):
+        if synset == subsumer:
+            return 0
+        return self.__distance(ancestors, s_ancestors, ancestors.keys() & s_ancestors.keys())
+
+    @staticmethod
+    def __distance(a_ancestors, b_ancestors, common):
+        # shortest route between two synsets through any shared ancestor
+        if len(common) == 0:
+            return None
+        return min(a_ancestors[s] + b_ancestors[s] for s in common)
+
+    def __ancestors(self, synset, root):
+        if synset == ROOT:
+            return {ROOT: 0}
+        ancestors = self.ancestors.get(synset, None)
+        if ancestors is None:
+            # breadth first, so the first time an ancestor is reached is by its shortest route
+            ancestors = dict()
+            queue = deque([(synset, 0)])
+            while queue:
+                s, distance = queue.popleft()
+                if s in ancestors:
+                    continue
+                ancestors[s] = distance
+                queue.extend((hypernym, distance + 1) for hypernym in s.hypernyms() + s.instance_hypernyms())
+            self.ancestors[synset] = ancestors
+        if root:
+            ancestors = dict(ancestors)
+            ancestors[ROOT] = max(ancestors.values()) + 1
+        return ancestors
+
+    @staticmethod
+    def __synsets(word):
+        from nltk.corpus import wordnet as wn  # nltk and its corpus are slow to load, so only once there's a word
+        return wn.synsets(word)
+
+    def __max_depth(self, pos, root):
+        if (pos, root) not in self.max_depths:
+            from nltk.corpus import wordnet as wn
+            depth = max([s.max_depth() for s in wn.all_synsets(pos)], default=0)
+            self.max_depths[(pos, root)] = depth + 1 if root else depth
+        return self.max_depths[(pos, root)]
+
+    @staticmethod
+    def __needs_root(synset):
+        return synset == ROOT or synset.pos() != NOUN
+
+    @staticmethod
+    def __min_depth(synset):
+        return 0 if synset == ROOT else synset.min_depth()
+
+    @staticmethod
+    def __name(synset):
+        return ROOT if synset == ROOT else synset.name()